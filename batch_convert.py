@@ -0,0 +1,324 @@
+# TestLink XML/CSV をまとめて変換するコマンドラインツール (tkinter 不要)
+# 使い方: python batch_convert.py exports/ "nightly/*.xml" extra.csv --workers 8
+import argparse
+import contextlib
+import glob
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import column_schema
+import conversion_cache
+import xml_processor
+import csv_processor
+import encoding_io
+import instrumentation
+import result_cache
+
+# CSV→XML変換の出力ファイル名の接尾辞 (GUIと同じ)
+CONVERTED_XML_SUFFIX = "_converted.xml"
+# CSV→XML変換を分割出力したファイル名 (<名前>_converted_001.xml など)
+CONVERTED_SHARD_PATTERN = re.compile(r"_converted_\d{3,}\.xml$")
+
+# XML→変換の出力形式と拡張子
+XML_OUTPUT_EXTENSIONS = {"csv": ".csv", "sqlite": ".sqlite"}
+
+def output_path_for(input_file, output_dir=None, xml_output="csv"):
+    """入力ファイルに対応する出力ファイルのパスを返す (GUIと同じ命名規則)"""
+    base, ext = os.path.splitext(input_file)
+    if ext.lower() == ".xml":
+        output_file = base + XML_OUTPUT_EXTENSIONS[xml_output]
+    else:
+        output_file = base + CONVERTED_XML_SUFFIX
+    if output_dir:
+        output_file = os.path.join(output_dir, os.path.basename(output_file))
+    return output_file
+
+def collect_input_files(patterns, file_type="all", recursive=False):
+    """ファイル・グロブ・ディレクトリの指定から変換対象のファイル一覧を作る"""
+    extensions = {"xml": (".xml",), "csv": (".csv",), "all": (".xml", ".csv")}[file_type]
+    files = []
+    seen = set()
+
+    def add(path):
+        path = os.path.normpath(path)
+        if path not in seen:
+            seen.add(path)
+            files.append(path)
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            walker = os.walk(pattern) if recursive else [(pattern, [], os.listdir(pattern))]
+            for dirpath, _, filenames in walker:
+                for filename in sorted(filenames):
+                    # 以前の CSV→XML 変換の出力は対象外
+                    lower_name = filename.lower()
+                    if lower_name.endswith(CONVERTED_XML_SUFFIX) or CONVERTED_SHARD_PATTERN.search(lower_name):
+                        continue
+                    if filename.lower().endswith(extensions):
+                        add(os.path.join(dirpath, filename))
+        elif os.path.isfile(pattern):
+            add(pattern)
+        else:
+            for path in sorted(glob.glob(pattern, recursive=recursive)):
+                if os.path.isfile(path) and path.lower().endswith(extensions):
+                    add(path)
+    return files
+
+def convert_file(input_file, output_file, file_workers=1, batch_size=xml_processor.DEFAULT_BATCH_SIZE,
+                 report_dir=None, profile_stages=(), schema_file=None, discover_custom_fields=None,
+                 step_rows=None, cache_dir=None, cache_max_bytes=result_cache.DEFAULT_MAX_BYTES,
+                 shard_bytes=None, shard_cases=None, encoding=None, input_encoding=None, xml_output="csv",
+                 conversion_cache_bytes=None, use_conversion_cache=True):
+    """1ファイルを変換し、(成否, 所要秒数, エラーメッセージ, 変換キャッシュの統計) を返す (ワーカープロセスで実行)
+
+    file_workers が1より大きい場合、XML→CSV変換のHTML整形を1ファイル内で並列化する。
+    report_dir を指定すると段階ごとの計測結果を <入力ファイル名>.report.json として書き込む。
+    schema_file を指定するとXML→CSV変換の列をその列定義ファイルから決める。
+    discover_custom_fields が真の場合は列定義にないカスタムフィールドも出力する (None なら列定義に従う)。
+    step_rows が真の場合はステップごとに1行を出力する (None なら列定義に従う)。
+    cache_dir を指定すると変換結果をテストケース単位で保存し、次回以降は変更のあったものだけを変換する。
+    shard_bytes / shard_cases を指定するとCSV→XML変換の出力を上限ごとに複数のファイルに分ける。
+    encoding はXML→CSV変換で書き込むCSVの文字コード、input_encoding はCSV→XML変換で読むCSVの文字コード
+    (省略するとファイルの先頭から判定する)。
+    xml_output が "sqlite" の場合、XMLはCSVの代わりにSQLiteデータベースに変換する (列定義とキャッシュは使わない)。
+    conversion_cache_bytes は clean_html / text_to_html の結果を共有する変換キャッシュ (conversion_cache) のメモリ上限
+    (None なら変更しない)、use_conversion_cache が偽の場合はこのファイルの変換で変換キャッシュを使わない。
+    変換キャッシュの統計はこのファイルの変換の間のヒット数・ミス数・破棄数で、report_dir のレポートにも書き込む。
+    """
+    start = time.perf_counter()
+    partial_output = _writes_partial_output(input_file, xml_output)
+    output_before = _file_signature(output_file) if partial_output else None
+    if conversion_cache_bytes is not None:
+        conversion_cache.configure(max_bytes=conversion_cache_bytes)
+    cache_before = conversion_cache.stats()
+
+    def cache_stats():
+        stats = conversion_cache_stats(cache_before)
+        stats["enabled"] = stats["enabled"] and use_conversion_cache
+        return stats
+
+    try:
+        with contextlib.ExitStack() as stack:
+            if not use_conversion_cache:
+                stack.enter_context(conversion_cache.disabled())
+            if report_dir:
+                report_file = os.path.join(report_dir, os.path.basename(input_file) + ".report.json")
+                stack.enter_context(instrumentation.session(
+                    report_file, profile_stages=profile_stages,
+                    extra=lambda: {"conversion_cache": cache_stats()}))
+            _convert(input_file, output_file, file_workers, batch_size, schema_file, discover_custom_fields,
+                     step_rows, cache_dir, cache_max_bytes, shard_bytes, shard_cases, encoding, input_encoding,
+                     xml_output)
+        return True, time.perf_counter() - start, "", cache_stats()
+    except Exception as e:
+        # 途中まで書き込まれた出力ファイルは残さない (この実行で書き込みを始めていない以前の出力は消さない)
+        if partial_output and _file_signature(output_file) not in (None, output_before):
+            os.remove(output_file)
+        # 変換関数のメッセージには詳細なトレースバックが含まれるため1行目だけを使う
+        message = str(e).splitlines()[0] if str(e) else traceback.format_exc().splitlines()[-1]
+        return False, time.perf_counter() - start, message, cache_stats()
+
+def conversion_cache_stats(before):
+    """変換キャッシュの統計のうち、before (conversion_cache.stats() の値) 以降の増分を返す
+
+    ワーカープロセスは複数のファイルを続けて変換し、キャッシュもファイルをまたいで再利用するため、
+    ヒット数・ミス数・破棄数はこのファイルの分だけにする (件数・バイト数・上限は現在の値)。
+    """
+    stats = conversion_cache.stats()
+    for name in ("hits", "misses", "evictions"):
+        stats[name] -= before[name]
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+def _writes_partial_output(input_file, xml_output):
+    """変換に失敗すると出力ファイルが書きかけのまま残るか
+
+    XML→CSV変換は出力ファイルに直接書き込む。CSV→XML変換 (一時ファイルから置き換え、分割出力) と
+    SQLiteへの変換は失敗時に書き込み側で自分の作ったファイルを片付ける。
+    """
+    return input_file.lower().endswith(".xml") and xml_output != "sqlite"
+
+def _file_signature(path):
+    """ファイルが書き換えられたかの判定に使う (inode, サイズ, 更新時刻) を返す (ファイルがなければ None)"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+def _convert(input_file, output_file, file_workers, batch_size, schema_file, discover_custom_fields, step_rows,
+             cache_dir=None, cache_max_bytes=result_cache.DEFAULT_MAX_BYTES, shard_bytes=None, shard_cases=None,
+             encoding=None, input_encoding=None, xml_output="csv"):
+    """入力ファイルの種類に応じた変換を行う"""
+    if xml_output == "sqlite" and input_file.lower().endswith(".xml"):
+        xml_processor.convert_xml_file_to_sqlite(input_file, output_file)
+        return
+    cache = result_cache.ResultCache(cache_dir, cache_max_bytes) if cache_dir else None
+    try:
+        if input_file.lower().endswith(".xml"):
+            plan = column_schema.load_plan(schema_file) if schema_file else None
+            xml_processor.convert_xml_file_to_csv(input_file, output_file, file_workers, batch_size, plan=plan,
+                                                  discover_custom_fields=discover_custom_fields, step_rows=step_rows,
+                                                  cache=cache, encoding=encoding)
+        else:
+            csv_processor.stream_csv_to_xml(input_file, output_file, cache=cache, shard_bytes=shard_bytes,
+                                            shard_cases=shard_cases, input_encoding=input_encoding)
+    finally:
+        if cache is not None:
+            cache.close()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"キャッシュ: {input_file} ヒット {stats['hits']} 件, 変換 {stats['misses']} 件"
+              f" (ヒット率 {stats['hit_rate']:.0%}, 破棄 {stats['evicted']} 件)", flush=True)
+
+def run_batch(input_files, output_dir=None, workers=None, file_workers=1,
+              batch_size=xml_processor.DEFAULT_BATCH_SIZE, report_dir=None, profile_stages=(), schema_file=None,
+              discover_custom_fields=None, step_rows=None, cache_dir=None,
+              cache_max_bytes=result_cache.DEFAULT_MAX_BYTES, shard_bytes=None, shard_cases=None, encoding=None,
+              input_encoding=None, xml_output="csv", conversion_cache_bytes=None, use_conversion_cache=True):
+    """ファイル一覧をワーカープロセスのプールで変換し、ファイルごとの結果を返す
+
+    1ファイルの失敗で処理を止めず、最後まで変換を続ける。
+    """
+    jobs = [(input_file, output_path_for(input_file, output_dir, xml_output)) for input_file in input_files]
+    results = {}
+
+    def report(input_file, output_file, result):
+        ok, elapsed, message, cache_stats = result
+        results[input_file] = (output_file, ok, elapsed, message, cache_stats)
+        status = "OK" if ok else "失敗"
+        print(f"[{len(results)}/{len(jobs)}] {status} {input_file} ({elapsed:.2f}秒)" + ("" if ok else f": {message}"),
+              flush=True)
+
+    if workers == 1:
+        for input_file, output_file in jobs:
+            report(input_file, output_file, convert_file(input_file, output_file, file_workers, batch_size,
+                                                         report_dir, profile_stages, schema_file,
+                                                         discover_custom_fields, step_rows, cache_dir,
+                                                         cache_max_bytes, shard_bytes, shard_cases, encoding,
+                                                         input_encoding, xml_output, conversion_cache_bytes,
+                                                         use_conversion_cache))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(convert_file, input_file, output_file, file_workers, batch_size,
+                                       report_dir, profile_stages, schema_file, discover_custom_fields,
+                                       step_rows, cache_dir, cache_max_bytes, shard_bytes, shard_cases, encoding,
+                                       input_encoding, xml_output, conversion_cache_bytes, use_conversion_cache):
+                           (input_file, output_file)
+                       for input_file, output_file in jobs}
+            for future in as_completed(futures):
+                input_file, output_file = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e: # ワーカープロセスの異常終了など
+                    result = (False, 0.0, f"ワーカーでエラーが発生しました: {e}", None)
+                report(input_file, output_file, result)
+
+    # 入力順に並べ直して返す
+    return [(input_file,) + results[input_file] for input_file, _ in jobs]
+
+def print_summary(results, total_elapsed):
+    """ファイルごとの結果と所要時間の一覧、変換キャッシュの合計を表示する"""
+    succeeded = sum(1 for _, _, ok, _, _, _ in results if ok)
+    print()
+    print(f"{'状態':<4} {'秒':>8}  ファイル")
+    for input_file, output_file, ok, elapsed, message, _ in results:
+        if ok:
+            print(f"{'OK':<4} {elapsed:>8.2f}  {input_file} -> {output_file}")
+        else:
+            print(f"{'失敗':<4} {elapsed:>8.2f}  {input_file}: {message}")
+    print(f"\n合計 {len(results)} 件 (成功 {succeeded} 件, 失敗 {len(results) - succeeded} 件), 経過時間 {total_elapsed:.2f}秒")
+    cache_stats = [stats for _, _, _, _, _, stats in results if stats is not None]
+    hits = sum(stats["hits"] for stats in cache_stats)
+    misses = sum(stats["misses"] for stats in cache_stats)
+    evictions = sum(stats["evictions"] for stats in cache_stats)
+    if not any(stats["enabled"] for stats in cache_stats):
+        print("変換キャッシュ: 無効")
+    else:
+        print(f"変換キャッシュ: ヒット {hits} 件, 変換 {misses} 件"
+              f" (ヒット率 {hits / (hits + misses) if hits + misses else 0.0:.0%}, 破棄 {evictions} 件)")
+
+def main(argv=None):
+    """コマンドライン引数を解析して一括変換を実行する"""
+    parser = argparse.ArgumentParser(description="TestLink XML/CSV を一括変換する (XML→CSV, CSV→XML)")
+    parser.add_argument("paths", nargs="+", help="変換するファイル、グロブパターンまたはディレクトリ")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="ワーカープロセス数 (既定: CPUコア数)")
+    parser.add_argument("-o", "--output-dir", default=None,
+                        help="出力先ディレクトリ (既定: 入力ファイルと同じ場所)")
+    parser.add_argument("-t", "--type", dest="file_type", choices=["xml", "csv", "all"], default="all",
+                        help="変換対象の種類 (既定: all)")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="ディレクトリを再帰的に探索する (グロブの ** も有効にする)")
+    parser.add_argument("--file-workers", type=int, default=1,
+                        help="1ファイル内のHTML整形に使うワーカープロセス数 (既定: 1、巨大な1ファイルには -w 1 と併用)")
+    parser.add_argument("--batch-size", type=int, default=xml_processor.DEFAULT_BATCH_SIZE,
+                        help=f"ファイル内並列化で1回に渡すテストケース数 (既定: {xml_processor.DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--report-dir", default=None,
+                        help="段階ごとの処理時間・呼び出し回数・メモリのJSONレポートを書き込むディレクトリ")
+    parser.add_argument("--profile", dest="profile_stages", action="append", default=[], metavar="STAGE",
+                        help="指定した段階 (例: clean_html) を cProfile で計測し、--report-dir に .prof を保存する")
+    parser.add_argument("--schema", dest="schema_file", default=None,
+                        help="XML→CSV変換の列定義ファイル (既定: column_schema.json)")
+    parser.add_argument("--discover-custom-fields", action="store_true", default=None,
+                        help="XMLを事前に走査し、列定義にないカスタムフィールドも列として出力する")
+    parser.add_argument("--step-rows", action="store_true", default=None,
+                        help="XML→CSV変換でステップごとに1行を出力する (CSV→XMLで全ステップを復元できる)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="テストケース単位の変換結果を保存するディレクトリ (変更のないテストケースの変換を省略する)")
+    parser.add_argument("--cache-max-mb", type=int, default=result_cache.DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="キャッシュの上限サイズ (MB、超えると古いものから破棄する。"
+                             f"既定: {result_cache.DEFAULT_MAX_BYTES // (1024 * 1024)})")
+    parser.add_argument("--conversion-cache-mb", type=int,
+                        default=conversion_cache.DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="clean_html / text_to_html の結果を再利用するメモリ上のキャッシュの上限 (MB、ワーカーごと。"
+                             f"既定: {conversion_cache.DEFAULT_MAX_BYTES // (1024 * 1024)})")
+    parser.add_argument("--no-conversion-cache", action="store_true",
+                        help="メモリ上の変換キャッシュを使わない")
+    parser.add_argument("--shard-mb", type=float, default=None,
+                        help="CSV→XML変換の出力をこのサイズ (MB) 以下のファイルに分ける (テストケースは分割しない)")
+    parser.add_argument("--shard-cases", type=int, default=None,
+                        help="CSV→XML変換の出力を1ファイルあたりこの件数以下に分ける")
+    parser.add_argument("--encoding", choices=encoding_io.OUTPUT_ENCODINGS, default=encoding_io.DEFAULT_OUTPUT_ENCODING,
+                        help=f"XML→CSV変換で書き込むCSVの文字コード (既定: {encoding_io.DEFAULT_OUTPUT_ENCODING})")
+    parser.add_argument("--xml-output", choices=sorted(XML_OUTPUT_EXTENSIONS), default="csv",
+                        help="XMLの変換先 (sqlite: テストケース・ステップ・カスタムフィールドをインデックス付きの"
+                             "SQLiteデータベースに書き込む。既定: csv)")
+    parser.add_argument("--input-encoding", default=None,
+                        help="CSV→XML変換で読むCSVの文字コード (既定: ファイルの先頭から判定)")
+    args = parser.parse_args(argv)
+
+    input_files = collect_input_files(args.paths, args.file_type, args.recursive)
+    if not input_files:
+        print("変換対象のファイルが見つかりません")
+        return 2
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    if args.profile_stages and not args.report_dir:
+        parser.error("--profile には --report-dir の指定が必要です")
+    if args.report_dir:
+        os.makedirs(args.report_dir, exist_ok=True)
+    if args.schema_file:
+        # 列定義の誤りは変換を始める前に報告する
+        try:
+            column_schema.load_plan(args.schema_file)
+        except ValueError as e:
+            parser.error(str(e))
+
+    start = time.perf_counter()
+    results = run_batch(input_files, args.output_dir, args.workers, args.file_workers, args.batch_size,
+                        args.report_dir, args.profile_stages, args.schema_file, args.discover_custom_fields,
+                        args.step_rows, args.cache_dir, args.cache_max_mb * 1024 * 1024,
+                        int(args.shard_mb * 1024 * 1024) if args.shard_mb else None, args.shard_cases,
+                        args.encoding, args.input_encoding, args.xml_output, args.conversion_cache_mb * 1024 * 1024,
+                        not args.no_conversion_cache)
+    print_summary(results, time.perf_counter() - start)
+    return 0 if all(ok for _, _, ok, _, _, _ in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
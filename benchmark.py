@@ -0,0 +1,481 @@
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import conversion_cache
+import corpus_generator
+import csv_processor
+import instrumentation
+import xml_processor
+from csv_reader import iter_csv_rows, get_header_indices
+from text_utils import text_to_html
+from xml_builder import iter_contiguous_groups, build_record_element, create_root_element
+from records import CsvLayout
+from xml_utils import element_to_string
+
+MB = 1024 * 1024
+
+# 以下の2関数は書き換え前の xml_processor の実装をそのまま残したもの (比較の基準なので変更しないこと)
+def _baseline_fix_double_cdata(xml_content):
+    """書き換え前の fix_double_cdata (正規表現による置換)"""
+    pattern = r'<!\[CDATA\[\s*<!\[CDATA\[(.*?)]]>\s*]]>'
+    return re.sub(pattern, r'<![CDATA[\1]]>', xml_content, flags=re.DOTALL)
+
+def _baseline_clean_html(text):
+    """書き換え前の clean_html (正規表現による置換の繰り返し)"""
+    if not text:
+        return ""
+    text = re.sub(r'<!\[CDATA\[(.*?)\]\]>', r'\1', text, flags=re.DOTALL)
+    text = re.sub(r'<p>(.*?)</p>', lambda m: m.group(1).strip() + '\n', text, flags=re.DOTALL | re.IGNORECASE)
+    text = re.sub(r'<br\s*/?>', '\n', text, flags=re.IGNORECASE)
+
+    def replace_list(match):
+        list_content = match.group(1)
+        items = re.findall(r'<li.*?>(.*?)</li>', list_content, flags=re.DOTALL | re.IGNORECASE)
+        plain_items = []
+        for item in items:
+            cleaned_item = _baseline_clean_html(item).strip()
+            lines = [f"・{line.strip()}" for line in cleaned_item.split('\n') if line.strip()]
+            plain_items.extend(lines)
+        return '\n'.join(plain_items) + '\n' if plain_items else '\n'
+
+    text = re.sub(r'<(ul|ol).*?>(.*?)</\1>', replace_list, text, flags=re.DOTALL | re.IGNORECASE)
+    text = re.sub(r'<li.*?>(.*?)</li>', lambda m: '・' + _baseline_clean_html(m.group(1)).strip() + '\n',
+                  text, flags=re.DOTALL | re.IGNORECASE)
+    text = re.sub(r'<(?!\/?(p|br|ul|ol|li)\b)[^>]+>', '', text, flags=re.IGNORECASE)
+    text = text.replace("&nbsp;", " ").replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&") \
+        .replace("&quot;", "\"").replace("&#39;", "'")
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r'\n\s*\n+', '\n', text)
+    return text.strip()
+
+def generate_cdata_sample(path, size_mb):
+    """二重CDATAを多数含むXMLを指定サイズ (MB) で生成する"""
+    block = (
+        '<testcase internalid="1" name="テストケース">\n'
+        '<summary><![CDATA[<![CDATA[<p>概要テキスト</p>]]>]]></summary>\n'
+        '<preconditions><![CDATA[<p>事前条件</p>]]></preconditions>\n'
+        '<steps><step><step_number><![CDATA[1]]></step_number>'
+        '<actions><![CDATA[\n<![CDATA[<p>手順</p>]]>\n]]></actions></step></steps>\n'
+        '</testcase>\n'
+    )
+    target = size_mb * MB
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<testcases>\n')
+        chunk = block * 256
+        chunk_size = len(chunk.encode('utf-8'))
+        while written < target:
+            f.write(chunk)
+            written += chunk_size
+        f.write('</testcases>\n')
+
+def bench_cdata_regex(path):
+    """従来方式: ファイル全体を読み込み、書き換え前の正規表現版 fix_double_cdata を適用する"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    _baseline_fix_double_cdata(content)
+
+def bench_cdata_linear(path):
+    """線形走査方式: ファイル全体を読み込み、現在の fix_double_cdata を適用する"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    xml_processor.fix_double_cdata(content)
+
+def bench_cdata_stream(path, chunk_size):
+    """ストリーミング方式: DoubleCdataFixReader で読み切る"""
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = xml_processor.DoubleCdataFixReader(f, chunk_size=chunk_size)
+        while reader.read(64 * 1024):
+            pass
+
+def run_cdata(args):
+    """二重CDATA修正のスループットを比較する"""
+    print(f"{'サイズ(MB)':>10} {'方式':<8} {'秒':>8} {'MB/秒':>8}")
+    for size_mb in args.sizes:
+        fd, path = tempfile.mkstemp(suffix=".xml")
+        os.close(fd)
+        try:
+            generate_cdata_sample(path, size_mb)
+            actual_mb = os.path.getsize(path) / MB
+            methods = [("linear", lambda: bench_cdata_linear(path)),
+                       ("stream", lambda: bench_cdata_stream(path, args.chunk_size))]
+            if not args.skip_regex:
+                methods.insert(0, ("regex", lambda: bench_cdata_regex(path)))
+            for name, func in methods:
+                start = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - start
+                print(f"{size_mb:>10} {name:<8} {elapsed:>8.2f} {actual_mb / elapsed:>8.1f}")
+        finally:
+            os.remove(path)
+
+# clean_html の適合性確認用コーパス (従来実装の出力と完全一致すること)
+CLEAN_HTML_CORPUS = [
+    "",
+    "プレーンテキスト",
+    "  前後に空白  ",
+    "<p>概要テキスト</p>",
+    "<P>大文字タグ</P>",
+    "<p>1行目</p>\n<p>2行目</p>",
+    "<p>  前後の空白は除去  </p>",
+    "<p>\n\t改行とタブ\n</p>",
+    "<p>行1<br />行2<br>行3<BR/>行4</p>",
+    "<p><br />先頭のbr</p>",
+    "<p><strong>太字</strong> と <em>斜体</em></p>",
+    "<p> <span style=\"color: red;\">色付き</span> </p>",
+    "<p>&nbsp;ノーブレークスペース&nbsp;</p>",
+    "<p>&lt;tag&gt; &amp; &quot;引用&quot; &#39;単引用&#39;</p>",
+    "<p>&amp;lt; &amp;quot; &amp;#39; &amp;amp;</p>",
+    "<p>&#12354; &copy; 未対応のエンティティ</p>",
+    "<ol>\n<li><p>手順1</p></li>\n<li><p>手順2</p></li>\n</ol>",
+    "<ul><li>項目A</li><li>項目B</li></ul>",
+    "<ol type=\"1\"><li>属性付きリスト</li></ol>",
+    "<p>前文</p><ul><li>項目</li></ul><p>後文</p>",
+    "<p>段落内のリスト<ul><li>項目</li></ul></p>",
+    "<ul><li>外側<ul><li>内側</li></ul></li></ul>",
+    "<li>リスト外の項目</li>",
+    "<li><p>段落を含む項目</p><p>2段落目</p></li>",
+    "<li class=\"x\">属性付き項目<br />2行目</li>",
+    "前文<li>項目1</li><li>項目2</li>後文",
+    "<p class=\"note\">属性付き段落</p>",
+    "<p>閉じタグなし",
+    "閉じタグのみ</p>",
+    "<table><tr><td>セル1</td><td>セル2</td></tr></table>",
+    "<pre>整形済み</pre>",
+    "<!-- コメント -->本文",
+    "<div>\n\n\n<p>空行の整理</p>\n\n</div>",
+    "全角　スペース　<p>　全角空白</p>",
+    "a < b かつ c > d",
+    "<p>1.</p><p>2.</p><p>3.</p>",
+    "<h1>見出し</h1><p>本文</p><hr /><p>末尾</p>",
+    "<![CDATA[<p>CDATA内</p>]]>",
+    "<ol<b>x</b></ol>",
+    "<li<pre>y</li>",
+    "<ul<li>a</li></ul>",
+]
+
+def _html_sample(length, depth):
+    """指定した長さ・リストのネスト深さのHTMLを生成する"""
+    nested = "<ul><li>" * depth + "項目" + "</li></ul>" * depth
+    paragraph = "<p>手順を実行する &amp; <strong>結果</strong>を確認する<br />次の行</p>\n" + nested + "\n"
+    # タグを途中で切らないよう段落単位で繰り返す
+    return paragraph * max(1, round(length / len(paragraph)))
+
+def check_clean_html_conformance():
+    """コーパスで clean_html と従来実装の出力が一致するか確認する"""
+    mismatches = []
+    fallbacks = 0
+    for text in CLEAN_HTML_CORPUS:
+        if xml_processor._clean_html_tokens(text) is None:
+            fallbacks += 1
+        if xml_processor.clean_html(text) != _baseline_clean_html(text):
+            mismatches.append(text)
+    print(f"適合性: {len(CLEAN_HTML_CORPUS) - len(mismatches)}/{len(CLEAN_HTML_CORPUS)} 件一致"
+          f" (従来実装へのフォールバック {fallbacks} 件)")
+    for text in mismatches:
+        print(f"  不一致: {text!r}")
+    return not mismatches
+
+def run_clean_html(args):
+    """clean_html の1パス実装と従来実装の速度を文字数・ネスト深さ別に比較する"""
+    if not check_clean_html_conformance():
+        raise SystemExit(1)
+    print(f"{'文字数':>8} {'深さ':>4} {'従来(µs)':>10} {'1パス(µs)':>10} {'倍率':>6}")
+    with conversion_cache.disabled():
+        _time_clean_html(args)
+
+def _time_clean_html(args):
+    """文字数・ネスト深さごとに両実装の1回あたりの処理時間を表示する"""
+    for length in args.lengths:
+        for depth in args.depths:
+            text = _html_sample(length, depth)
+            number = max(1, args.iterations * 100 // length)
+            timings = []
+            for func in (_baseline_clean_html, xml_processor.clean_html):
+                start = time.perf_counter()
+                for _ in range(number):
+                    func(text)
+                timings.append((time.perf_counter() - start) / number * 1e6)
+            print(f"{length:>8} {depth:>4} {timings[0]:>10.1f} {timings[1]:>10.1f} {timings[0] / timings[1]:>6.2f}")
+
+# 敵対的な入力で計測する処理と、1回あたりの制限時間 (固定分 + 入力100万文字あたり)
+ADVERSARIAL_STAGES = ["fix_double_cdata", "clean_html", "convert_xml_file_to_csv"]
+ADVERSARIAL_BASE_SECONDS = 0.5
+ADVERSARIAL_SECONDS_PER_MCHARS = 3.0
+
+def _adversarial_stage(stage_name, kind, length, work_dir):
+    """処理名に対応する計測する関数を返す (入力の生成は計測しない)"""
+    html = corpus_generator.adversarial_html(kind, length)
+    if stage_name == "fix_double_cdata":
+        return lambda: xml_processor.fix_double_cdata(html)
+    if stage_name == "clean_html":
+        return lambda: xml_processor.clean_html(html)
+    xml_file = os.path.join(work_dir, f"{kind}.xml")
+    corpus_generator.write_adversarial_xml(xml_file, kind, length)
+    return lambda: xml_processor.convert_xml_file_to_csv(xml_file, os.path.join(work_dir, f"{kind}.csv"))
+
+def run_adversarial(args):
+    """敵対的な入力の種類・文字数ごとに処理時間を計り、制限時間を超えたものがあれば終了コード1で終わる
+
+    制限時間は入力の長さに比例させているため、処理が入力の長さの2乗以上に増える場合はここで検出できる。
+    """
+    print(f"{'種類':<24} {'文字数':>9} {'処理':<24} {'秒':>8} {'制限':>8}")
+    failures = []
+    with tempfile.TemporaryDirectory() as work_dir, conversion_cache.disabled():
+        for kind in args.kinds:
+            for length in args.lengths:
+                for stage_name in args.stages:
+                    func = _adversarial_stage(stage_name, kind, length, work_dir)
+                    limit = ADVERSARIAL_BASE_SECONDS + args.seconds_per_mchars * length / 1e6
+                    start = time.perf_counter()
+                    func()
+                    elapsed = time.perf_counter() - start
+                    status = "OK" if elapsed <= limit else "NG"
+                    print(f"{kind:<24} {length:>9} {stage_name:<24} {elapsed:>8.3f} {limit:>8.2f} {status}")
+                    if status != "OK":
+                        failures.append((kind, length, stage_name, elapsed, limit))
+    if failures:
+        print(f"\n制限時間を超えた処理: {len(failures)} 件")
+        for kind, length, stage_name, elapsed, limit in failures:
+            print(f"  {kind} ({length}文字) {stage_name}: {elapsed:.2f}秒 > {limit:.2f}秒")
+        raise SystemExit(1)
+    print("\nすべての処理が制限時間内に終わりました")
+
+# ベンチマークスイートで計測する処理
+SUITE_BENCHMARKS = [
+    "convert_xml_to_csv", "convert_xml_file_to_csv", "convert_csv_to_xml", "stream_csv_to_xml",
+    "clean_html", "text_to_html", "element_to_string",
+]
+
+def _corpus_html_texts(xml_file):
+    """コーパスのXMLから clean_html に渡すHTML (サマリ、事前条件、アクション、期待結果) を集める"""
+    texts = []
+    for testcase, suite in xml_processor.iter_testcases(xml_file):
+        row = xml_processor.extract_raw_row(testcase, suite)
+        texts.extend(row[index] for index in xml_processor.HTML_COLUMN_INDICES)
+    return texts
+
+def _corpus_plain_texts(csv_file):
+    """コーパスのCSVから text_to_html に渡すテキストを集める"""
+    rows = iter_csv_rows(csv_file)
+    headers = next(rows)
+    indices = [headers.index(header) for header in ("サマリ（概要）", "事前条件", "アクション（手順）", "期待結果")]
+    return [row[index] for row in rows for index in indices]
+
+def _corpus_root_element(csv_file):
+    """コーパスのCSVから element_to_string に渡す testcases 要素を組み立てる"""
+    rows = iter_csv_rows(csv_file)
+    header_indices = get_header_indices(next(rows))
+    root = create_root_element()
+    for _, record in CsvLayout(header_indices).testcases(iter_contiguous_groups(rows, header_indices)):
+        build_record_element(root, record)
+    return root
+
+def _benchmark_target(name, xml_file, csv_file, work_dir):
+    """ベンチマーク名に対応する (入力バイト数, 計測する関数) を返す (準備の時間は計測しない)"""
+    if name == "convert_xml_to_csv":
+        def run():
+            # GUIの従来方式と同じく、全体を読み込んでからパースする
+            with open(xml_file, 'r', encoding='utf-8') as f:
+                content = xml_processor.fix_double_cdata(f.read())
+            testcases_root, testsuite_name = xml_processor.parse_xml_root(content)
+            xml_processor.convert_xml_to_csv(testcases_root, testsuite_name, os.path.join(work_dir, "out.csv"))
+        return os.path.getsize(xml_file), run
+    if name == "convert_xml_file_to_csv":
+        return os.path.getsize(xml_file), lambda: xml_processor.convert_xml_file_to_csv(
+            xml_file, os.path.join(work_dir, "out.csv"))
+    if name == "convert_csv_to_xml":
+        return os.path.getsize(csv_file), lambda: csv_processor.convert_csv_to_xml(
+            csv_file, os.path.join(work_dir, "out.xml"))
+    if name == "stream_csv_to_xml":
+        return os.path.getsize(csv_file), lambda: csv_processor.stream_csv_to_xml(
+            csv_file, os.path.join(work_dir, "out.xml"))
+    if name == "clean_html":
+        texts = _corpus_html_texts(xml_file)
+        def run():
+            for text in texts:
+                xml_processor.clean_html(text)
+        return sum(len(text.encode('utf-8')) for text in texts), run
+    if name == "text_to_html":
+        texts = _corpus_plain_texts(csv_file)
+        def run():
+            for text in texts:
+                text_to_html(text)
+        return sum(len(text.encode('utf-8')) for text in texts), run
+    if name == "element_to_string":
+        root = _corpus_root_element(csv_file)
+        return len(element_to_string(root).encode('utf-8')), lambda: element_to_string(root)
+    raise ValueError(f"未知のベンチマークです: {name}")
+
+def run_one(args):
+    """1つのベンチマークを計測し、結果をJSONファイルに書き込む (suite から別プロセスで呼ばれる)"""
+    input_bytes, func = _benchmark_target(args.benchmark, args.xml_file, args.csv_file, args.work_dir)
+    timings = []
+    # clean_html / text_to_html はキャッシュの効果を除いた処理そのものの速度を測る
+    with conversion_cache.disabled():
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    seconds = min(timings)
+    peak_rss = instrumentation.peak_rss_bytes()
+    result = {
+        "benchmark": args.benchmark,
+        "cases": args.cases,
+        "input_mb": input_bytes / MB,
+        "seconds": seconds,
+        "cases_per_sec": args.cases / seconds if seconds else 0.0,
+        "mb_per_sec": input_bytes / MB / seconds if seconds else 0.0,
+        "peak_rss_mb": peak_rss / MB if peak_rss is not None else None,
+    }
+    with open(args.result, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+def _run_in_subprocess(name, cases, xml_file, csv_file, work_dir, repeat):
+    """ピークRSSを個別に測るため、ベンチマークを別プロセスで実行して結果を返す"""
+    result_file = os.path.join(work_dir, "result.json")
+    command = [sys.executable, os.path.abspath(__file__), "run-one", name, xml_file, csv_file,
+               "--cases", str(cases), "--work-dir", work_dir, "--repeat", str(repeat), "--result", result_file]
+    completed = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               encoding='utf-8', errors='replace')
+    if completed.returncode != 0:
+        raise RuntimeError(f"{name} ({cases}件) の実行に失敗しました:\n{completed.stderr}")
+    with open(result_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def compare_with_baseline(results, baseline, threshold):
+    """ベースラインと比べて性能が threshold の割合を超えて悪化した項目の一覧を返す"""
+    baseline_results = {(r["benchmark"], r["cases"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        base = baseline_results.get((result["benchmark"], result["cases"]))
+        if base is None:
+            continue
+        if base["cases_per_sec"] and result["cases_per_sec"] < base["cases_per_sec"] * (1 - threshold):
+            regressions.append((result, "cases_per_sec", base["cases_per_sec"], result["cases_per_sec"]))
+        if base.get("peak_rss_mb") and result.get("peak_rss_mb") \
+                and result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + threshold):
+            regressions.append((result, "peak_rss_mb", base["peak_rss_mb"], result["peak_rss_mb"]))
+    return regressions
+
+def run_suite(args):
+    """合成コーパスで両方向の変換と主要な関数を計測し、JSONに記録してベースラインと比較する"""
+    options = corpus_generator.corpus_options(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("corpus") != options:
+            print("警告: ベースラインとコーパスの設定が異なります。比較結果は参考値です。")
+
+    print(f"{'処理':<24} {'件数':>7} {'秒':>8} {'件/秒':>10} {'MB/秒':>8} {'RSS(MB)':>8}")
+    results = []
+    for cases in args.sizes:
+        with tempfile.TemporaryDirectory() as work_dir:
+            xml_file = os.path.join(work_dir, "corpus.xml")
+            csv_file = os.path.join(work_dir, "corpus.csv")
+            corpus_generator.write_xml(xml_file, cases=cases, **options)
+            corpus_generator.write_csv(csv_file, cases=cases, **options)
+            for name in args.benchmarks:
+                result = _run_in_subprocess(name, cases, xml_file, csv_file, work_dir, args.repeat)
+                results.append(result)
+                rss = f"{result['peak_rss_mb']:>8.1f}" if result["peak_rss_mb"] is not None else f"{'-':>8}"
+                print(f"{name:<24} {cases:>7} {result['seconds']:>8.3f} {result['cases_per_sec']:>10.0f}"
+                      f" {result['mb_per_sec']:>8.2f} {rss}", flush=True)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": options,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n結果を {args.output} に保存しました")
+
+    if baseline is not None:
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n性能の悪化 (しきい値 {args.threshold:.0%}):")
+            for result, metric, before, after in regressions:
+                print(f"  {result['benchmark']} ({result['cases']}件) {metric}: {before:.2f} -> {after:.2f}")
+            raise SystemExit(1)
+        print(f"\nベースラインからの悪化はありません (しきい値 {args.threshold:.0%})")
+
+def main():
+    """ベンチマークを実行する"""
+    parser = argparse.ArgumentParser(description="TestLink変換処理のベンチマーク")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    cdata_parser = subparsers.add_parser("cdata", help="二重CDATA修正のスループット比較")
+    cdata_parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1024],
+                              help="入力サイズ (MB)")
+    cdata_parser.add_argument("--chunk-size", type=int, default=1024 * 1024,
+                              help="ストリーミング方式のチャンクサイズ (文字数)")
+    cdata_parser.add_argument("--skip-regex", action="store_true",
+                              help="従来方式 (全体読み込み・正規表現) を省略する")
+    cdata_parser.set_defaults(func=run_cdata)
+
+    html_parser = subparsers.add_parser("clean-html", help="clean_html の適合性確認と速度比較")
+    html_parser.add_argument("--lengths", type=int, nargs="+", default=[100, 1000, 10000, 100000],
+                             help="入力の文字数")
+    html_parser.add_argument("--depths", type=int, nargs="+", default=[1, 4, 16, 64],
+                             help="リストのネスト深さ")
+    html_parser.add_argument("--iterations", type=int, default=1000,
+                             help="100文字あたりの繰り返し回数")
+    html_parser.set_defaults(func=run_clean_html)
+
+    adversarial_parser = subparsers.add_parser("adversarial", help="敵対的な入力で処理時間が入力の長さに比例することを確認")
+    adversarial_parser.add_argument("--kinds", nargs="+", choices=list(corpus_generator.ADVERSARIAL_KINDS),
+                                    default=list(corpus_generator.ADVERSARIAL_KINDS),
+                                    help="入力の種類 (既定: すべて)")
+    adversarial_parser.add_argument("--lengths", type=int, nargs="+", default=[10000, 100000, 1000000],
+                                    help="入力の文字数")
+    adversarial_parser.add_argument("--stages", nargs="+", choices=ADVERSARIAL_STAGES, default=ADVERSARIAL_STAGES,
+                                    help="計測する処理 (既定: すべて)")
+    adversarial_parser.add_argument("--seconds-per-mchars", type=float, default=ADVERSARIAL_SECONDS_PER_MCHARS,
+                                    help=f"入力100万文字あたりの制限時間 (秒。既定: {ADVERSARIAL_SECONDS_PER_MCHARS})"
+                                         f" に固定分 {ADVERSARIAL_BASE_SECONDS} 秒を加える")
+    adversarial_parser.set_defaults(func=run_adversarial)
+
+    suite_parser = subparsers.add_parser("suite", help="合成コーパスによる変換処理全体のベンチマーク")
+    suite_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                              help="テストケース数")
+    suite_parser.add_argument("--benchmarks", nargs="+", choices=SUITE_BENCHMARKS, default=SUITE_BENCHMARKS,
+                              help="計測する処理 (既定: すべて)")
+    suite_parser.add_argument("--repeat", type=int, default=3,
+                              help="繰り返し回数 (最速の結果を記録する)")
+    suite_parser.add_argument("--output", default=None,
+                              help="結果を保存するJSONファイル (ベースラインとして使える)")
+    suite_parser.add_argument("--baseline", default=None,
+                              help="比較するベースラインのJSONファイル (悪化があれば終了コード1)")
+    suite_parser.add_argument("--threshold", type=float, default=0.1,
+                              help="悪化とみなす割合 (既定: 0.1 = 10%%)")
+    corpus_generator.add_corpus_arguments(suite_parser)
+    suite_parser.set_defaults(func=run_suite)
+
+    one_parser = subparsers.add_parser("run-one", help="1つの処理を計測する (suite の内部用)")
+    one_parser.add_argument("benchmark", choices=SUITE_BENCHMARKS)
+    one_parser.add_argument("xml_file")
+    one_parser.add_argument("csv_file")
+    one_parser.add_argument("--cases", type=int, required=True)
+    one_parser.add_argument("--work-dir", required=True)
+    one_parser.add_argument("--repeat", type=int, default=3)
+    one_parser.add_argument("--result", required=True)
+    one_parser.set_defaults(func=run_one)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
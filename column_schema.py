@@ -0,0 +1,295 @@
+import json
+import os
+
+from text_utils import strip_cdata_markers
+
+# 既定の列定義ファイル (このモジュールと同じ場所)
+DEFAULT_SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "column_schema.json")
+
+# 列の値の取り出し元
+SOURCE_ATTRIBUTE = "attribute"        # testcase 要素の属性
+SOURCE_ELEMENT = "element"            # testcase 直下の子要素
+SOURCE_STEP = "step"                  # 最初の step の子要素
+SOURCE_CUSTOM_FIELD = "custom_field"  # custom_fields 内の同名のカスタムフィールドの値
+SOURCE_TESTSUITE = "testsuite"        # 親テストスイート名 (testcase を直接含むテストスイート)
+SOURCE_TESTSUITE_PATH = "testsuite_path"    # ルートから親までのテストスイート名を / でつないだパス
+SOURCE_TESTSUITE_ORDER = "testsuite_order"  # ルートから親までの各テストスイートの node_order を / でつないだもの
+_SUITE_SOURCES = (SOURCE_TESTSUITE, SOURCE_TESTSUITE_PATH, SOURCE_TESTSUITE_ORDER)
+_SOURCES = (SOURCE_ATTRIBUTE, SOURCE_ELEMENT, SOURCE_STEP, SOURCE_CUSTOM_FIELD) + _SUITE_SOURCES
+
+# テストスイートのパスの区切り
+SUITE_PATH_SEPARATOR = "/"
+
+def _element_text(element, raw):
+    """要素のテキストを get_element_text と同じ規則で返す (raw の場合はCDATA表記を残す)"""
+    if element is None:
+        return ""
+    text = element.text
+    if not text:
+        return ""
+    if not raw and "<![CDATA[" in text:
+        text = strip_cdata_markers(text)
+    return text.strip()
+
+def _first_children(element, tags):
+    """element の子要素のうち tags に含まれるタグの最初の要素を {タグ: 要素} で返す (1回の走査)"""
+    found = {}
+    for child in element:
+        tag = child.tag
+        if tag in tags and tag not in found:
+            found[tag] = child
+    return found
+
+def _parse_source(spec, header):
+    """列定義の辞書から (取り出し元, キー, raw) を取り出す"""
+    sources = [source for source in _SOURCES if source in spec]
+    if len(sources) != 1:
+        raise ValueError(f"列「{header}」には {', '.join(_SOURCES)} のいずれか1つを指定してください")
+    source = sources[0]
+    key = spec[source]
+    if source in _SUITE_SOURCES:
+        key = None
+    elif not isinstance(key, str) or not key:
+        raise ValueError(f"列「{header}」の {source} には要素名・属性名を指定してください")
+    return source, key, bool(spec.get("raw", False))
+
+class SuitePath:
+    """testcase を含むテストスイートの名前・パス・順番 (XMLの走査中にテストスイートごとに1回だけ作る)
+
+    order は各テストスイートの <node_order> の値をつないだもの (<node_order> がなければ兄弟内の順番、1から)。
+    index は兄弟内の順番をつないだもので、文書内のテストスイートごとに異なる (node_order は重複しうる)。
+    名前が空のルート (プロジェクト全体のエクスポート) はパス・順番に含めない。
+    """
+    __slots__ = ("name", "path", "order", "index", "_order_prefix")
+
+    def __init__(self, name, path, order, index, order_prefix=""):
+        self.name = name
+        self.path = path
+        self.order = order
+        self.index = index
+        self._order_prefix = order_prefix
+
+    @classmethod
+    def root(cls, name, node_order=""):
+        """ルートのテストスイート"""
+        if not name:
+            return cls(name, name, "", "")
+        return cls(name, name, node_order or "1", "1")
+
+    def child(self, name, position, node_order=""):
+        """position 番目 (1から) の子テストスイート"""
+        if not self.index:
+            return SuitePath(name, name, node_order or str(position), str(position))
+        prefix = self.order + SUITE_PATH_SEPARATOR
+        return SuitePath(name, self.path + SUITE_PATH_SEPARATOR + name, prefix + (node_order or str(position)),
+                         self.index + SUITE_PATH_SEPARATOR + str(position), prefix)
+
+    def set_node_order(self, node_order):
+        """テストスイートに入った後で読んだ <node_order> を順番に反映する (ストリーミングでの走査用)"""
+        if node_order and self.index:
+            self.order = self._order_prefix + node_order
+
+# テストスイートに含まれない testcase (ルートが testcases の場合など)
+NO_SUITE = SuitePath("", "", "", "")
+
+def suite_node_order(testsuite):
+    """testsuite 要素の <node_order> の値 (TestLink のエクスポートと同じく最初の子要素の場合だけ使う。なければ空文字)"""
+    if len(testsuite) and testsuite[0].tag == "node_order":
+        return _element_text(testsuite[0], False)
+    return ""
+
+class ExtractionPlan:
+    """列定義から作る testcase 要素→CSV行の取り出し手順
+
+    testcase の子要素 (と最初の step、custom_fields の子要素) を1回ずつ走査し、
+    必要なタグの要素を集めてから各列に振り分ける。列を増やしても走査の回数は変わらない。
+    """
+
+    def __init__(self, columns, discover_custom_fields=False, step_rows=False, trailing=0):
+        self.columns = list(columns)
+        self.discover_custom_fields = discover_custom_fields
+        self.step_rows = step_rows
+        self.trailing = trailing    # 末尾に固定する列の数 (with_custom_fields で追加する列はこれらの前に入れる)
+        self.headers = []
+        self.html_indices = []
+        self._columns = []          # (取り出し元, キー, raw, 代替の取り出し元 or None)
+        self._testcase_tags = set()
+        self._step_tags = set()
+        self._custom_names = set()
+
+        for spec in columns:
+            header = spec.get("header")
+            if not isinstance(header, str) or not header:
+                raise ValueError(f"列定義に header がありません: {spec}")
+            if header in self.headers:
+                raise ValueError(f"列「{header}」が重複しています")
+            source = _parse_source(spec, header)
+            fallback = None
+            if "fallback" in spec:
+                fallback = _parse_source(spec["fallback"], header)
+                if fallback[0] not in (SOURCE_ELEMENT, SOURCE_STEP):
+                    raise ValueError(f"列「{header}」の fallback には element か step を指定してください")
+            for src, key, _ in (source,) + ((fallback,) if fallback else ()):
+                if src == SOURCE_ELEMENT:
+                    self._testcase_tags.add(key)
+                elif src == SOURCE_STEP:
+                    self._step_tags.add(key)
+                elif src == SOURCE_CUSTOM_FIELD:
+                    self._custom_names.add(key)
+            if spec.get("html", False):
+                self.html_indices.append(len(self.headers))
+            self.headers.append(header)
+            self._columns.append(source + (fallback,))
+
+        if self._step_tags:
+            self._testcase_tags.add("steps")
+        if self._custom_names:
+            self._testcase_tags.add("custom_fields")
+        self.html_indices = tuple(self.html_indices)
+        self.custom_field_names = [key for source, key, _, _ in self._columns if source == SOURCE_CUSTOM_FIELD]
+
+        # ステップによって値が変わる列 (取り出し元か代替の取り出し元が step の列)
+        self.step_indices = tuple(
+            index for index, (source, _, _, fallback) in enumerate(self._columns)
+            if source == SOURCE_STEP or (fallback is not None and fallback[0] == SOURCE_STEP))
+        # ステップごとの行の組み立てに使う列の位置 (並列変換のワーカーに渡せるようタプルにまとめる)
+        self.step_layout = (
+            self.html_indices,
+            tuple(index for index in self.html_indices if index not in self.step_indices),
+            self.step_indices,
+            tuple(index for index in self.html_indices if index in self.step_indices),
+        )
+
+    def extract(self, testcase, suite):
+        """testcase 要素と親テストスイート (SuitePath) から1行分の値を取り出す (HTML列は未変換のまま)"""
+        children = _first_children(testcase, self._testcase_tags)
+
+        step_children = None
+        if self._step_tags:
+            steps = children.get("steps")
+            if steps is not None and len(steps) > 0:
+                first_step = steps.find("step")  # 最初のステップを取得
+                if first_step is not None:
+                    step_children = _first_children(first_step, self._step_tags)
+
+        return self._row(testcase, suite, children, step_children)
+
+    def extract_steps(self, testcase, suite):
+        """testcase 要素からケース共通の行と、ステップごとの step_indices の列の値を取り出す
+
+        (ステップのない行, [ステップ1の値, ステップ2の値, ...]) を返す。ステップのない行は
+        ステップがない場合の1行分の値で、HTML列は未変換のまま。
+        """
+        children = _first_children(testcase, self._testcase_tags)
+        row = self._row(testcase, suite, children, None)
+
+        step_values = []
+        steps = children.get("steps") if self._step_tags else None
+        if steps is not None:
+            columns = [self._columns[index] for index in self.step_indices]
+            for step in steps:
+                if step.tag != "step":
+                    continue
+                step_children = _first_children(step, self._step_tags)
+                step_values.append([self._value(column, children, step_children) for column in columns])
+        return row, step_values
+
+    def _row(self, testcase, suite, children, step_children):
+        """子要素の振り分け結果から1行分の値を作る"""
+        custom_values = None
+        if self._custom_names:
+            custom_values = custom_field_values(children.get("custom_fields"))
+
+        row = []
+        for column in self._columns:
+            source, key = column[0], column[1]
+            if source == SOURCE_ATTRIBUTE:
+                row.append(testcase.get(key, ""))
+            elif source == SOURCE_TESTSUITE:
+                row.append(suite.name)
+            elif source == SOURCE_TESTSUITE_PATH:
+                row.append(suite.path)
+            elif source == SOURCE_TESTSUITE_ORDER:
+                row.append(suite.order)
+            elif source == SOURCE_CUSTOM_FIELD:
+                row.append(custom_values.get(key, ""))
+            else:
+                row.append(self._value(column, children, step_children))
+        return row
+
+    @staticmethod
+    def _value(column, children, step_children):
+        """element / step の列の値を取り出す"""
+        source, key, raw, fallback = column
+        found = children if source == SOURCE_ELEMENT else step_children
+        element = found.get(key) if found is not None else None
+        if fallback is not None and (element is None or not element.text):
+            # 値の要素がない (またはテキストが空の) 場合は代替の要素の値を使う
+            found = children if fallback[0] == SOURCE_ELEMENT else step_children
+            element = found.get(fallback[1]) if found is not None else None
+            raw = fallback[2]
+        return _element_text(element, raw)
+
+    def with_custom_fields(self, names):
+        """names のうちまだ列にないカスタムフィールドを末尾 (末尾に固定する列の前) に追加した ExtractionPlan を返す"""
+        split = len(self.columns) - self.trailing
+        columns = self.columns[:split]
+        headers = set(self.headers)
+        for name in names:
+            if name in self.custom_field_names:
+                continue
+            if name in headers:
+                print(f"警告: カスタムフィールド「{name}」は既存の列名と重複するため出力しません")
+                continue
+            columns.append({"header": name, SOURCE_CUSTOM_FIELD: name})
+            headers.add(name)
+        return ExtractionPlan(columns + self.columns[split:], self.discover_custom_fields, self.step_rows,
+                              self.trailing)
+
+def custom_field_values(custom_fields_elem):
+    """custom_fields 要素から {カスタムフィールド名: 値} を返す (名前が空のものは除く)"""
+    values = {}
+    if custom_fields_elem is not None:
+        for cf in custom_fields_elem:
+            if cf.tag != "custom_field":
+                continue
+            cf_children = _first_children(cf, ("name", "value"))
+            cf_name = _element_text(cf_children.get("name"), False)
+            if cf_name:
+                values[cf_name] = _element_text(cf_children.get("value"), False)
+    return values
+
+def custom_fields_of(testcase):
+    """testcase 要素が持つカスタムフィールドを {名前: 値} で返す (ExtractionPlan.extract が読むものと同じ)"""
+    return custom_field_values(_first_children(testcase, ("custom_fields",)).get("custom_fields"))
+
+def custom_field_names_of(testcase):
+    """testcase 要素が持つカスタムフィールド名を返す (ExtractionPlan.extract が読むものと同じ)"""
+    return custom_fields_of(testcase).keys()
+
+def load_plan(schema_file=None):
+    """列定義ファイル (JSON) を読み込んで ExtractionPlan を作る
+
+    custom_fields に並べたカスタムフィールドは columns の後ろに同名の列として追加する。
+    trailing_columns の列はさらにその後ろ (見つけたカスタムフィールドの列よりも後ろ) に置く。
+    discover_custom_fields が true の場合、XML→CSV変換の前にXML全体を走査して
+    custom_fields にないカスタムフィールドも列に加える。
+    step_rows が true の場合、XML→CSV変換でステップごとに1行を出力する。
+    """
+    schema_file = schema_file or DEFAULT_SCHEMA_FILE
+    try:
+        with open(schema_file, 'r', encoding='utf-8') as f:
+            schema = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"列定義ファイルが見つかりません: {schema_file}")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"列定義ファイルの形式が正しくありません: {schema_file}: {e}")
+
+    columns = list(schema.get("columns", []))
+    columns.extend({"header": name, SOURCE_CUSTOM_FIELD: name} for name in schema.get("custom_fields", []))
+    trailing_columns = list(schema.get("trailing_columns", []))
+    columns.extend(trailing_columns)
+    if not columns:
+        raise ValueError(f"列定義ファイルに列がありません: {schema_file}")
+    return ExtractionPlan(columns, bool(schema.get("discover_custom_fields", False)),
+                          bool(schema.get("step_rows", False)), len(trailing_columns))
@@ -0,0 +1,122 @@
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# キャッシュのメモリ上限の既定値 (バイト)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# 1エントリあたりのキー・辞書ノードなどの概算サイズ (バイト)
+_ENTRY_OVERHEAD = 200
+
+class ConversionCache:
+    """変換結果をメモリ上限 (バイト) 付きで保持するLRUキャッシュ
+
+    同じ事前条件や定型の概要・期待結果が大量のテストケースで繰り返されるため、
+    clean_html (HTML→テキスト) と text_to_html (テキスト→HTML) の結果を共有して再利用する。
+    enabled はプロセス全体の設定で、disabled() はそれを呼び出したスレッドだけでキャッシュを使わなくする。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.enabled = True
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()     # disabled() の状態 (スレッドごと)
+
+    def active(self):
+        """このスレッドでキャッシュを使うか"""
+        return self.enabled and not getattr(self._local, "disabled", False)
+
+    @contextmanager
+    def disabled(self):
+        """with ブロックの間、このスレッドだけキャッシュを使わずに変換する (他のスレッドには影響しない)"""
+        previous = getattr(self._local, "disabled", False)
+        self._local.disabled = True
+        try:
+            yield
+        finally:
+            self._local.disabled = previous
+
+    def get_or_compute(self, kind, text, func):
+        """キャッシュ済みの結果を返す。なければ func(text) を計算して保存する"""
+        if not self.active() or self.max_bytes <= 0:
+            return func(text)
+
+        key = (kind, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        result = func(text)
+        size = sys.getsizeof(text) + sys.getsizeof(result) + _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return result
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (result, size)
+                self.current_bytes += size
+                while self.current_bytes > self.max_bytes:
+                    _, (_, evicted_size) = self._entries.popitem(last=False)
+                    self.current_bytes -= evicted_size
+                    self.evictions += 1
+        return result
+
+    def resize(self, max_bytes):
+        """メモリ上限を変更し、超過分を古い順に破棄する"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            while self._entries and self.current_bytes > max(max_bytes, 0):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """キャッシュの内容と統計をすべて破棄する"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """ヒット数・ミス数・破棄数などの統計を辞書で返す"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.active(),
+                "max_bytes": self.max_bytes,
+                "current_bytes": self.current_bytes,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+# clean_html と text_to_html で共有するキャッシュ
+shared_cache = ConversionCache()
+
+def configure(max_bytes=None, enabled=None):
+    """共有キャッシュのメモリ上限や有効/無効を設定する"""
+    if max_bytes is not None:
+        shared_cache.resize(max_bytes)
+    if enabled is not None:
+        shared_cache.enabled = enabled
+
+def stats():
+    """共有キャッシュの統計を返す"""
+    return shared_cache.stats()
+
+def disabled():
+    """with ブロックの間、このスレッドでは共有キャッシュを使わずに変換する (単発の変換用)"""
+    return shared_cache.disabled()
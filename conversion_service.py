@@ -0,0 +1,453 @@
+# 変換処理を常駐させるローカルの変換サービスと、そのクライアント (tkinter 不要)
+# 使い方: python conversion_service.py serve --workers 4
+#         python conversion_service.py convert export.xml -o export.csv  (サービスがなければこのプロセスで変換)
+import argparse
+import http.client
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import urllib.parse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 既定の待ち受けアドレス (ローカルからの接続だけを受け付ける)
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# アップロード・ダウンロードを読み書きする単位
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# クライアントがサービスへの接続を待つ秒数 (超えたらこのプロセスで変換する)
+CONNECT_TIMEOUT = 2.0
+
+# 処理時間の統計に使う直近のリクエスト数
+LATENCY_WINDOW = 1000
+
+# 変換の種類 → (入力の拡張子, 出力の拡張子, 出力の Content-Type, batch_convert.convert_file の xml_output)
+CONVERSIONS = {
+    "xml-to-csv": (".xml", ".csv", "text/csv", "csv"),
+    "xml-to-sqlite": (".xml", ".sqlite", "application/vnd.sqlite3", "sqlite"),
+    "csv-to-xml": (".csv", ".xml", "application/xml", "csv"),
+}
+
+# 変換のオプションとして受け付けるクエリパラメータ
+_TEXT_OPTIONS = ("encoding", "input_encoding")
+_FLAG_OPTIONS = ("step_rows", "discover_custom_fields")
+
+def conversion_for(input_file, output_file):
+    """入力・出力ファイルの拡張子から変換の種類 (CONVERSIONS のキー) を決める"""
+    input_ext = os.path.splitext(input_file)[1].lower()
+    output_ext = os.path.splitext(output_file)[1].lower()
+    for name, (from_ext, to_ext, _, _) in CONVERSIONS.items():
+        if input_ext == from_ext and output_ext == to_ext:
+            return name
+    raise ValueError(f"{input_file} から {output_file} への変換には対応していません "
+                     f"(XML→.csv/.sqlite、CSV→.xml のいずれか)")
+
+def _warm_worker():
+    """ワーカープロセスの初期化 (変換処理のモジュールを最初のリクエストの前に読み込んでおく)"""
+    import batch_convert  # noqa: F401
+
+def _ping():
+    return os.getpid()
+
+def _percentile(sorted_values, ratio):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * ratio))]
+
+class ConversionService:
+    """変換用のワーカープロセスのプールと、リクエストの統計を保持する
+
+    ワーカーは起動時にすべて立ち上げて変換処理のモジュールを読み込んでおくため、
+    リクエストごとのインタープリタの起動とインポートの時間がかからない。
+    アップロードと出力は spool_dir の一時ファイルを介して受け渡す (メモリに全体を置かない)。
+    """
+
+    def __init__(self, workers=None, spool_dir=None):
+        import batch_convert
+
+        self._convert_file = batch_convert.convert_file
+        self.workers = workers or os.cpu_count() or 1
+        self.spool_dir = spool_dir
+        self._lock = threading.Lock()
+        self._restart_lock = threading.Lock()   # プールの作り直しを1つのスレッドだけで行う
+        self._executor = self._start_executor()
+        self._started = time.monotonic()
+        self._uploading = 0         # アップロードを受信中のリクエスト数
+        self._in_flight = 0         # ワーカーに渡して結果を待っているリクエスト数
+        self._latencies = deque(maxlen=LATENCY_WINDOW)   # (全体の秒数, 変換の秒数)
+        self._counts = {"requests": 0, "succeeded": 0, "failed": 0, "rejected": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def _start_executor(self):
+        """ワーカーをすべて起動し、モジュールの読み込みが終わるまで待つ"""
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+        for future in [executor.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+        return executor
+
+    def convert(self, input_file, output_file, xml_output, options):
+        """ワーカーで1ファイルを変換し、batch_convert.convert_file と同じ (成否, 所要秒数, エラーメッセージ) を返す
+
+        ワーカープロセスが異常終了した場合はプールを作り直す。
+        """
+        with self._lock:
+            self._in_flight += 1
+            executor = self._executor
+        try:
+            future = executor.submit(self._convert_file, input_file, output_file, xml_output=xml_output, **options)
+            return future.result()
+        except BrokenProcessPool:
+            self._restart_executor(executor)
+            return False, 0.0, "ワーカープロセスが異常終了しました"
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _restart_executor(self, broken):
+        """異常終了したプール broken を新しいプールに置き換える (他のスレッドが置き換え済みなら何もしない)
+
+        新しいプールの起動は self._lock の外で行い、その間も統計の取得などを止めない。
+        """
+        with self._restart_lock:
+            with self._lock:
+                if self._executor is not broken:
+                    return
+            print("警告: ワーカープロセスが異常終了したため、プールを作り直します", flush=True)
+            executor = self._start_executor()
+            with self._lock:
+                self._executor = executor
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def upload_started(self):
+        with self._lock:
+            self._uploading += 1
+
+    def upload_finished(self, size):
+        with self._lock:
+            self._uploading -= 1
+            self._counts["bytes_in"] += size
+
+    def record(self, status, total_seconds, convert_seconds=0.0, bytes_out=0):
+        """リクエストの結果 (succeeded / failed / rejected) を統計に加える"""
+        with self._lock:
+            self._counts["requests"] += 1
+            self._counts[status] += 1
+            self._counts["bytes_out"] += bytes_out
+            if status != "rejected":
+                self._latencies.append((total_seconds, convert_seconds))
+
+    def metrics(self):
+        """キューの深さ・処理中の件数・処理時間などの統計を辞書で返す"""
+        with self._lock:
+            latencies = list(self._latencies)
+            metrics = {
+                "uptime_seconds": round(time.monotonic() - self._started, 3),
+                "workers": self.workers,
+                "uploading": self._uploading,
+                "in_flight": self._in_flight,
+                # ワーカーの空きを待っている変換の数
+                "queue_depth": max(0, self._in_flight - self.workers),
+                **self._counts,
+            }
+        for index, name in enumerate(("latency", "convert")):
+            values = sorted(latency[index] for latency in latencies)
+            metrics[f"{name}_seconds"] = {
+                "count": len(values),
+                "mean": round(sum(values) / len(values), 4) if values else 0.0,
+                "p50": round(_percentile(values, 0.5), 4),
+                "p95": round(_percentile(values, 0.95), 4),
+                "max": round(values[-1], 4) if values else 0.0,
+            }
+        return metrics
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """POST /<変換の種類>?オプション で本文のファイルを変換して返し、GET /metrics で統計を返す"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "TestLinkConversionService/1.0"
+
+    def log_message(self, format, *args):
+        # 既定では標準エラーに出るアクセスログを他の表示と揃える
+        print(f"{self.address_string()} {format % args}", flush=True)
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        if path == "/metrics":
+            self._send_json(200, self.server.service.metrics())
+        elif path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": f"不明なパスです: {path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        started = time.perf_counter()
+        url = urllib.parse.urlsplit(self.path)
+        conversion = CONVERSIONS.get(url.path.strip("/"))
+        if conversion is None:
+            self._reject(404, f"不明な変換です: {url.path} ({', '.join(CONVERSIONS)})", started)
+            return
+        try:
+            options = self._options(urllib.parse.parse_qs(url.query))
+        except ValueError as e:
+            self._reject(400, str(e), started)
+            return
+
+        input_ext, output_ext, content_type, xml_output = conversion
+        fd, input_file = tempfile.mkstemp(suffix=input_ext, dir=service.spool_dir)
+        output_file = os.path.splitext(input_file)[0] + "_out" + output_ext
+        try:
+            service.upload_started()
+            size = 0
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    size = self._receive_body(f)
+            finally:
+                service.upload_finished(size)
+
+            ok, convert_seconds, message = service.convert(input_file, output_file, xml_output, options)
+            if not ok:
+                service.record("failed", time.perf_counter() - started, convert_seconds)
+                self._send_json(422, {"error": message})
+                return
+            if options.get("encoding") and content_type.startswith("text/"):
+                content_type += f"; charset={options['encoding']}"
+            bytes_out = self._send_file(output_file, content_type, convert_seconds)
+            service.record("succeeded", time.perf_counter() - started, convert_seconds, bytes_out)
+        except ValueError as e:     # 本文の形式の誤り
+            service.record("rejected", time.perf_counter() - started)
+            self.close_connection = True
+            self._send_json(400, {"error": str(e)})
+        finally:
+            for path in (input_file, output_file):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _options(self, query):
+        """クエリパラメータから batch_convert.convert_file のオプションを作る"""
+        options = {}
+        for name, values in query.items():
+            if name in _TEXT_OPTIONS:
+                options[name] = values[-1] or None
+            elif name in _FLAG_OPTIONS:
+                if values[-1] not in ("0", "1"):
+                    raise ValueError(f"{name} には 0 か 1 を指定してください")
+                options[name] = values[-1] == "1"
+            else:
+                raise ValueError(f"不明なオプションです: {name}")
+        return options
+
+    def _receive_body(self, out):
+        """リクエストの本文を少しずつ読んで out に書き込み、バイト数を返す (chunked にも対応)"""
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            size = 0
+            while True:
+                line = self.rfile.readline(1024)
+                try:
+                    chunk_size = int(line.split(b";")[0].strip(), 16)
+                except ValueError:
+                    raise ValueError("chunked 形式の本文が不正です")
+                if chunk_size == 0:
+                    # トレーラーを読み飛ばす
+                    while self.rfile.readline(1024) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return size
+                self._copy_body(out, chunk_size)
+                self.rfile.readline(1024)
+                size += chunk_size
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            raise ValueError("Content-Length か chunked 形式で本文を送ってください")
+        self._copy_body(out, int(length))
+        return int(length)
+
+    def _copy_body(self, out, length):
+        remaining = length
+        while remaining:
+            data = self.rfile.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not data:
+                raise ValueError("本文が途中で切れています")
+            out.write(data)
+            remaining -= len(data)
+
+    def _reject(self, status, message, started):
+        """本文を読まずにエラーを返す (読まなかった本文が残るため接続は再利用しない)"""
+        self.server.service.record("rejected", time.perf_counter() - started)
+        self.close_connection = True
+        self._send_json(status, {"error": message})
+
+    def _send_file(self, path, content_type, convert_seconds):
+        """変換結果のファイルを少しずつ送り、バイト数を返す"""
+        size = os.path.getsize(path)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(size))
+        self.send_header("X-Conversion-Seconds", f"{convert_seconds:.3f}")
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile, STREAM_CHUNK_SIZE)
+        return size
+
+    def _send_json(self, status, value):
+        body = json.dumps(value, ensure_ascii=False, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class ConversionServer(ThreadingHTTPServer):
+    """リクエストごとのスレッドでアップロードを受け、変換を ConversionService のワーカーに渡すHTTPサーバー"""
+
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, ConversionRequestHandler)
+        self.service = service
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, spool_dir=None):
+    """変換サービスを起動し、Ctrl+C (または SIGTERM) で止めるまで待ち受ける"""
+    service = ConversionService(workers, spool_dir)
+    server = ConversionServer((host, port), service)
+
+    def stop(signum, frame):
+        # CIなどから SIGTERM で止めた場合も Ctrl+C と同じくワーカーを終了させる
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, stop)
+    print(f"変換サービスを http://{host}:{server.server_port}/ で起動しました (ワーカー {service.workers})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        print("変換サービスを停止しました", flush=True)
+
+class ServiceUnavailable(Exception):
+    """変換サービスに接続できない場合の例外"""
+
+def convert_with_service(input_file, output_file, host=DEFAULT_HOST, port=DEFAULT_PORT, **options):
+    """変換サービスに入力ファイルを送り、変換結果を output_file に書き込んで変換の秒数を返す
+
+    入力と出力は少しずつ送受信する。サービスに接続できない場合は ServiceUnavailable、
+    変換に失敗した場合は ValueError を送出する (書きかけの出力ファイルは残さない)。
+    options は batch_convert.convert_file と同じ encoding / input_encoding / step_rows / discover_custom_fields。
+    """
+    query = {}
+    for name, value in options.items():
+        if name not in _TEXT_OPTIONS + _FLAG_OPTIONS:
+            raise TypeError(f"不明なオプションです: {name}")
+        if value is not None:
+            query[name] = ("1" if value else "0") if name in _FLAG_OPTIONS else value
+    path = f"/{conversion_for(input_file, output_file)}?{urllib.parse.urlencode(query)}"
+
+    conn = http.client.HTTPConnection(host, port, timeout=CONNECT_TIMEOUT, blocksize=STREAM_CHUNK_SIZE)
+    try:
+        try:
+            conn.connect()
+        except OSError as e:
+            raise ServiceUnavailable(f"変換サービス ({host}:{port}) に接続できません: {e}")
+        # 大きなファイルの変換を待てるよう、接続後は時間制限をなくす
+        conn.sock.settimeout(None)
+        with open(input_file, 'rb') as f:
+            conn.request("POST", path, body=f, headers={"Content-Length": str(os.path.getsize(input_file))})
+        response = conn.getresponse()
+        if response.status != 200:
+            body = response.read().decode("utf-8", "replace")
+            try:
+                message = json.loads(body)["error"]
+            except (ValueError, KeyError, TypeError):
+                message = body or response.reason
+            raise ValueError(f"変換サービスでの変換に失敗しました: {message}")
+        try:
+            with open(output_file, 'wb') as out:
+                shutil.copyfileobj(response, out, STREAM_CHUNK_SIZE)
+        except BaseException:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            raise
+        return float(response.getheader("X-Conversion-Seconds", "0"))
+    finally:
+        conn.close()
+
+def convert(input_file, output_file, host=DEFAULT_HOST, port=DEFAULT_PORT, fallback=True, **options):
+    """変換サービスで変換し、サービスが起動していなければこのプロセスで変換する
+
+    (サービスを使ったか, 変換の秒数) を返す。変換に失敗した場合は ValueError を送出する。
+    """
+    try:
+        return True, convert_with_service(input_file, output_file, host, port, **options)
+    except ServiceUnavailable as e:
+        if not fallback:
+            raise
+        print(f"警告: {e}。このプロセスで変換します", flush=True)
+
+    # 変換処理のモジュールはサービスを使えない場合にだけ読み込む
+    import batch_convert
+    conversion = CONVERSIONS[conversion_for(input_file, output_file)]
+    ok, elapsed, message, _ = batch_convert.convert_file(input_file, output_file, xml_output=conversion[3], **options)
+    if not ok:
+        raise ValueError(message)
+    return False, elapsed
+
+def main(argv=None):
+    """serve でサービスを起動し、convert でファイルを変換する"""
+    parser = argparse.ArgumentParser(description="TestLink XML/CSV の変換サービス (常駐させたワーカーで変換する)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="変換サービスを起動する")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST, help=f"待ち受けるアドレス (既定: {DEFAULT_HOST})")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"待ち受けるポート (既定: {DEFAULT_PORT})")
+    serve_parser.add_argument("-w", "--workers", type=int, default=None, help="ワーカープロセス数 (既定: CPUコア数)")
+    serve_parser.add_argument("--spool-dir", default=None, help="アップロードと変換結果の一時ファイルを置くディレクトリ")
+
+    convert_parser = subparsers.add_parser("convert", help="ファイルを変換する (サービスがなければこのプロセスで変換)")
+    convert_parser.add_argument("input", help="変換するXMLまたはCSV")
+    convert_parser.add_argument("-o", "--output", required=True,
+                                help="出力ファイル (XMLは .csv / .sqlite、CSVは .xml。拡張子で変換の種類を決める)")
+    convert_parser.add_argument("--host", default=DEFAULT_HOST, help=f"変換サービスのアドレス (既定: {DEFAULT_HOST})")
+    convert_parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                                help=f"変換サービスのポート (既定: {DEFAULT_PORT})")
+    convert_parser.add_argument("--no-fallback", action="store_true",
+                                help="サービスに接続できない場合にこのプロセスで変換せず終了コード2で終わる")
+    convert_parser.add_argument("--encoding", default=None, help="XML→CSV変換で書き込むCSVの文字コード (既定: shift_jis)")
+    convert_parser.add_argument("--input-encoding", default=None,
+                                help="CSV→XML変換で読むCSVの文字コード (既定: ファイルの先頭から判定)")
+    convert_parser.add_argument("--step-rows", action="store_true", default=None,
+                                help="XML→CSV変換でステップごとに1行を出力する")
+    convert_parser.add_argument("--discover-custom-fields", action="store_true", default=None,
+                                help="XMLを事前に走査し、列定義にないカスタムフィールドも列として出力する")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        serve(args.host, args.port, args.workers, args.spool_dir)
+        return 0
+
+    options = {"encoding": args.encoding, "input_encoding": args.input_encoding, "step_rows": args.step_rows,
+               "discover_custom_fields": args.discover_custom_fields}
+    try:
+        used_service, elapsed = convert(args.input, args.output, args.host, args.port, not args.no_fallback, **options)
+    except ServiceUnavailable as e:
+        print(f"エラー: {e}")
+        return 2
+    except (OSError, ValueError) as e:
+        print(f"エラー: {str(e).splitlines()[0] if str(e) else traceback.format_exc().splitlines()[-1]}")
+        return 1
+    print(f"OK {args.input} -> {args.output} ({elapsed:.2f}秒{', 変換サービス' if used_service else ''})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+# ベンチマーク用の TestLink XML と対応するCSVを生成するツール
+# 使い方: python corpus_generator.py out/corpus --cases 10000 --steps 5 --html-depth 2
+import argparse
+import csv
+import random
+import xml.sax.saxutils as saxutils
+
+from xml_processor import CSV_HEADERS, CUSTOM_FIELD_NAMES, DEFAULT_PLAN
+import encoding_io
+
+# テキストの生成に使う語彙 (CSVは shift_jis で書くため、その範囲の文字だけを使う)
+JAPANESE_WORDS = [
+    "ログイン画面", "を開く", "ユーザー名", "パスワード", "を入力する", "ボタン", "をクリックする",
+    "設定", "が保存される", "エラーメッセージ", "が表示される", "仮想マシン", "を起動する",
+    "ストレージ", "バックアップ", "ネットワーク", "確認する", "一覧", "削除", "登録", "更新",
+    "管理者権限", "で実行する", "ノード", "クラスタ", "正常に", "完了すること",
+]
+ENGLISH_WORDS = [
+    "open", "the", "login", "page", "enter", "user", "name", "and", "password", "click",
+    "submit", "verify", "settings", "are", "saved", "start", "VM", "storage", "backup",
+    "network", "node", "cluster", "should", "complete", "successfully",
+]
+
+def _words(rng, count, japanese_ratio):
+    """日本語の割合に従って語をつなげた文を作る"""
+    parts = []
+    for _ in range(count):
+        if rng.random() < japanese_ratio:
+            parts.append(rng.choice(JAPANESE_WORDS))
+        else:
+            parts.append(" " + rng.choice(ENGLISH_WORDS))
+    return "".join(parts).strip()
+
+def custom_field_names_for(count):
+    """カスタムフィールド名の一覧 (既定の5つを先に使い、足りない分は連番で作る)"""
+    names = list(CUSTOM_FIELD_NAMES[:count])
+    names.extend(f"CustomField{i}" for i in range(len(names) + 1, count + 1))
+    return names
+
+def _html(lines, html_depth):
+    """テキスト行から TestLink のエディタが出力するようなHTMLを作る"""
+    parts = []
+    for i, line in enumerate(lines):
+        text = saxutils.escape(line)
+        if i % 3 == 1:
+            text = f"<strong>{text}</strong> &amp; 確認"
+        parts.append(f"<p>{text}</p>")
+    if html_depth > 0:
+        item = saxutils.escape(lines[0])
+        nested = ""
+        for _ in range(html_depth):
+            nested = f"<ol><li><p>{item}</p>{nested}</li></ol>"
+        parts.append(nested)
+    return "\n".join(parts)
+
+def _testcase(rng, number, settings):
+    """1テストケース分のデータ (ケース共通の項目とステップのテキスト) を作る"""
+    ratio = settings["japanese_ratio"]
+    summary = [_words(rng, 6, ratio) for _ in range(rng.randint(1, 3))]
+    preconditions = [_words(rng, 5, ratio) for _ in range(rng.randint(0, 2))]
+    steps = []
+    for step_number in range(1, settings["steps"] + 1):
+        actions = [_words(rng, 5, ratio) for _ in range(rng.randint(1, 3))]
+        expected = [_words(rng, 4, ratio) for _ in range(rng.randint(1, 2))]
+        steps.append((str(step_number), actions, expected, rng.choice(["1", "2"])))
+    return {
+        "internalid": str(100000 + number),
+        "externalid": str(number),
+        "version": str(rng.randint(1, 3)),
+        "name": f"TC{number:06d} {_words(rng, 3, ratio)}",
+        "summary": summary,
+        "preconditions": preconditions,
+        "importance": rng.choice(["1", "2", "3"]),
+        "execution_type": rng.choice(["1", "2"]),
+        "estimated_exec_duration": rng.choice(["", "5", "10.5"]),
+        "status": "1",
+        "active": "1",
+        "is_open": "1",
+        "steps": steps,
+        "custom_fields": {name: _words(rng, 2, ratio)
+                          for name in custom_field_names_for(settings["custom_fields"])},
+    }
+
+def _suite_paths(suite_depth, suites_per_level):
+    """ネストしたテストスイートの末端までのパス (スイート名のタプル) の一覧"""
+    paths = [()]
+    for level in range(suite_depth):
+        paths = [path + (f"スイート{level + 1}-{i + 1}",) for path in paths for i in range(suites_per_level)]
+    return paths
+
+def iter_corpus(cases=1000, steps=3, suite_depth=2, suites_per_level=3, custom_fields=5,
+                japanese_ratio=0.7, seed=0):
+    """(末端スイートのパス, テストケースのデータ) を順に返す
+
+    同じ引数であれば常に同じ内容になる。
+    """
+    settings = {"steps": steps, "custom_fields": custom_fields, "japanese_ratio": japanese_ratio}
+    rng = random.Random(seed)
+    paths = _suite_paths(suite_depth, suites_per_level)
+    for number in range(1, cases + 1):
+        # テストケースを末端スイートに均等に割り振る (スイート順に並ぶ)
+        path = paths[(number - 1) * len(paths) // cases]
+        yield path, _testcase(rng, number, settings)
+
+def _write_testcase(out, tc, html_depth, indent):
+    """テストケース1件をTestLinkのエクスポート形式で書き込む"""
+    name = saxutils.quoteattr(tc["name"])
+    out.write(f'{indent}<testcase internalid="{tc["internalid"]}" name={name}>\n')
+    inner = indent + "\t"
+    out.write(f'{inner}<node_order><![CDATA[0]]></node_order>\n')
+    out.write(f'{inner}<externalid><![CDATA[{tc["externalid"]}]]></externalid>\n')
+    out.write(f'{inner}<version><![CDATA[{tc["version"]}]]></version>\n')
+    out.write(f'{inner}<summary><![CDATA[{_html(tc["summary"], html_depth)}]]></summary>\n')
+    preconditions = _html(tc["preconditions"], 0) if tc["preconditions"] else ""
+    out.write(f'{inner}<preconditions><![CDATA[{preconditions}]]></preconditions>\n')
+    out.write(f'{inner}<execution_type><![CDATA[{tc["execution_type"]}]]></execution_type>\n')
+    out.write(f'{inner}<importance><![CDATA[{tc["importance"]}]]></importance>\n')
+    out.write(f'{inner}<estimated_exec_duration>{tc["estimated_exec_duration"]}</estimated_exec_duration>\n')
+    out.write(f'{inner}<status>{tc["status"]}</status>\n')
+    out.write(f'{inner}<is_open>{tc["is_open"]}</is_open>\n')
+    out.write(f'{inner}<active>{tc["active"]}</active>\n')
+    out.write(f'{inner}<steps>\n')
+    for step_number, actions, expected, exec_type in tc["steps"]:
+        out.write(f'{inner}\t<step>\n')
+        out.write(f'{inner}\t\t<step_number><![CDATA[{step_number}]]></step_number>\n')
+        out.write(f'{inner}\t\t<actions><![CDATA[{_html(actions, html_depth)}]]></actions>\n')
+        out.write(f'{inner}\t\t<expectedresults><![CDATA[{_html(expected, 0)}]]></expectedresults>\n')
+        out.write(f'{inner}\t\t<execution_type><![CDATA[{exec_type}]]></execution_type>\n')
+        out.write(f'{inner}\t</step>\n')
+    out.write(f'{inner}</steps>\n')
+    if tc["custom_fields"]:
+        out.write(f'{inner}<custom_fields>\n')
+        for cf_name, cf_value in tc["custom_fields"].items():
+            out.write(f'{inner}\t<custom_field>\n')
+            out.write(f'{inner}\t\t<name><![CDATA[{cf_name}]]></name>\n')
+            out.write(f'{inner}\t\t<value><![CDATA[{cf_value}]]></value>\n')
+            out.write(f'{inner}\t</custom_field>\n')
+        out.write(f'{inner}</custom_fields>\n')
+    out.write(f'{indent}</testcase>\n')
+
+def write_xml(path, html_depth=1, **options):
+    """TestLink のエクスポート形式 (ルートは testsuite) のXMLを書き込み、テストケース数を返す"""
+    count = 0
+    open_path = ()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuite id="1" name="" >\n')
+        for suite_path, tc in iter_corpus(**options):
+            # 前のテストケースと共通でないスイートを閉じ、新しいスイートを開く
+            common = 0
+            while common < min(len(open_path), len(suite_path)) and open_path[common] == suite_path[common]:
+                common += 1
+            for depth in range(len(open_path), common, -1):
+                f.write("\t" * depth + "</testsuite>\n")
+            for depth in range(common, len(suite_path)):
+                f.write("\t" * (depth + 1) + f'<testsuite name={saxutils.quoteattr(suite_path[depth])} >\n')
+            open_path = suite_path
+            _write_testcase(f, tc, html_depth, "\t" * (len(suite_path) + 1))
+            count += 1
+        for depth in range(len(open_path), 0, -1):
+            f.write("\t" * depth + "</testsuite>\n")
+        f.write('</testsuite>\n')
+    return count
+
+def write_csv(path, html_depth=1, **options):
+    """write_xml と同じテストケースをCSV→XML変換用のCSV (1ステップ1行) で書き込み、行数を返す
+
+    ケース共通の列は各ステップ行に繰り返し出力する。html_depth はCSVでは使わない。
+    """
+    custom_field_names = custom_field_names_for(options.get("custom_fields", 5))
+    count = 0
+    with encoding_io.open_text_writer(path) as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        # 末尾に固定する列 (テストスイートパス・順序) はカスタムフィールドの後ろに置く (XML→CSV変換の出力と同じ)
+        trailing_headers = DEFAULT_PLAN.headers[len(DEFAULT_PLAN.headers) - DEFAULT_PLAN.trailing:]
+        writer.writerow([header for header in CSV_HEADERS if header not in trailing_headers]
+                        + custom_field_names + trailing_headers)
+        # 出力したスイートのパス → 順番をつないだもの (write_xml はスイートに node_order を書かないため兄弟内の順番)
+        suite_orders = {(): ""}
+        child_counts = {}
+        for suite_path, tc in iter_corpus(**options):
+            suite_name = suite_path[-1] if suite_path else ""
+            for depth in range(1, len(suite_path) + 1):
+                if suite_path[:depth] not in suite_orders:
+                    parent = suite_path[:depth - 1]
+                    child_counts[parent] = child_counts.get(parent, 0) + 1
+                    suite_orders[suite_path[:depth]] = "/".join(filter(None, (suite_orders[parent],
+                                                                              str(child_counts[parent]))))
+            steps = tc["steps"] or [("", [], [], tc["execution_type"])]
+            for step_number, actions, expected, exec_type in steps:
+                row = [
+                    tc["internalid"], tc["externalid"], tc["version"], tc["name"],
+                    "\n".join(tc["summary"]), tc["importance"], "\n".join(tc["preconditions"]),
+                    step_number, "\n".join(actions), "\n".join(expected), exec_type,
+                    tc["estimated_exec_duration"], tc["status"], tc["active"], tc["is_open"], suite_name,
+                ]
+                row.extend(tc["custom_fields"].get(name, "") for name in custom_field_names)
+                row.extend(("/".join(suite_path), suite_orders[suite_path]))
+                writer.writerow(row)
+                count += 1
+    return count
+
+# 壊れた・悪意のあるエクスポートを想定した入力の種類 (clean_html などが線形時間で終わることの確認用)
+ADVERSARIAL_KINDS = {
+    "unclosed-li": "閉じタグのない <li> の繰り返し",
+    "unclosed-p": "閉じタグのない <p> の繰り返し",
+    "unclosed-tags": "'>' で閉じていない '<' の繰り返し",
+    "unclosed-lists": "閉じタグも '>' もない <ul の繰り返し",
+    "deep-nesting": "深くネストしたリスト",
+    "deep-nesting-unclosed": "閉じタグのない深いネスト",
+    "huge-cdata": "1つの巨大なCDATAブロック",
+    "unclosed-cdata": "閉じていないCDATA表記の繰り返し",
+    "unclosed-double-cdata": "閉じていない二重CDATAの繰り返し",
+}
+
+def adversarial_html(kind, length):
+    """種類 kind (ADVERSARIAL_KINDS) の敵対的なHTMLを約 length 文字で返す"""
+    if kind == "deep-nesting":
+        depth = max(1, length // 18)
+        return "<ul><li>" * depth + "項目" + "</li></ul>" * depth
+    if kind == "huge-cdata":
+        paragraph = "<p>手順を実行する &amp; <strong>結果</strong>を確認する<br />次の行</p>\n"
+        return "<![CDATA[" + paragraph * max(1, length // len(paragraph)) + "]]>"
+    unit = {
+        "unclosed-li": "<li>項目",
+        "unclosed-p": "<p>段落",
+        "unclosed-tags": "<span 属性",
+        "unclosed-lists": "<ul 属性",
+        "deep-nesting-unclosed": "<ol><li><p>項目",
+        "unclosed-cdata": "<![CDATA[本文",
+        "unclosed-double-cdata": "<![CDATA[<![CDATA[本文",
+    }[kind]
+    return unit * max(1, length // len(unit))
+
+def write_adversarial_xml(path, kind, length):
+    """サマリ・アクション・期待結果が adversarial_html(kind, length) のテストケース1件のXMLを書き込む
+
+    huge-cdata は本物のCDATAセクションとして、それ以外はエスケープしたテキストとして書き込む
+    (閉じていないCDATA表記をそのまま書くとXMLとして読めないため)。
+    """
+    html = adversarial_html(kind, length)
+    body = html if kind == "huge-cdata" else saxutils.escape(html)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<testcases>\n')
+        f.write(f'<testcase internalid="1" name={saxutils.quoteattr(kind)}>\n')
+        f.write(f'\t<summary>{body}</summary>\n')
+        f.write('\t<steps>\n\t\t<step>\n\t\t\t<step_number>1</step_number>\n')
+        f.write(f'\t\t\t<actions>{body}</actions>\n\t\t\t<expectedresults>{body}</expectedresults>\n')
+        f.write('\t\t</step>\n\t</steps>\n</testcase>\n</testcases>\n')
+
+def add_corpus_arguments(parser):
+    """コーパスの設定用のコマンドライン引数を追加する (ベンチマークと共用)"""
+    parser.add_argument("--steps", type=int, default=3, help="テストケースあたりのステップ数 (既定: 3)")
+    parser.add_argument("--suite-depth", type=int, default=2, help="テストスイートのネストの深さ (既定: 2)")
+    parser.add_argument("--suites-per-level", type=int, default=3, help="各階層のテストスイート数 (既定: 3)")
+    parser.add_argument("--custom-fields", type=int, default=5, help="カスタムフィールド数 (既定: 5)")
+    parser.add_argument("--html-depth", type=int, default=1, help="HTMLのリストのネストの深さ (既定: 1)")
+    parser.add_argument("--japanese-ratio", type=float, default=0.7, help="テキスト中の日本語の割合 (既定: 0.7)")
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード (既定: 0)")
+
+def corpus_options(args):
+    """add_corpus_arguments で追加した引数から write_xml / write_csv の引数を作る"""
+    return {
+        "steps": args.steps, "suite_depth": args.suite_depth, "suites_per_level": args.suites_per_level,
+        "custom_fields": args.custom_fields, "html_depth": args.html_depth,
+        "japanese_ratio": args.japanese_ratio, "seed": args.seed,
+    }
+
+def main(argv=None):
+    """コマンドライン引数に従ってXMLとCSVを生成する"""
+    parser = argparse.ArgumentParser(description="ベンチマーク用の TestLink XML と対応するCSVを生成する")
+    parser.add_argument("output", help="出力ファイル名 (拡張子なし。.xml と .csv を作る)")
+    parser.add_argument("--cases", type=int, default=1000, help="テストケース数 (既定: 1000)")
+    add_corpus_arguments(parser)
+    args = parser.parse_args(argv)
+
+    options = corpus_options(args)
+    cases = write_xml(args.output + ".xml", cases=args.cases, **options)
+    rows = write_csv(args.output + ".csv", cases=args.cases, **options)
+    print(f"{args.output}.xml: {cases} テストケース, {args.output}.csv: {rows} 行")
+
+if __name__ == "__main__":
+    main()
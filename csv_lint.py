@@ -0,0 +1,269 @@
+# CSVを変換せずに検査するコマンドラインツール (XMLを組み立てずに1回の読み込みで検査する)
+# 使い方: python csv_lint.py upload.csv -o report.json  (エラーがあれば終了コード1)
+import argparse
+import csv
+import json
+import os
+import sys
+
+from csv_reader import REQUIRED_HEADERS, OPTIONAL_HEADERS
+import encoding_io
+from xml_builder import REQUIRED_TESTCASE_FIELDS
+
+# 重要度 (1: 低, 2: 中, 3: 高) と実行タイプ (1: 手動, 2: 自動) の値
+IMPORTANCE_VALUES = ("1", "2", "3")
+EXECUTION_TYPE_VALUES = ("1", "2")
+
+# 問題の重大度
+SEVERITY_ERROR = "error"        # 変換時にその行やテストケースがスキップされる (または変換できない)
+SEVERITY_WARNING = "warning"    # 変換はされるが内容に誤りがある可能性がある
+
+# 1ファイルで記録する問題の既定の上限 (超えた分は件数だけ数える)
+DEFAULT_MAX_PROBLEMS = 1000
+
+def lint_csv(csv_file, progress=None, max_problems=DEFAULT_MAX_PROBLEMS, encoding=None):
+    """CSVファイルを1行ずつ読み込んで検査し、問題の一覧を含むレポートの辞書を返す
+
+    ヘッダー、列数、必須データ、ステップ番号 (数値・重複・順序)、重要度と実行タイプの値を検査する。
+    ElementTree やHTMLへの変換は行わないため、変換よりはるかに速い。
+    問題の line はCSVファイル上の行番号 (複数行のセルを含む行は開始行)。
+    encoding を省略すると文字コードを先頭から判定し、レポートの encoding に記録する。
+    """
+    problems = []
+    counts = {SEVERITY_ERROR: 0, SEVERITY_WARNING: 0}
+
+    def report(line, severity, code, message, column=None):
+        counts[severity] += 1
+        if max_problems is None or len(problems) < max_problems:
+            problem = {"line": line, "severity": severity, "code": code, "message": message}
+            if column is not None:
+                problem["column"] = column
+            problems.append(problem)
+
+    records = 0
+    testcases = 0
+    with encoding_io.open_text_reader(csv_file, encoding) as f:
+        encoding = f.encoding
+        if progress is not None:
+            progress.track(f.buffer.tell, os.path.getsize(csv_file))
+        reader = csv.reader(f)
+        headers = next(reader, None)
+        if headers is None:
+            report(1, SEVERITY_ERROR, "no_header", "CSVファイルにヘッダー行がありません")
+            return _lint_report(csv_file, records, testcases, counts, problems, encoding)
+
+        header_indices = _check_headers(headers, report)
+        checker = None
+        if header_indices is not None:
+            checker = _TestcaseChecker(header_indices, report)
+
+        start = reader.line_num + 1
+        for row in reader:
+            line, start = start, reader.line_num + 1
+            records += 1
+            if progress is not None:
+                progress.update()
+            if len(row) != len(headers):
+                report(line, SEVERITY_ERROR, "column_count",
+                       f"列数がヘッダー ({len(headers)}列) と異なります ({len(row)}列)。変換時にスキップされます")
+                continue
+            if any("\ufffd" in value for value in row):
+                report(line, SEVERITY_WARNING, "decode_error", f"文字コード {encoding} として読めない文字があります")
+            if checker is not None:
+                checker.check(line, row)
+
+        if records == 0:
+            report(start, SEVERITY_ERROR, "no_data", "CSVファイルにデータ行がありません")
+        if checker is not None:
+            checker.finish()
+            testcases = checker.testcases
+    return _lint_report(csv_file, records, testcases, counts, problems, encoding)
+
+def _lint_report(csv_file, records, testcases, counts, problems, encoding=None):
+    """検査結果のレポートの辞書を作る"""
+    return {
+        "file": csv_file,
+        "encoding": encoding,
+        "valid": counts[SEVERITY_ERROR] == 0,
+        "records": records,
+        "testcases": testcases,
+        "errors": counts[SEVERITY_ERROR],
+        "warnings": counts[SEVERITY_WARNING],
+        "truncated": len(problems) < counts[SEVERITY_ERROR] + counts[SEVERITY_WARNING],
+        "problems": problems,
+    }
+
+def _check_headers(headers, report):
+    """ヘッダー行を検査し、列の位置を返す (必須ヘッダーがなければ None)"""
+    seen = set()
+    for header in headers:
+        if header in seen:
+            report(1, SEVERITY_WARNING, "duplicate_header", f"ヘッダー「{header}」が重複しています (最初の列を使います)",
+                   header)
+        seen.add(header)
+
+    missing = [header for header in REQUIRED_HEADERS if header not in seen]
+    for header in missing:
+        report(1, SEVERITY_ERROR, "missing_header", f"必要なヘッダー「{header}」がありません", header)
+    if missing:
+        return None
+
+    header_indices = {header: headers.index(header) for header in REQUIRED_HEADERS}
+    header_indices.update((header, headers.index(header) if header in seen else -1) for header in OPTIONAL_HEADERS)
+    return header_indices
+
+class _TestcaseChecker:
+    """データ行をテストケースごとにまとめながら検査する (build_testcase_element と同じ規則)
+
+    連続していない行は変換時と同じく最初に現れたテストケースの続きとして扱う
+    (テストケースの値は最初の行だけを検査し、ステップ番号の重複と順序は全体で検査する)。
+    処理済みのテストケースはキーとステップ番号だけを保持する (1から連番なら最大の番号だけ)。
+    """
+
+    def __init__(self, header_indices, report):
+        self.report = report
+        self.id_idx = header_indices.get("ID", -1)
+        self.name_idx = header_indices["テストケース名"]
+        self.version_idx = header_indices["バージョン"]
+        self.importance_idx = header_indices["重要度"]
+        self.step_number_idx = header_indices["ステップ番号"]
+        self.actions_idx = header_indices["アクション（手順）"]
+        self.expected_idx = header_indices["期待結果"]
+        self.exec_type_idx = header_indices["実行タイプ"]
+        self.required = [(header, header_indices[header]) for header in REQUIRED_TESTCASE_FIELDS]
+        self.testcases = 0
+        self.closed_steps = {}  # 処理済みのキー -> ステップ番号 (1からの連番なら最大の番号、そうでなければ集合)
+        self.current_key = None
+        self.step_numbers = set()
+        self.last_step_number = 0
+
+    def check(self, line, row):
+        """データ行を1行検査する"""
+        tc_id = row[self.id_idx].strip() if self.id_idx != -1 else ""
+        tc_name = row[self.name_idx].strip()
+        if tc_id:
+            key = f"ID_{tc_id}"
+        elif tc_name:
+            key = f"NAME_{tc_name}"
+        else:
+            self.report(line, SEVERITY_ERROR, "no_key", "テストケースIDも名前もありません。変換時にスキップされます")
+            return
+
+        if key != self.current_key:
+            self.finish()
+            self.current_key = key
+            if key in self.closed_steps:
+                self.report(line, SEVERITY_WARNING, "non_contiguous",
+                            f"テストケース {key} の行が連続していません (変換時は一時ファイルでグループ化し直します)")
+                steps = self.closed_steps.pop(key)
+                if isinstance(steps, int):
+                    self.step_numbers = set(range(1, steps + 1))
+                    self.last_step_number = steps
+                else:
+                    self.step_numbers = set(steps)
+                    self.last_step_number = max(steps, default=0)
+            else:
+                self.testcases += 1
+                self._check_first_row(line, row)
+
+        self._check_step(line, row)
+
+    def _check_first_row(self, line, row):
+        """テストケースの最初の行 (テストケースの値が使われる行) を検査する"""
+        has_step = bool(row[self.step_number_idx].strip())
+        for header, idx in self.required:
+            if not row[idx].strip():
+                if header == "実行タイプ" and has_step:
+                    continue
+                self.report(line, SEVERITY_ERROR, "missing_field",
+                            f"必須データ「{header}」が空です。変換時にテストケースがスキップされます", header)
+                return
+
+        version = row[self.version_idx].strip()
+        if not version.isdigit():
+            self.report(line, SEVERITY_WARNING, "invalid_version", f"バージョン「{version}」が数値ではありません",
+                        "バージョン")
+        importance = row[self.importance_idx].strip()
+        if importance not in IMPORTANCE_VALUES:
+            self.report(line, SEVERITY_ERROR, "invalid_importance",
+                        f"重要度「{importance}」は {'/'.join(IMPORTANCE_VALUES)} のいずれかにしてください", "重要度")
+        exec_type = row[self.exec_type_idx].strip()
+        if not has_step and exec_type not in EXECUTION_TYPE_VALUES:
+            self._invalid_execution_type(line, exec_type)
+
+    def _check_step(self, line, row):
+        """ステップ番号のある行を検査する"""
+        step_number = row[self.step_number_idx].strip()
+        if not step_number:
+            return
+        if not step_number.isdigit() or int(step_number) == 0:
+            self.report(line, SEVERITY_ERROR, "invalid_step_number",
+                        f"ステップ番号「{step_number}」が正の整数ではありません", "ステップ番号")
+        else:
+            number = int(step_number)
+            if number in self.step_numbers:
+                self.report(line, SEVERITY_ERROR, "duplicate_step_number",
+                            f"テストケース {self.current_key} のステップ番号 {number} が重複しています", "ステップ番号")
+            elif number < self.last_step_number:
+                self.report(line, SEVERITY_WARNING, "step_order",
+                            f"ステップ番号 {number} が前のステップ ({self.last_step_number}) より小さくなっています",
+                            "ステップ番号")
+            self.step_numbers.add(number)
+            self.last_step_number = max(self.last_step_number, number)
+
+        if not row[self.actions_idx].strip() or not row[self.expected_idx].strip():
+            self.report(line, SEVERITY_WARNING, "empty_step",
+                        f"ステップ番号 {step_number} でアクションまたは期待結果が空です")
+        exec_type = row[self.exec_type_idx].strip()
+        if exec_type not in EXECUTION_TYPE_VALUES:
+            self._invalid_execution_type(line, exec_type)
+
+    def _invalid_execution_type(self, line, exec_type):
+        self.report(line, SEVERITY_ERROR, "invalid_execution_type",
+                    f"実行タイプ「{exec_type}」は {'/'.join(EXECUTION_TYPE_VALUES)} のいずれかにしてください", "実行タイプ")
+
+    def finish(self):
+        """処理中のテストケースを閉じる"""
+        if self.current_key is not None:
+            steps = self.step_numbers
+            if len(steps) == self.last_step_number:
+                steps = self.last_step_number
+            self.closed_steps[self.current_key] = steps
+        self.current_key = None
+        self.step_numbers = set()
+        self.last_step_number = 0
+
+def main(argv=None):
+    """コマンドライン引数のCSVファイルを検査し、JSONレポートを出力する"""
+    parser = argparse.ArgumentParser(description="TestLink用CSVを変換せずに検査する (エラーがあれば終了コード1)")
+    parser.add_argument("csv_files", nargs="+", help="検査するCSVファイル")
+    parser.add_argument("-o", "--output", default=None, help="JSONレポートの出力先 (既定: 標準出力)")
+    parser.add_argument("--max-problems", type=int, default=DEFAULT_MAX_PROBLEMS,
+                        help=f"1ファイルで記録する問題の上限 (既定: {DEFAULT_MAX_PROBLEMS})")
+    parser.add_argument("--encoding", default=None, help="CSVの文字コード (既定: ファイルの先頭から判定)")
+    args = parser.parse_args(argv)
+
+    reports = []
+    for csv_file in args.csv_files:
+        try:
+            reports.append(lint_csv(csv_file, max_problems=args.max_problems, encoding=args.encoding))
+        except OSError as e:
+            reports.append(_lint_report(csv_file, 0, 0, {SEVERITY_ERROR: 1, SEVERITY_WARNING: 0},
+                                        [{"line": 0, "severity": SEVERITY_ERROR, "code": "unreadable",
+                                          "message": f"CSVファイルを読み込めません: {e}"}]))
+
+    result = {"valid": all(report["valid"] for report in reports), "files": reports}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        for report in reports:
+            status = "OK" if report["valid"] else "NG"
+            print(f"{status} {report['file']}: {report['testcases']}件, エラー {report['errors']}件, "
+                  f"警告 {report['warnings']}件")
+    else:
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    return 0 if result["valid"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
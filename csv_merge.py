@@ -0,0 +1,261 @@
+# 複数のCSVを1つの TestLink インポート用XMLにまとめるコマンドラインツール
+# 使い方: python csv_merge.py team_a.csv team_b.csv -o merged.xml --policy highest-version
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import traceback
+
+from csv_reader import iter_csv_rows, get_header_indices
+from xml_builder import iter_keyed_rows
+from records import CsvLayout, TestCase
+from csv_to_xml import write_testcase_groups
+
+# 同じテストケースが複数の入力にある場合の扱い
+POLICY_LAST_WINS = "last-wins"                # 後の入力の内容を使う
+POLICY_HIGHEST_VERSION = "highest-version"    # バージョンが大きい方を使う (同じなら後の入力)
+POLICY_FAIL = "fail"                          # 内容が異なればエラーにする
+POLICIES = (POLICY_LAST_WINS, POLICY_HIGHEST_VERSION, POLICY_FAIL)
+
+# テストケースの索引の置き場所
+INDEX_MEMORY = "memory"     # メモリ上の辞書
+INDEX_DISK = "disk"         # 一時ファイル (SQLite)。メモリに保持するのは処理中のテストケースだけ
+INDEXES = (INDEX_MEMORY, INDEX_DISK)
+
+# 一時ファイルの索引をまとめて確定する件数
+_COMMIT_SIZE = 10000
+
+class MergeConflictError(ValueError):
+    """POLICY_FAIL で同じテストケースの内容が入力によって異なる場合のエラー"""
+
+def _content(record):
+    """POLICY_FAIL で比べるテストケースの内容 (警告の表示用のステップの行番号は除く)"""
+    values = record.values()
+    return values[:len(values) - len(record.steps)] + [
+        (step.number, step.actions, step.expected, step.execution_type) for step in record.steps]
+
+def _version_number(record):
+    """比較用のバージョン番号 (数値でなければ -1)"""
+    return int(record.version) if record.version.isdigit() else -1
+
+class MemoryMergeIndex:
+    """キー → (入力の番号, TestCase) をメモリ上の辞書に保持する索引"""
+
+    def __init__(self):
+        self._entries = {}
+
+    def empty_like(self):
+        """同じ種類の空の索引を返す (1ファイル分のテストケースをまとめる作業用)"""
+        return MemoryMergeIndex()
+
+    def get(self, key):
+        """(入力の番号, TestCase) を返す。なければ None"""
+        return self._entries.get(key)
+
+    def put(self, key, source, record):
+        """キーの内容を登録・置き換える (最初に登録した順番は変わらない)"""
+        self._entries[key] = (source, record)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def items(self):
+        """(キー, TestCase) を最初に登録した順に返す"""
+        for key, (_, record) in self._entries.items():
+            yield key, record
+
+    def close(self):
+        self._entries = {}
+
+class DiskMergeIndex:
+    """キー → (入力の番号, TestCase) を一時ファイル (SQLite) に保持する索引
+
+    TestCase は values() のJSONとして保存する。順番は行の rowid (置き換えても変わらない) で保つ。
+    """
+
+    def __init__(self, spill_dir=None):
+        self.spill_dir = spill_dir
+        fd, self.path = tempfile.mkstemp(suffix=".sqlite", dir=spill_dir)
+        os.close(fd)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode = OFF")
+        self._conn.execute("PRAGMA synchronous = OFF")
+        self._conn.execute("CREATE TABLE entries (key TEXT UNIQUE, source INTEGER, record TEXT)")
+        self._count = 0
+        self._uncommitted = 0
+
+    def empty_like(self):
+        """同じ種類の空の索引を返す (1ファイル分のテストケースをまとめる作業用)"""
+        return DiskMergeIndex(self.spill_dir)
+
+    def get(self, key):
+        """(入力の番号, TestCase) を返す。なければ None"""
+        row = self._conn.execute("SELECT source, record FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], TestCase.from_values(json.loads(row[1]))
+
+    def put(self, key, source, record):
+        """キーの内容を登録・置き換える (最初に登録した順番は変わらない)"""
+        value = json.dumps(record.values(), ensure_ascii=False)
+        updated = self._conn.execute("UPDATE entries SET source = ?, record = ? WHERE key = ?",
+                                     (source, value, key)).rowcount
+        if not updated:
+            self._conn.execute("INSERT INTO entries (key, source, record) VALUES (?, ?, ?)", (key, source, value))
+            self._count += 1
+        self._uncommitted += 1
+        if self._uncommitted >= _COMMIT_SIZE:
+            self._conn.commit()
+            self._uncommitted = 0
+
+    def __len__(self):
+        return self._count
+
+    def items(self):
+        """(キー, TestCase) を最初に登録した順に返す"""
+        self._conn.commit()
+        for key, value in self._conn.execute("SELECT key, record FROM entries ORDER BY rowid"):
+            yield key, TestCase.from_values(json.loads(value))
+
+    def close(self):
+        self._conn.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def _iter_file_blocks(csv_file, input_encoding=None):
+    """CSVファイルのデータ行を、同じテストケースの連続した行ごとに (グループキー, TestCase) にして返す
+
+    グループキーは変換時と同じ xml_builder.iter_keyed_rows のキー (IDまたは名前) で、入力をまたいだ
+    マージにもこのキーを使う。行が連続していないテストケースは複数回返す (呼び出し側でステップをつなぐ)。
+    """
+    rows = iter_csv_rows(csv_file, encoding=input_encoding)
+    try:
+        header_indices = get_header_indices(next(rows))
+        layout = CsvLayout(header_indices)
+        for key, keyed_rows in itertools.groupby(iter_keyed_rows(rows, header_indices),
+                                                 key=lambda keyed_row: keyed_row[0]):
+            yield key, layout.testcase([row for _, row in keyed_rows])
+    finally:
+        rows.close()
+
+def _stage_file(csv_file, source, staging, input_encoding=None):
+    """1ファイル分のテストケースを staging (空の索引) にまとめる
+
+    同じファイルの中で行が連続していないテストケースは、変換時と同じく最初の行の値に
+    ステップをつないで1件にする。
+    """
+    for key, record in _iter_file_blocks(csv_file, input_encoding):
+        existing = staging.get(key)
+        if existing is None:
+            staging.put(key, source, record)
+        else:
+            merged = existing[1]
+            merged.steps.extend(record.steps)
+            staging.put(key, source, merged)
+
+def merge_testcases(csv_files, policy=POLICY_LAST_WINS, index=None, input_encoding=None):
+    """CSVファイルを順に読み込み、テストケースをキー (IDまたは名前) ごとに1件にまとめた索引と集計を返す
+
+    各ファイルのテストケースはまずファイルの中で1件にまとめ (行が連続していない場合も変換時と同じく
+    1件にする)、同じキーのテストケースが複数の入力にある場合はまとめた内容どうしを policy に従って選ぶ。
+    index (MemoryMergeIndex / DiskMergeIndex) を省略するとメモリ上の索引を使う。
+    集計の testcases は各入力のテストケース数の合計。
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"競合時の扱いは {', '.join(POLICIES)} のいずれかにしてください: {policy}")
+    index = index if index is not None else MemoryMergeIndex()
+    stats = {"files": len(csv_files), "testcases": 0, "duplicates": 0, "replaced": 0, "kept": 0}
+
+    for source, csv_file in enumerate(csv_files):
+        if not os.path.exists(csv_file):
+            raise FileNotFoundError(f"CSVファイルが見つかりません: {csv_file}")
+        staging = index.empty_like()
+        try:
+            _stage_file(csv_file, source, staging, input_encoding)
+            stats["testcases"] += len(staging)
+            for key, record in staging.items():
+                existing = index.get(key)
+                if existing is None:
+                    index.put(key, source, record)
+                    continue
+
+                stats["duplicates"] += 1
+                existing_source, existing_record = existing
+                if policy == POLICY_FAIL:
+                    if _content(existing_record) != _content(record):
+                        raise MergeConflictError(
+                            f"テストケース {key} の内容が {csv_files[existing_source]} と {csv_file} で異なります")
+                    stats["kept"] += 1
+                elif policy == POLICY_HIGHEST_VERSION and _version_number(record) < _version_number(existing_record):
+                    stats["kept"] += 1
+                else:
+                    index.put(key, source, record)
+                    stats["replaced"] += 1
+        finally:
+            staging.close()
+
+    stats["merged"] = len(index)
+    return index, stats
+
+def merge_csv_to_xml(csv_files, output_xml_file, policy=POLICY_LAST_WINS, index_type=INDEX_MEMORY, spill_dir=None,
+                     shard_bytes=None, shard_cases=None, input_encoding=None):
+    """複数のCSVファイルをマージして1つのXMLファイル (または分割したXMLファイル) に変換し、集計を返す
+
+    メモリ使用量は入力の行数ではなくテストケース (キー) の数に比例する。
+    index_type が INDEX_DISK の場合はテストケースの内容 (ファイルごとにまとめる途中のものも含む) を
+    一時ファイルに置き、メモリには処理中のテストケースだけを保持する。
+    shard_bytes / shard_cases は csv_to_xml.write_testcase_groups と同じ。
+    """
+    if index_type not in INDEXES:
+        raise ValueError(f"索引の種類は {', '.join(INDEXES)} のいずれかにしてください: {index_type}")
+    index = DiskMergeIndex(spill_dir) if index_type == INDEX_DISK else MemoryMergeIndex()
+    try:
+        try:
+            _, stats = merge_testcases(csv_files, policy, index, input_encoding)
+            if not len(index):
+                raise ValueError("CSVファイルにデータ行がありません")
+            write_testcase_groups(index.items(), output_xml_file, shard_bytes=shard_bytes, shard_cases=shard_cases)
+            return stats
+        finally:
+            index.close()
+
+    except MergeConflictError:
+        raise
+    except ValueError as ve: # CSVフォーマットエラーなど
+        raise Exception(f"CSVファイルの処理中にエラーが発生しました: {str(ve)}\n{traceback.format_exc()}")
+    except Exception as e:
+        raise Exception(f"CSVのマージ中に予期せぬエラーが発生しました: {str(e)}\n{traceback.format_exc()}")
+
+def main(argv=None):
+    """コマンドライン引数のCSVファイルをマージしてXMLに変換する"""
+    parser = argparse.ArgumentParser(description="複数のTestLink用CSVを重複を除いて1つのインポート用XMLにまとめる")
+    parser.add_argument("csv_files", nargs="+", help="マージするCSVファイル (後のものほど優先)")
+    parser.add_argument("-o", "--output", required=True, help="出力するXMLファイル")
+    parser.add_argument("--policy", choices=POLICIES, default=POLICY_LAST_WINS,
+                        help=f"同じテストケースが複数の入力にある場合の扱い (既定: {POLICY_LAST_WINS})")
+    parser.add_argument("--index", dest="index_type", choices=INDEXES, default=INDEX_MEMORY,
+                        help="テストケースの索引の置き場所 (disk: 一時ファイル。既定: memory)")
+    parser.add_argument("--spill-dir", default=None, help="--index disk の一時ファイルを置くディレクトリ")
+    parser.add_argument("--shard-mb", type=float, default=None,
+                        help="出力をこのサイズ (MB) 以下のファイルに分ける (テストケースは分割しない)")
+    parser.add_argument("--shard-cases", type=int, default=None, help="出力を1ファイルあたりこの件数以下に分ける")
+    parser.add_argument("--input-encoding", default=None, help="CSVの文字コード (既定: ファイルの先頭から判定)")
+    args = parser.parse_args(argv)
+
+    try:
+        stats = merge_csv_to_xml(args.csv_files, args.output, args.policy, args.index_type, args.spill_dir,
+                                 int(args.shard_mb * 1024 * 1024) if args.shard_mb else None, args.shard_cases,
+                                 args.input_encoding)
+    except Exception as e:
+        # 変換関数のメッセージには詳細なトレースバックが含まれるため1行目だけを表示する
+        print(f"エラー: {str(e).splitlines()[0] if str(e) else type(e).__name__}")
+        return 1
+    print(f"{stats['files']} ファイルの {stats['testcases']} 件を {stats['merged']} 件にまとめました"
+          f" (重複 {stats['duplicates']} 件: 置き換え {stats['replaced']} 件, 既存を採用 {stats['kept']} 件)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,48 @@
 import csv
-import codecs
+import os
 import traceback
 
-def read_csv_file(csv_file):
+import encoding_io
+from instrumentation import instrumented
+
+def iter_csv_rows(csv_file, progress=None, encoding=None, warn=print):
+    """CSVファイルを1行ずつ読み込み、ヘッダー行、データ行の順に返す（列数の異なる行はスキップ）
+
+    progress (progress.Progress) を渡すと読み込んだバイト数を記録し、1行ごとにキャンセルを確認する。
+    encoding を省略するとファイルの先頭から文字コードを判定する (encoding_io.detect_encoding)。
+    読めない文字は置き換え、最後まで読んだ時点でその数を警告として表示する。
+    warn は警告の出力先 (既定は標準出力への print)。
+    """
+    with encoding_io.open_text_reader(csv_file, encoding) as f:
+        if progress is not None:
+            progress.track(f.buffer.tell, os.path.getsize(csv_file))
+        reader = csv.reader(f)
+        try:
+            headers = next(reader)
+        except StopIteration:
+            raise ValueError("CSVファイルにヘッダー行がありません")
+        yield headers
+        line_num = 1 # ヘッダーが1行目
+        for row in reader:
+            line_num += 1
+            if progress is not None:
+                progress.update()
+            if len(row) != len(headers):
+                 warn(f"警告: 行 {line_num} の列数がヘッダー ({len(headers)}列) と異なります ({len(row)}列)。スキップします。")
+                 continue
+            yield row
+        encoding_io.warn_if_lossy(f.stats, csv_file, f.encoding, warn)
+
+@instrumented("read_csv_file")
+def read_csv_file(csv_file, encoding=None):
     """CSVファイルを読み込み、ヘッダーとデータ行を返す"""
     try:
         # CSV読み込み
         rows = []
         try:
-            with codecs.open(csv_file, 'r', 'shift_jis', errors='replace') as f:
-                reader = csv.reader(f)
-                headers = next(reader)
-                rows.append(headers)
-                line_num = 1 # ヘッダーが1行目
-                for row in reader:
-                    line_num += 1
-                    if len(row) != len(headers):
-                         print(f"警告: 行 {line_num} の列数がヘッダー ({len(headers)}列) と異なります ({len(row)}列)。スキップします。")
-                         continue
-                    rows.append(row)
-        except StopIteration:
-             raise ValueError("CSVファイルにヘッダー行がありません")
+            rows.extend(iter_csv_rows(csv_file, encoding=encoding))
+        except ValueError:
+             raise
         except FileNotFoundError:
              raise Exception(f"CSVファイルが見つかりません: {csv_file}")
         except Exception as e:
@@ -33,18 +55,19 @@ def read_csv_file(csv_file):
     except Exception as e:
         raise Exception(f"CSVファイルの読み込み中にエラーが発生しました: {str(e)}")
 
+# 必須・オプショナルヘッダーの定義
+REQUIRED_HEADERS = [
+    "テストケース名", "バージョン", "サマリ（概要）", "重要度",
+    "ステップ番号", "アクション（手順）", "期待結果", "実行タイプ"
+]
+# IDと外部IDは必須ではない（新規作成のため）
+OPTIONAL_HEADERS = ["ID", "外部ID",  "事前条件", "推定実行時間", "ステータス", "有効/無効", "開いているか", "親テストスイート名"]
+
 def get_header_indices(headers):
     """ヘッダー行から各カラムのインデックスを取得する"""
-    # 必須・オプショナルヘッダーの定義とインデックス取得
-    required_headers = [
-        "テストケース名", "バージョン", "サマリ（概要）", "重要度",
-        "ステップ番号", "アクション（手順）", "期待結果", "実行タイプ"
-    ]
-    # IDと外部IDは必須ではない（新規作成のため）
-    optional_headers = ["ID", "外部ID",  "事前条件", "推定実行時間", "ステータス", "有効/無効", "開いているか", "親テストスイート名"]
     header_indices = {}
     missing_required = []
-    for header in required_headers:
+    for header in REQUIRED_HEADERS:
         try:
             header_indices[header] = headers.index(header)
         except ValueError:
@@ -52,7 +75,7 @@ def get_header_indices(headers):
     if missing_required:
         raise ValueError(f"CSVファイルに必要なヘッダーが見つかりません: {', '.join(missing_required)}")
 
-    for header in optional_headers:
+    for header in OPTIONAL_HEADERS:
         try:
             header_indices[header] = headers.index(header)
         except ValueError:
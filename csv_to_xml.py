@@ -1,41 +1,217 @@
+import itertools
+import os
+import sys
+import tempfile
 import traceback
-from csv_reader import read_csv_file, get_header_indices
-from xml_builder import group_testcases, build_testcase_element, create_root_element
-from xml_utils import element_to_string
+from csv_reader import iter_csv_rows, get_header_indices
+from xml_builder import (group_testcase_records, iter_contiguous_groups, iter_spilled_groups,
+                         build_record_element, create_root_element, NonContiguousGroupError)
+from records import CsvLayout
+from xml_utils import XmlDocumentWriter, ShardedXmlWriter
+from instrumentation import instrumented
+from progress import ConversionCancelled
+import result_cache
 
-def convert_csv_to_xml(csv_file, output_xml_file):
-    """CSVファイルを読み込み、TestLinkインポート用のXMLファイルに変換する"""
+# 出力ファイルの書き込みバッファサイズ
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+# 後でまとめて表示する警告をメモリに置く上限 (超えた分は一時ファイルに書く)
+DEFERRED_WARNINGS_MEMORY = 1024 * 1024
+
+# stream_csv_to_xml のグループ化方式
+GROUPING_AUTO = "auto"              # 連続している前提で処理し、崩れていたら退避方式でやり直す
+GROUPING_CONTIGUOUS = "contiguous"  # 同じテストケースの行が連続している前提 (崩れていたらエラー)
+GROUPING_SPILL = "spill"            # 一時ファイルに退避してグループ化 (ソートされていないCSV用)
+
+@instrumented("write_testcase_groups")
+def write_testcase_groups(testcase_groups, output_xml_file, progress=None, cache=None, shard_bytes=None,
+                          shard_cases=None, warn=print):
+    """(グループキー, TestCase) の並びからテストケースXML要素を生成し、1件ずつファイルに書き込む
+
+    cache (result_cache.ResultCache) を渡すと、行の内容が前回と同じテストケースは
+    保存済みのXML断片をそのまま書き込む (その場合、行の警告は再表示されない)。
+    行リストの並びは records.CsvLayout.testcases で TestCase の並びにしてから渡す。
+    shard_bytes (バイト) か shard_cases (件数) を指定すると、output_xml_file の代わりに
+    上限ごとに分けたファイル <出力名>_001.xml, ... とマニフェスト <出力名>_manifest.json を書き込む
+    (xml_utils.ShardedXmlWriter)。
+    途中で例外が発生した場合、書きかけの出力は残さない。warn は警告の出力先。
+    """
+    if shard_bytes or shard_cases:
+        with ShardedXmlWriter(output_xml_file, shard_bytes, shard_cases, buffering=OUTPUT_BUFFER_SIZE,
+                              warn=warn) as writer:
+            _write_groups(writer, testcase_groups, progress, cache, warn)
+        return
+
+    # 一時ファイルに書き終えてから置き換え、途中で失敗しても書きかけのファイルを残さない
+    # (空白だけの行は書き込み時に取り除かれる)
+    temp_file = output_xml_file + ".tmp"
     try:
-        # CSV読み込み
-        rows = read_csv_file(csv_file)
-        headers = rows[0]
-        
-        # ヘッダーインデックスの取得
-        header_indices = get_header_indices(headers)
+        with open(temp_file, 'w', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE) as f:
+            writer = XmlDocumentWriter(f)
+            _write_groups(writer, testcase_groups, progress, cache, warn)
+            writer.close()
+        os.replace(temp_file, output_xml_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+def _write_groups(writer, testcase_groups, progress, cache, warn=print):
+    """テストケースごとにXML要素を生成して writer (XmlDocumentWriter / ShardedXmlWriter) に書き込む"""
+    # テストケース要素の一時的な親 (<testcases>)
+    root = create_root_element()
+    for group_key, record in testcase_groups:
+        key = None
+        if cache is not None:
+            key = result_cache.content_key(record.values(), result_cache.CSV_TO_XML_CONTEXT)
+            fragment = cache.get(key)
+            if fragment is not None:
+                if fragment:
+                    writer.write_rendered(fragment, group_key)
+                if progress is not None:
+                    progress.advance()
+                continue
+        try:
+            build_record_element(root, record, warn)
+        except Exception as e:
+            warn(f"警告: テストケース {group_key} の処理中にエラーが発生しました: {str(e)}")
+            key = None  # 失敗したテストケースは次回も変換し直す
+        finally:
+            fragment = "".join(writer.render(testcase) for testcase in root)
+            if fragment:
+                writer.write_rendered(fragment, group_key)
+            root.clear()
+        if key is not None:
+            cache.put(key, fragment)
+        if progress is not None:
+            progress.advance()
 
-        # XMLルート要素 <testcases> を作成
-        root = create_root_element()
+@instrumented("convert_csv_to_xml")
+def convert_csv_to_xml(csv_file, output_xml_file, shard_bytes=None, shard_cases=None, input_encoding=None):
+    """CSVファイルを読み込み、TestLinkインポート用のXMLファイルに変換する
 
-        # テストケースをグループ化 (IDまたは名前で)
-        testcase_groups = group_testcases(rows, header_indices)
+    shard_bytes / shard_cases を指定すると、上限ごとに分けた複数のファイルに書き出す (write_testcase_groups)。
+    input_encoding を省略するとCSVの文字コードを先頭から判定する (encoding_io.detect_encoding)。
+    """
+    try:
+        # CSV読み込み (1行ずつ読み、テストケースごとに必要な値だけを残す)
+        if not os.path.exists(csv_file):
+            raise FileNotFoundError(f"CSVファイルが見つかりません: {csv_file}")
+        rows = iter_csv_rows(csv_file, encoding=input_encoding)
+        try:
+            headers = next(rows)
+
+            # ヘッダーインデックスの取得
+            header_indices = get_header_indices(headers)
+
+            first_row = next(rows, None)
+            if first_row is None:
+                raise ValueError("CSVファイルにデータ行がありません")
+
+            # テストケースをグループ化 (IDまたは名前で)
+            testcase_groups = group_testcase_records(itertools.chain([first_row], rows), header_indices)
+        finally:
+            rows.close()
 
         # 各グループからテストケースXML要素を生成
-        for group_key, testcase_rows in testcase_groups.items():
-            try:
-                build_testcase_element(root, testcase_rows, header_indices)
-            except Exception as e:
-                print(f"警告: テストケース {group_key} の処理中にエラーが発生しました: {str(e)}")
-                continue
+        write_testcase_groups(testcase_groups.items(), output_xml_file, shard_bytes=shard_bytes,
+                              shard_cases=shard_cases)
+
+    except ValueError as ve: # CSVフォーマットエラーなど
+        raise Exception(f"CSVファイルの処理中にエラーが発生しました: {str(ve)}\n{traceback.format_exc()}")
+    except Exception as e:
+        raise Exception(f"CSVからXMLへの変換中に予期せぬエラーが発生しました: {str(e)}\n{traceback.format_exc()}")
 
-        # XMLをファイルに書き込み
-        xml_string = '<?xml version="1.0" encoding="UTF-8"?>\n' + element_to_string(root)
-        # 出力前に不要な空行などを削除する（オプション）
-        xml_string = "\n".join(line for line in xml_string.splitlines() if line.strip())
+@instrumented("stream_csv_to_xml")
+def stream_csv_to_xml(csv_file, output_xml_file, grouping=GROUPING_AUTO, spill_dir=None, progress=None, cache=None,
+                      shard_bytes=None, shard_cases=None, input_encoding=None):
+    """CSVファイルを1行ずつ読み込み、テストケースごとにXMLを書き出す
 
-        with open(output_xml_file, 'w', encoding='utf-8') as f:
-            f.write(xml_string)
+    全行やXMLツリー全体をメモリに保持しない。出力は convert_csv_to_xml と同じ。
+    grouping が GROUPING_AUTO の場合、同じテストケースの行が連続していないことが
+    分かった時点で一時ファイルへの退避方式に切り替えて最初からやり直す
+    (1回目の警告はやり直した場合は表示せず、書きかけの出力も残さない)。
+    progress (progress.Progress) を渡すと進捗を記録し、キャンセルされていれば
+    ConversionCancelled を送出する。
+    cache (result_cache.ResultCache) を渡すと、前回から変わっていないテストケースの変換を省略する。
+    shard_bytes / shard_cases を指定すると、上限ごとに分けた複数のファイルに書き出す (write_testcase_groups)。
+    input_encoding を省略するとCSVの文字コードを先頭から判定する。
+    """
+    try:
+        if grouping != GROUPING_AUTO:
+            _stream_csv_to_xml(csv_file, output_xml_file, grouping, spill_dir, progress, cache,
+                               shard_bytes, shard_cases, input_encoding)
+            return
+        # やり直した場合に同じ警告が2回表示されないよう、1回目の警告は溜めておき、やり直さなかった場合だけ表示する
+        with _DeferredWarnings() as first_pass_warnings:
+            try:
+                _stream_csv_to_xml(csv_file, output_xml_file, GROUPING_CONTIGUOUS, spill_dir, progress, cache,
+                                   shard_bytes, shard_cases, input_encoding, first_pass_warnings)
+            except NonContiguousGroupError as e:
+                print(f"情報: {str(e)}。一時ファイルを使ってグループ化し直します。")
+                if progress is not None:
+                    progress.restart()
+                _stream_csv_to_xml(csv_file, output_xml_file, GROUPING_SPILL, spill_dir, progress, cache,
+                                   shard_bytes, shard_cases, input_encoding)
+            except BaseException:
+                first_pass_warnings.emit()
+                raise
+            else:
+                first_pass_warnings.emit()
 
+    except ConversionCancelled:
+        raise
     except ValueError as ve: # CSVフォーマットエラーなど
         raise Exception(f"CSVファイルの処理中にエラーが発生しました: {str(ve)}\n{traceback.format_exc()}")
     except Exception as e:
-        raise Exception(f"CSVからXMLへの変換中に予期せぬエラーが発生しました: {str(e)}\n{traceback.format_exc()}")
\ No newline at end of file
+        raise Exception(f"CSVからXMLへの変換中に予期せぬエラーが発生しました: {str(e)}\n{traceback.format_exc()}")
+
+class _DeferredWarnings:
+    """警告を溜めておき、emit() でまとめて表示する警告の出力先 (warn として渡す)
+
+    他のスレッドの出力には影響しない。溜めた警告が DEFERRED_WARNINGS_MEMORY を超えると一時ファイルに書く。
+    """
+
+    def __init__(self):
+        self._file = tempfile.SpooledTemporaryFile(DEFERRED_WARNINGS_MEMORY, mode='w+', encoding='utf-8')
+
+    def __call__(self, message):
+        self._file.write(message + "\n")
+
+    def emit(self):
+        """溜めた警告を標準出力に表示する"""
+        self._file.seek(0)
+        for line in self._file:
+            sys.stdout.write(line)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+        return False
+
+def _stream_csv_to_xml(csv_file, output_xml_file, grouping, spill_dir, progress=None, cache=None,
+                       shard_bytes=None, shard_cases=None, input_encoding=None, warn=print):
+    """指定したグループ化方式で stream_csv_to_xml の変換を1回行う (warn は警告の出力先)"""
+    rows = iter_csv_rows(csv_file, progress, input_encoding, warn)
+    try:
+        headers = next(rows)
+
+        # ヘッダーインデックスの取得
+        header_indices = get_header_indices(headers)
+
+        # データ行がなければ出力ファイルを作らずにエラーにする
+        first_row = next(rows, None)
+        if first_row is None:
+            raise ValueError("CSVファイルにデータ行がありません")
+        data_rows = itertools.chain([first_row], rows)
+
+        if grouping == GROUPING_SPILL:
+            testcase_groups = iter_spilled_groups(data_rows, header_indices, spill_dir)
+        else:
+            testcase_groups = iter_contiguous_groups(data_rows, header_indices, warn)
+        layout = CsvLayout(header_indices)
+        write_testcase_groups(layout.testcases(testcase_groups), output_xml_file, progress, cache, shard_bytes,
+                              shard_cases, warn)
+    finally:
+        rows.close()
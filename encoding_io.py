@@ -0,0 +1,147 @@
+import codecs
+import functools
+import io
+import threading
+
+# CSVの出力に選べる文字コード (既定は従来どおり shift_jis)
+OUTPUT_ENCODINGS = ("shift_jis", "cp932", "utf-8", "utf-8-sig")
+DEFAULT_OUTPUT_ENCODING = "shift_jis"
+
+# 入力の文字コードの判定に読む先頭のバイト数
+DETECT_SAMPLE_SIZE = 64 * 1024
+# 判定の候補 (先頭から順に試す。shift_jis で読めるものは従来どおり shift_jis として読む)
+_DETECT_CANDIDATES = ("utf-8", "shift_jis", "cp932")
+
+# 読み書きのバッファサイズ
+BUFFER_SIZE = 1024 * 1024
+
+# 失われた・置き換えた文字を数えるエラーハンドラーの名前の接頭辞 (ストリームごとに番号を付けて登録する)
+_DECODE_ERRORS = "testlink-count-replace"
+_ENCODE_ERRORS = "testlink-count-ignore"
+
+class EncodingStats:
+    """文字コードの変換で置き換えた (読み込み) ・失われた (書き込み) 文字数"""
+
+    def __init__(self):
+        self.replaced = 0
+        self.lost = 0
+
+class _ErrorHandlerSlot:
+    """codecs に登録したエラーハンドラー1つと、それが数える先の EncodingStats
+
+    エラーハンドラーは名前でしか指定できず、登録は取り消せないため、ストリームを閉じたら
+    スロットを戻して次に開くストリームで使い回す。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stats = None
+
+def _count_replace(slot, error):
+    """読めないバイト列を U+FFFD に置き換え、置き換えた数を数える"""
+    if slot.stats is not None:
+        slot.stats.replaced += 1
+    return ("\ufffd", error.end)
+
+def _count_ignore(slot, error):
+    """出力の文字コードで表せない文字を捨て、捨てた文字数を数える"""
+    if slot.stats is not None:
+        slot.stats.lost += error.end - error.start
+    return ("", error.end)
+
+_HANDLERS = {_DECODE_ERRORS: _count_replace, _ENCODE_ERRORS: _count_ignore}
+_free_slots = {prefix: [] for prefix in _HANDLERS}
+_slot_count = 0
+_slots_lock = threading.Lock()
+
+def _acquire_slot(prefix, stats):
+    """prefix のエラーハンドラーのスロットを1つ取り出し、stats に数えるようにする"""
+    global _slot_count
+    with _slots_lock:
+        if _free_slots[prefix]:
+            slot = _free_slots[prefix].pop()
+        else:
+            _slot_count += 1
+            slot = _ErrorHandlerSlot(f"{prefix}-{_slot_count}")
+            codecs.register_error(slot.name, functools.partial(_HANDLERS[prefix], slot))
+    slot.stats = stats
+    return slot
+
+def _release_slot(prefix, slot):
+    slot.stats = None
+    with _slots_lock:
+        _free_slots[prefix].append(slot)
+
+class _CountingTextIOWrapper(io.TextIOWrapper):
+    """置き換えた・捨てた文字をこのストリームの stats (EncodingStats) に数える TextIOWrapper
+
+    数える先をストリームに結び付けるため、同じスレッドで複数のファイルを交互に読み書きしても混ざらない。
+    """
+
+    def __init__(self, buffer, encoding, prefix, stats=None):
+        self.stats = stats or EncodingStats()
+        self._prefix = prefix
+        self._slot = _acquire_slot(prefix, self.stats)
+        try:
+            super().__init__(buffer, encoding=encoding, errors=self._slot.name, newline='')
+        except BaseException:
+            _release_slot(prefix, self._slot)
+            raise
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self._slot is not None:
+                _release_slot(self._prefix, self._slot)
+                self._slot = None
+
+def detect_encoding(path, sample_size=DETECT_SAMPLE_SIZE):
+    """ファイルの先頭 sample_size バイトから文字コードを判定する (ファイル全体は読まない)
+
+    BOM があれば utf-8-sig、UTF-8 として読めれば utf-8、そうでなければ shift_jis、cp932 の順に試し、
+    どれでも読めなければ shift_jis を返す (読めない文字は置き換えて数える)。
+    """
+    with open(path, 'rb') as f:
+        sample = f.read(sample_size)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    for encoding in _DETECT_CANDIDATES:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            # 末尾で切れたマルチバイト文字は読めたものとみなす (final=False)
+            decoder.decode(sample, final=False)
+        except UnicodeDecodeError:
+            continue
+        if encoding == "utf-8" and sample.isascii():
+            # ASCIIだけなら区別できないため従来の既定に合わせる
+            continue
+        return encoding
+    return DEFAULT_OUTPUT_ENCODING
+
+def open_text_reader(path, encoding=None, stats=None):
+    """テキストファイルを読み込み用に開く (encoding が None なら先頭から判定する)
+
+    改行は変換しない (CSVモジュールに渡すため)。読めないバイト列は U+FFFD に置き換え、
+    その数を戻り値の stats 属性 (引数の stats、省略すると新しい EncodingStats) に記録する。
+    判定した文字コードは戻り値の encoding 属性で分かる。
+    """
+    encoding = encoding or detect_encoding(path)
+    return _CountingTextIOWrapper(io.BufferedReader(io.FileIO(path, 'r'), BUFFER_SIZE), encoding, _DECODE_ERRORS, stats)
+
+def open_text_writer(path, encoding=DEFAULT_OUTPUT_ENCODING, stats=None):
+    """テキストファイルを書き込み用に開く
+
+    改行は変換しない。出力の文字コードで表せない文字は捨て、その文字数を戻り値の stats 属性
+    (引数の stats、省略すると新しい EncodingStats) に記録する。
+    """
+    if encoding not in OUTPUT_ENCODINGS:
+        raise ValueError(f"出力の文字コードは {', '.join(OUTPUT_ENCODINGS)} のいずれかにしてください: {encoding}")
+    return _CountingTextIOWrapper(io.BufferedWriter(io.FileIO(path, 'w'), BUFFER_SIZE), encoding, _ENCODE_ERRORS, stats)
+
+def warn_if_lossy(stats, path, encoding, warn=print):
+    """置き換えた・捨てた文字があれば警告を表示する (warn は警告の出力先)"""
+    if stats.replaced:
+        warn(f"警告: {path} の {stats.replaced} 箇所を文字コード {encoding} として読めなかったため置き換えました")
+    if stats.lost:
+        warn(f"警告: {path} に文字コード {encoding} で表せない {stats.lost} 文字があったため出力しませんでした")
@@ -0,0 +1,233 @@
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+MB = 1024 * 1024
+
+# 計測中かどうか (無効時はこの値を見るだけで処理を終える)
+_enabled = False
+
+class _State:
+    """計測の記録と設定"""
+
+    def __init__(self):
+        self.trace_memory = False
+        self.profile_stages = frozenset()
+        self.stages = {}        # 段階名 -> [呼び出し回数, 合計秒数, ピークメモリ (バイト)]
+        self.profiles = {}      # 段階名 -> cProfile.Profile
+        self.started = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+_state = _State()
+
+class _NullStage:
+    """計測が無効な場合に stage() が返す何もしないコンテキストマネージャ"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    """1回分の段階の計測 (時間・メモリ・プロファイル)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.profile = None
+
+    def __enter__(self):
+        local = _state.local
+        stack = getattr(local, "stack", None)
+        if stack is None:
+            stack = local.stack = []
+        self.memory_start = None
+        if _state.trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # 外側の段階のピークを退避してから、この段階用にピークをリセットする
+                stack[-1].memory_peak = max(stack[-1].memory_peak, peak)
+            tracemalloc.reset_peak()
+            self.memory_start = current
+            self.memory_peak = current
+        stack.append(self)
+        if self.name in _state.profile_stages and not getattr(local, "profiling", False):
+            with _state.lock:
+                self.profile = _state.profiles.setdefault(self.name, cProfile.Profile())
+            local.profiling = True
+            self.profile.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        if self.profile is not None:
+            self.profile.disable()
+            _state.local.profiling = False
+        stack = _state.local.stack
+        stack.pop()
+        memory = None
+        if self.memory_start is not None:
+            peak = max(self.memory_peak, tracemalloc.get_traced_memory()[1])
+            memory = peak - self.memory_start
+            if stack:
+                stack[-1].memory_peak = max(stack[-1].memory_peak, peak)
+        with _state.lock:
+            record = _state.stages.setdefault(self.name, [0, 0.0, None])
+            record[0] += 1
+            record[1] += elapsed
+            if memory is not None and (record[2] is None or memory > record[2]):
+                record[2] = memory
+        return False
+
+def stage(name):
+    """処理段階を計測するコンテキストマネージャを返す (無効時は何もしない)"""
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name)
+
+def instrumented(name):
+    """関数の呼び出しを段階 name として計測するデコレータ
+
+    計測が無効な間は真偽値の確認1回だけで元の関数を呼ぶ。再帰する関数には使わないこと。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def enable(trace_memory=True, profile_stages=()):
+    """計測を開始する (それまでの記録は破棄する)
+
+    trace_memory が真の場合は tracemalloc で段階ごとのピークメモリも記録する (処理は遅くなる)。
+    profile_stages に指定した段階は cProfile の下で実行する。
+    並列変換のワーカープロセス内の処理は記録されない。
+    """
+    global _enabled
+    reset()
+    _state.trace_memory = trace_memory
+    _state.profile_stages = frozenset(profile_stages)
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _state.started = time.perf_counter()
+    _enabled = True
+
+def disable():
+    """計測を終了する (記録は report() で取得できる)"""
+    global _enabled
+    _enabled = False
+    if _state.trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def is_enabled():
+    """計測中かどうかを返す"""
+    return _enabled
+
+def reset():
+    """記録をすべて破棄する"""
+    with _state.lock:
+        _state.stages = {}
+        _state.profiles = {}
+    _state.started = time.perf_counter()
+
+def peak_rss_bytes():
+    """このプロセスのピークRSS (バイト) を返す。取得できない環境では None"""
+    try:
+        import resource
+    except ImportError:
+        return _windows_peak_rss_bytes()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS はバイト、Linux はキロバイト単位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _windows_peak_rss_bytes():
+    """Windows のピークワーキングセット (バイト) を返す"""
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+    except (ImportError, AttributeError, OSError):
+        return None
+
+def report(profile_prefix=None, extra=None):
+    """記録した段階ごとの時間・呼び出し回数・ピークメモリを辞書で返す
+
+    profile_prefix を指定すると cProfile の結果を <profile_prefix><段階名>.prof として保存し、
+    そのパスを含める。extra (引数なしの関数) を指定すると、その戻り値の辞書の項目を追加する。
+    段階の時間は入れ子の段階の時間を含む。
+    """
+    with _state.lock:
+        stages = {name: list(record) for name, record in _state.stages.items()}
+        profiles = dict(_state.profiles)
+    peak_rss = peak_rss_bytes()
+    result = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "total_seconds": time.perf_counter() - _state.started if _state.started is not None else 0.0,
+        "peak_rss_mb": peak_rss / MB if peak_rss is not None else None,
+        "memory_traced": _state.trace_memory,
+        "stages": {
+            name: {
+                "calls": calls,
+                "seconds": seconds,
+                "mean_ms": seconds / calls * 1000 if calls else 0.0,
+                "peak_memory_mb": peak / MB if peak is not None else None,
+            }
+            for name, (calls, seconds, peak) in sorted(stages.items(), key=lambda item: -item[1][1])
+        },
+        "profiles": {},
+    }
+    if profile_prefix and profiles:
+        for name, profile in profiles.items():
+            path = f"{profile_prefix}{name}.prof"
+            profile.dump_stats(path)
+            result["profiles"][name] = path
+    if extra is not None:
+        result.update(extra())
+    return result
+
+def write_report(report_file, profile_prefix=None, extra=None):
+    """report() の内容をJSONファイルに書き込む"""
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report(profile_prefix, extra), f, ensure_ascii=False, indent=2)
+
+@contextmanager
+def session(report_file, trace_memory=True, profile_stages=(), extra=None):
+    """with ブロック内の処理を計測し、終了時にJSONレポートを書き込む
+
+    cProfile の結果はレポートと同じ場所に <レポート名>.<段階名>.prof として保存する。
+    extra は report() と同じく、終了時にレポートへ追加する項目を返す関数。
+    """
+    enable(trace_memory, profile_stages)
+    try:
+        yield
+    finally:
+        try:
+            write_report(report_file, os.path.splitext(report_file)[0] + ".", extra)
+        finally:
+            disable()
@@ -0,0 +1,77 @@
+import threading
+import time
+
+class ConversionCancelled(Exception):
+    """変換がキャンセルされた場合の例外"""
+
+class Progress:
+    """変換の進捗 (処理済みテストケース数・読み込みバイト数) を記録し、キャンセルを確認する
+
+    変換処理から update() / advance() を呼ぶと、interval 秒ごとに callback に進捗の辞書を渡す。
+    cancel() が呼ばれていれば次の update() / advance() で ConversionCancelled を送出する。
+    callback は変換処理と同じスレッドで呼ばれる。
+    """
+
+    def __init__(self, callback=None, interval=0.2):
+        self.callback = callback
+        self.interval = interval
+        self.cases = 0
+        self.total_bytes = 0
+        self.bytes_read = 0
+        self._position = None   # 読み込み済みバイト数を返す関数
+        self._cancel_event = threading.Event()
+        self._started = time.monotonic()
+        self._last_report = 0.0
+
+    def track(self, position, total_bytes):
+        """読み込み位置 (バイト) を返す関数と入力全体のバイト数を設定する"""
+        self._position = position
+        self.total_bytes = total_bytes
+
+    def restart(self):
+        """最初から処理し直す場合にテストケース数を0に戻す"""
+        self.cases = 0
+
+    def cancel(self):
+        """キャンセルを要求する (別スレッドから呼んでよい)"""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        """キャンセルが要求されているかどうか"""
+        return self._cancel_event.is_set()
+
+    def advance(self, cases=1):
+        """テストケースを cases 件処理したことを記録する"""
+        self.cases += cases
+        self.update()
+
+    def update(self):
+        """キャンセルを確認し、前回の通知から interval 秒経っていれば進捗を通知する"""
+        if self._cancel_event.is_set():
+            raise ConversionCancelled("変換がキャンセルされました")
+        now = time.monotonic()
+        if self.callback is not None and now - self._last_report >= self.interval:
+            self._last_report = now
+            self.callback(self.snapshot())
+
+    def snapshot(self):
+        """現在の進捗を辞書で返す (eta は残り時間の推定秒数。不明な場合は None)"""
+        if self._position is not None:
+            try:
+                self.bytes_read = self._position()
+            except (ValueError, OSError):
+                # 入力ファイルが閉じられた後は最後に取得した位置を使う
+                pass
+        bytes_read = self.bytes_read
+        elapsed = time.monotonic() - self._started
+        eta = None
+        if self.total_bytes and 0 < bytes_read <= self.total_bytes:
+            eta = elapsed * (self.total_bytes - bytes_read) / bytes_read
+        return {
+            "cases": self.cases,
+            "bytes": bytes_read,
+            "total_bytes": self.total_bytes,
+            "elapsed": elapsed,
+            "eta": eta,
+        }
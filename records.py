@@ -0,0 +1,104 @@
+class Step:
+    """テストケースの1ステップ (CSVのステップ番号のある1行)"""
+    __slots__ = ("number", "actions", "expected", "execution_type", "line")
+
+    def __init__(self, number, actions, expected, execution_type, line):
+        self.number = number
+        self.actions = actions
+        self.expected = expected
+        self.execution_type = execution_type
+        self.line = line            # テストケース内の行番号 (警告の表示用。最初の行が2)
+
+    def values(self):
+        """ステップの値をタプルで返す (キャッシュキー用)"""
+        return (self.number, self.actions, self.expected, self.execution_type, self.line)
+
+class TestCase:
+    """CSVの1テストケース分の行から取り出した値 (前後の空白は除去済み)
+
+    テストケースの値は最初の行から取り出し、ステップは全行から取り出す。
+    元の行 (全列のリスト) は保持しないため、ステップ行が多いテストケースでもメモリを節約できる。
+    """
+    __slots__ = ("name", "internal_id", "external_id", "version", "summary", "importance", "preconditions",
+                 "execution_type", "estimated_exec_duration", "status", "is_open", "active", "first_row_is_step",
+                 "steps")
+
+    def values(self):
+        """テストケースの値をリストで返す (キャッシュキー用)"""
+        return [getattr(self, name) for name in self.__slots__[:-1]] + [step.values() for step in self.steps]
+
+    @classmethod
+    def from_values(cls, values):
+        """values() の戻り値 (JSONから読み込んだものでよい) から TestCase を作り直す"""
+        testcase = cls()
+        count = len(cls.__slots__) - 1
+        for name, value in zip(cls.__slots__[:count], values):
+            setattr(testcase, name, value)
+        testcase.steps = [Step(*step) for step in values[count:]]
+        return testcase
+
+def _cell(row, idx, default=""):
+    """行の idx 列の値を前後の空白を除いて返す (列がなければ default)"""
+    return row[idx].strip() if idx != -1 and idx < len(row) else default
+
+class CsvLayout:
+    """CSVの列の位置 (ファイルごとに1回だけ求める) と、行から TestCase / Step を作る処理"""
+    __slots__ = ("id_idx", "external_id_idx", "version_idx", "name_idx", "summary_idx", "importance_idx",
+                 "preconditions_idx", "step_number_idx", "actions_idx", "expected_idx", "exec_type_idx",
+                 "exec_duration_idx", "status_idx", "is_active_idx", "is_open_idx")
+
+    def __init__(self, header_indices):
+        """header_indices は csv_reader.get_header_indices の結果"""
+        self.id_idx = header_indices.get("ID", -1)
+        self.external_id_idx = header_indices.get("外部ID", -1)
+        self.version_idx = header_indices["バージョン"]
+        self.name_idx = header_indices["テストケース名"]
+        self.summary_idx = header_indices["サマリ（概要）"]
+        self.importance_idx = header_indices["重要度"]
+        self.preconditions_idx = header_indices.get("事前条件", -1)
+        self.step_number_idx = header_indices["ステップ番号"]
+        self.actions_idx = header_indices["アクション（手順）"]
+        self.expected_idx = header_indices["期待結果"]
+        self.exec_type_idx = header_indices["実行タイプ"]
+        self.exec_duration_idx = header_indices.get("推定実行時間", -1)
+        self.status_idx = header_indices.get("ステータス", -1)
+        self.is_active_idx = header_indices.get("有効/無効", -1)
+        self.is_open_idx = header_indices.get("開いているか", -1)
+
+    def new_testcase(self, first_row):
+        """テストケースの最初の行からステップのない TestCase を作る (ステップは add_row で追加する)"""
+        testcase = TestCase()
+        testcase.name = _cell(first_row, self.name_idx)
+        testcase.internal_id = _cell(first_row, self.id_idx)
+        testcase.external_id = _cell(first_row, self.external_id_idx)
+        testcase.version = _cell(first_row, self.version_idx)
+        testcase.summary = _cell(first_row, self.summary_idx)
+        testcase.importance = _cell(first_row, self.importance_idx)
+        testcase.preconditions = _cell(first_row, self.preconditions_idx)
+        testcase.execution_type = _cell(first_row, self.exec_type_idx)
+        testcase.estimated_exec_duration = _cell(first_row, self.exec_duration_idx)
+        testcase.status = _cell(first_row, self.status_idx)
+        testcase.is_open = _cell(first_row, self.is_open_idx)
+        testcase.active = _cell(first_row, self.is_active_idx)
+        testcase.first_row_is_step = bool(_cell(first_row, self.step_number_idx))
+        testcase.steps = []
+        return testcase
+
+    def add_row(self, testcase, row, line):
+        """テストケースの行 (line はテストケース内の行番号) にステップ番号があればステップを追加する"""
+        step_number = _cell(row, self.step_number_idx)
+        if step_number:
+            testcase.steps.append(Step(step_number, _cell(row, self.actions_idx), _cell(row, self.expected_idx),
+                                       _cell(row, self.exec_type_idx, "1"), line))  # デフォルト Manual
+
+    def testcase(self, rows):
+        """1テストケース分の行から TestCase を作る"""
+        testcase = self.new_testcase(rows[0])
+        for line, row in enumerate(rows, 2):
+            self.add_row(testcase, row, line)
+        return testcase
+
+    def testcases(self, testcase_groups):
+        """(グループキー, 行リスト) の並びを (グループキー, TestCase) の並びにする"""
+        for group_key, rows in testcase_groups:
+            yield group_key, self.testcase(rows)
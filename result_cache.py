@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+# 変換結果の形式を変えたときに上げる番号 (変わるとキャッシュ全体を破棄する)
+CONVERTER_VERSION = "1"
+
+# 変換結果に影響するモジュール (内容が変わるとキャッシュ全体を破棄する)
+_CONVERTER_MODULES = (
+    "xml_processor.py", "column_schema.py", "csv_reader.py", "csv_to_xml.py",
+    "xml_builder.py", "xml_utils.py", "text_utils.py", "records.py", "encoding_io.py",
+)
+
+# キャッシュファイル名とサイズ上限の既定値 (バイト)
+CACHE_FILE_NAME = "conversion_cache.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# 上限を超えたときに削減する目標 (上限に対する割合)
+_EVICTION_TARGET = 0.9
+# まとめて書き込む件数
+_FLUSH_SIZE = 1000
+
+_converter_fingerprint = None
+
+def converter_fingerprint():
+    """変換処理のバージョンとソースの内容から作る識別子を返す"""
+    global _converter_fingerprint
+    if _converter_fingerprint is None:
+        digest = hashlib.blake2b(CONVERTER_VERSION.encode("utf-8"), digest_size=16)
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        for name in _CONVERTER_MODULES:
+            try:
+                with open(os.path.join(base_dir, name), 'rb') as f:
+                    digest.update(f.read())
+            except OSError:
+                digest.update(name.encode("utf-8"))
+        _converter_fingerprint = digest.hexdigest()
+    return _converter_fingerprint
+
+def xml_to_csv_context(plan, step_rows):
+    """XML→CSV変換のキーに含める列定義と出力形式の識別子"""
+    schema = json.dumps([plan.columns, bool(step_rows)], ensure_ascii=False, sort_keys=True)
+    return b"xml_to_csv\x00" + hashlib.blake2b(schema.encode("utf-8"), digest_size=16).digest()
+
+# CSV→XML変換のキーに含める識別子 (キーには列の位置によらない records.TestCase の値を使う)
+CSV_TO_XML_CONTEXT = b"csv_to_xml\x00"
+
+def content_key(values, context):
+    """変換の入力 (JSONにできる値) と変換の種類の識別子から作るキャッシュキー
+
+    XML→CSV変換では ExtractionPlan が testcase の部分木から取り出した未変換の値、
+    CSV→XML変換では1テストケース分の records.TestCase の値を渡す。変換結果はこれらだけで決まるため、
+    部分木のうち変換に使わない部分 (空白など) が変わってもキーは変わらない。
+    """
+    text = json.dumps(values, ensure_ascii=False)
+    return hashlib.blake2b(context + text.encode("utf-8", "surrogatepass"), digest_size=20).digest()
+
+class ResultCache:
+    """テストケース単位の変換結果をディスク (SQLite) に保存するキャッシュ
+
+    前回の実行から変わっていないテストケースは保存済みの結果 (CSV行やXML断片) を使い、
+    変わったものだけを変換する。変換処理のバージョンやソースが変わると全体を破棄する。
+    サイズが上限を超えると、最後に使われたのが古い順に破棄する (書き込みのたびに確認する)。
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_FILE_NAME)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+        self.invalidated = False
+        self._pending = {}      # 未書き込みの結果
+        self._used = []         # 今回ヒットしたキー (最終使用の更新用)
+
+        self._conn = sqlite3.connect(self.path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            # 結果本体と、サイズ・最終使用 (ヒットのたびに更新する小さな行) は別のテーブルに置く
+            self._conn.execute("CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, value TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS usage "
+                               "(key BLOB PRIMARY KEY, size INTEGER, last_used INTEGER) WITHOUT ROWID")
+
+            # 変換処理が変わっていれば保存済みの結果はすべて無効
+            fingerprint = converter_fingerprint()
+            if self._meta("converter") != fingerprint:
+                self.invalidated = self._meta("converter") is not None
+                self._conn.execute("DELETE FROM results")
+                self._conn.execute("DELETE FROM usage")
+                self._set_meta("converter", fingerprint)
+
+            # 実行ごとの番号を最終使用時刻の代わりに使う
+            self.generation = int(self._meta("generation") or 0) + 1
+            self._set_meta("generation", str(self.generation))
+        # 合計サイズの見積もり (上限を超えたら書き込みのトランザクション内で実際の合計を求めて破棄する)
+        self._estimated_bytes = self._total_bytes()
+
+    def _meta(self, name):
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def get(self, key):
+        """保存済みの結果を返す。なければ None"""
+        value = self._pending.get(key)
+        if value is None:
+            row = self._conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                value = row[0]
+                self._used.append(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """結果を保存する (一定件数ごとにまとめて書き込む)"""
+        self._pending[key] = value
+        if len(self._pending) >= _FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """未書き込みの結果と最終使用の更新を書き込む
+
+        書き込みで合計サイズの見積もりが上限を超えた場合は、同じトランザクション内で破棄も行う
+        (実行中もサイズが上限を大きく超えないようにする)。
+        """
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            if self._pending:
+                self._conn.executemany("INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)",
+                                       self._pending.items())
+                usage = [(key, len(key) + len(value.encode("utf-8", "surrogatepass")), self.generation)
+                         for key, value in self._pending.items()]
+                self._conn.executemany("INSERT OR REPLACE INTO usage (key, size, last_used) VALUES (?, ?, ?)",
+                                       usage)
+                self._estimated_bytes += sum(size for _, size, _ in usage)
+                self.stored += len(self._pending)
+                self._pending = {}
+            if self._used:
+                self._conn.executemany("UPDATE usage SET last_used = ? WHERE key = ?",
+                                       [(self.generation, key) for key in self._used])
+                self._used = []
+            if self._estimated_bytes > self.max_bytes:
+                self._evict()
+
+    def evict(self):
+        """合計サイズが上限を超えていれば、最後に使われたのが古いものから破棄する"""
+        with self._conn:
+            # 合計の計算から削除までを1つの書き込みトランザクションで行い、他のプロセスと重ならないようにする
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._evict()
+
+    def _total_bytes(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM usage").fetchone()[0]
+
+    def _evict(self):
+        """evict の本体 (書き込みのトランザクション内で呼ぶ)"""
+        total = self._total_bytes()
+        self._estimated_bytes = total
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * _EVICTION_TARGET)
+        removed = 0
+        keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM usage ORDER BY last_used"):
+            keys.append((key,))
+            removed += size
+            if removed >= target:
+                break
+        self._conn.executemany("DELETE FROM results WHERE key = ?", keys)
+        self._conn.executemany("DELETE FROM usage WHERE key = ?", keys)
+        self._estimated_bytes = total - removed
+        self.evicted += len(keys)
+
+    def close(self):
+        """書き込みと上限を超えた分の破棄を行って閉じる"""
+        if self._conn is None:
+            return
+        try:
+            self.flush()
+            self.evict()
+        finally:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def stats(self):
+        """ヒット数・ミス数などの統計を辞書で返す"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "stored": self.stored + len(self._pending),
+            "evicted": self.evicted,
+            "invalidated": self.invalidated,
+        }
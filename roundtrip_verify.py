@@ -0,0 +1,265 @@
+# XML→CSV→XML の往復変換でテストケースが保たれているかを検証するコマンドラインツール
+# 使い方: python roundtrip_verify.py export.xml export_converted.xml -o report.json  (差異があれば終了コード1)
+import argparse
+import hashlib
+import json
+import re
+import sys
+import xml.etree.ElementTree as ET
+
+import sqlite_export
+from column_schema import custom_fields_of
+from xml_processor import DoubleCdataFixReader, clean_html, iter_testcases
+
+# 1回の検証で記録する差異の既定の上限 (超えた分は件数だけ数える)
+DEFAULT_MAX_DIFFERENCES = 1000
+
+# --ignore で比較から外せる項目 (CSV→XML変換はカスタムフィールドとテストスイートの階層を出力しない)
+IGNORABLE_FIELDS = {
+    "custom_fields": "カスタムフィールド",
+    "suites": "テストスイートの階層 (testsuite_path)",
+}
+
+# 差異の種類
+STATUS_CHANGED = "changed"      # 両方にあるが内容が異なる
+STATUS_MISSING = "missing"      # 元のXMLにだけある (変換で失われた)
+STATUS_EXTRA = "extra"          # 変換後のXMLにだけある
+STATUS_DUPLICATE = "duplicate"  # 同じXMLの中でキーが重複している
+
+# 比較する値の取り出し方 (sqlite_export と同じく全ステップを取り出す)
+_PLAN = sqlite_export.EXPORT_PLAN
+# (行の位置, 項目名, HTMLか)
+_CASE_FIELDS = [(index, header, index in _PLAN.html_indices) for index, header in enumerate(_PLAN.headers)
+                if index not in _PLAN.step_indices]
+_STEP_FIELDS = [(position, _PLAN.headers[index], index in _PLAN.html_indices)
+                for position, index in enumerate(_PLAN.step_indices)]
+_ID_INDEX = _PLAN.headers.index("internal_id")
+_EXTERNAL_ID_INDEX = _PLAN.headers.index("external_id")
+_NAME_INDEX = _PLAN.headers.index("name")
+
+# 項目ごとのハッシュのバイト数
+_FIELD_DIGEST_SIZE = 8
+
+_field_names_cache = {}
+
+# リストのタグ (clean_html はリスト全体を改行1つにするため、比較の前に項目を「・」の行にする)
+_LIST_TAG = re.compile(r'<(/?)(?:ul|ol|li)\b[^<>]*>', re.IGNORECASE)
+# 「・」の後の空白 (text_to_html は「・」の行を <li> にするときに取り除く)
+_BULLET_SPACE = re.compile(r'・\s+')
+
+def _list_to_bullets(match):
+    return "\n・" if not match.group(1) and match.group().lower().startswith("<li") else "\n"
+
+def canonical_text(value, html):
+    """比較用の正規化した値 (HTMLはプレーンテキストにし、空白と改行の違いを無視する)
+
+    元のXMLのHTMLと、CSVから text_to_html で作り直したHTMLは同じテキストになる。
+    text_to_html は「・」で始まる行を <ol><li> にするため、リストの項目は「・」の行として比べる。
+    CDATAの有無はパースの時点で区別されなくなる。
+    """
+    if html and ("<" in value or "&" in value):
+        # タグも実体参照もなければ clean_html は空白しか変えないため省略する
+        if "<" in value:
+            value = _LIST_TAG.sub(_list_to_bullets, value)
+        value = clean_html(value)
+    return _BULLET_SPACE.sub("・", " ".join(value.split()))
+
+def _field_names(step_count, custom_names, with_suite):
+    """_fingerprint の項目ハッシュと同じ順の項目名の並び
+
+    step_count はステップ数、custom_names は比較するカスタムフィールド名 (名前順)、
+    with_suite はテストスイートの階層を比較するか。同じ並びは1つのタプルを共有する。
+    """
+    cache_key = (step_count, custom_names, with_suite)
+    names = _field_names_cache.get(cache_key)
+    if names is None:
+        names = tuple(header for _, header, _ in _CASE_FIELDS) + (("testsuite_path",) if with_suite else ()) + tuple(
+            f"custom_fields[{name}]" for name in custom_names) + ("step_count",) + tuple(
+            f"steps[{number}].{header}" for number in range(1, step_count + 1) for _, header, _ in _STEP_FIELDS)
+        names = _field_names_cache[cache_key] = names
+    return names
+
+def _fingerprint(testcase, suite, ignore=()):
+    """testcase 要素から (キー, テストケースのハッシュ, 項目名の並び, 項目ごとのハッシュをつないだバイト列) を作る
+
+    ステップがある場合、テストケースの実行タイプはCSVからの変換で出力されないため比較しない。
+    カスタムフィールド (値が空のものは除く) とテストスイートの階層も比較し、ignore
+    (IGNORABLE_FIELDS のキー) に含まれるものだけを比較から外す。
+    """
+    case_row, step_values = _PLAN.extract_steps(testcase, suite)
+    digests = []
+    for index, header, html in _CASE_FIELDS:
+        value = case_row[index]
+        if header == "execution_type" and step_values:
+            value = ""
+        digests.append(_digest(canonical_text(value, html)))
+    with_suite = "suites" not in ignore
+    if with_suite:
+        digests.append(_digest(suite.path))
+    custom_names = ()
+    if "custom_fields" not in ignore:
+        custom_values = {name: value for name, value in custom_fields_of(testcase).items() if value.strip()}
+        custom_names = tuple(sorted(custom_values))
+        digests.extend(_digest(canonical_text(custom_values[name], False)) for name in custom_names)
+    digests.append(_digest(str(len(step_values))))
+    for values in step_values:
+        for position, _, html in _STEP_FIELDS:
+            digests.append(_digest(canonical_text(values[position], html)))
+    packed = b"".join(digests)
+    names = _field_names(len(step_values), custom_names, with_suite)
+
+    if case_row[_ID_INDEX]:
+        key = f"ID_{case_row[_ID_INDEX]}"
+    elif case_row[_EXTERNAL_ID_INDEX]:
+        key = f"EXT_{case_row[_EXTERNAL_ID_INDEX]}"
+    else:
+        key = f"NAME_{case_row[_NAME_INDEX]}"
+    # カスタムフィールドの名前が違えば値が同じでも異なるハッシュにする
+    case_hash = hashlib.blake2b(packed + "\0".join(custom_names).encode("utf-8", "surrogatepass"), digest_size=16)
+    return key, case_hash.digest(), names, packed
+
+def _digest(text):
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=_FIELD_DIGEST_SIZE).digest()
+
+def _differing_fields(original, converted):
+    """2つの指紋 (_fingerprint の戻り値) で値が異なる項目名の一覧"""
+    original_fields = _unpack(original)
+    converted_fields = _unpack(converted)
+    names = list(original_fields) + [name for name in converted_fields if name not in original_fields]
+    return [name for name in names if original_fields.get(name) != converted_fields.get(name)]
+
+def _unpack(fingerprint):
+    _, _, names, packed = fingerprint
+    return {name: packed[i * _FIELD_DIGEST_SIZE:(i + 1) * _FIELD_DIGEST_SIZE] for i, name in enumerate(names)}
+
+def _iter_fingerprints(xml_sources, ignore=()):
+    """XML (複数可) をストリーミングで読み込み、testcase ごとの指紋を返す"""
+    for xml_source in xml_sources:
+        for testcase, suite in iter_testcases(xml_source):
+            yield _fingerprint(testcase, suite, ignore)
+
+def verify_roundtrip(original_xml, converted_xmls, max_differences=DEFAULT_MAX_DIFFERENCES, ignore=()):
+    """元のXMLと変換後のXML (分割出力の場合は全ファイルを順に) を比較し、差異のレポートの辞書を返す
+
+    テストケースは ID、外部ID、名前の順でキーを作って対応付け、正規化した値の項目ごとのハッシュを比べる。
+    ignore (IGNORABLE_FIELDS のキー) に含めた項目は比較せず、レポートの ignored に記録する。
+    変換後のXMLは元のXMLと同じ順 (変換できなかったテストケースは抜ける) に並ぶため、
+    元のXMLは変換後のXMLの次のテストケースが見つかるまでだけ読み進める。保持するのは
+    対応付けを待っているテストケースのハッシュだけなので、XML全体やテキストはメモリに置かない。
+    """
+    if isinstance(converted_xmls, str):
+        converted_xmls = [converted_xmls]
+    unknown = [name for name in ignore if name not in IGNORABLE_FIELDS]
+    if unknown:
+        raise ValueError(f"比較から外せない項目です: {', '.join(unknown)} (指定できるもの: {', '.join(IGNORABLE_FIELDS)})")
+    differences = []
+    counts = {"original_testcases": 0, "converted_testcases": 0, "matched": 0, STATUS_CHANGED: 0, STATUS_MISSING: 0,
+              STATUS_EXTRA: 0, STATUS_DUPLICATE: 0}
+
+    def report(key, status, fields=None):
+        counts[status] += 1
+        if max_differences is None or len(differences) < max_differences:
+            difference = {"key": key, "status": status}
+            if fields is not None:
+                difference["fields"] = fields
+            differences.append(difference)
+
+    def compare(original, converted):
+        counts["matched"] += 1
+        if original[1] != converted[1]:
+            report(converted[0], STATUS_CHANGED, _differing_fields(original, converted))
+
+    pending_original = {}       # 読み進めたがまだ対応付けていない元のテストケース
+    pending_converted = {}      # 元のXMLに見つからなかった変換後のテストケース
+    try:
+        with open(original_xml, 'r', encoding='utf-8') as f:
+            originals = _iter_fingerprints([DoubleCdataFixReader(f)], ignore)
+            for converted in _iter_fingerprints(converted_xmls, ignore):
+                counts["converted_testcases"] += 1
+                key = converted[0]
+                if key in pending_converted:
+                    report(key, STATUS_DUPLICATE)
+                    continue
+                original = pending_original.pop(key, None)
+                while original is None:
+                    original = next(originals, None)
+                    if original is None:
+                        break
+                    counts["original_testcases"] += 1
+                    if original[0] != key:
+                        if original[0] in pending_original:
+                            report(original[0], STATUS_DUPLICATE)
+                        pending_original[original[0]] = original
+                        original = None
+                if original is None:
+                    pending_converted[key] = converted
+                else:
+                    compare(original, converted)
+
+            for original in originals:
+                counts["original_testcases"] += 1
+                if original[0] in pending_original:
+                    report(original[0], STATUS_DUPLICATE)
+                pending_original[original[0]] = original
+    except ET.ParseError as pe:
+        raise ValueError(f"XMLの解析に失敗しました: {pe}")
+
+    # 順序が入れ替わっていたものを対応付け、残りを欠落・余分として報告する
+    for key, converted in pending_converted.items():
+        original = pending_original.pop(key, None)
+        if original is None:
+            report(key, STATUS_EXTRA)
+        else:
+            compare(original, converted)
+    for key in pending_original:
+        report(key, STATUS_MISSING)
+
+    total = counts[STATUS_CHANGED] + counts[STATUS_MISSING] + counts[STATUS_EXTRA] + counts[STATUS_DUPLICATE]
+    return {
+        "original": original_xml,
+        "converted": list(converted_xmls),
+        "ignored": sorted(set(ignore)),
+        "valid": total == 0,
+        **counts,
+        "truncated": len(differences) < total,
+        "differences": differences,
+    }
+
+def main(argv=None):
+    """コマンドライン引数の元のXMLと変換後のXMLを比較し、JSONレポートを出力する"""
+    parser = argparse.ArgumentParser(
+        description="XML→CSV→XML の往復変換でテストケースが保たれているかを検証する (差異があれば終了コード1)")
+    parser.add_argument("original", help="元のXML (TestLinkのエクスポート)")
+    parser.add_argument("converted", nargs="+", help="CSVから変換し直したXML (分割出力の場合は全ファイルを順に)")
+    parser.add_argument("-o", "--output", default=None, help="JSONレポートの出力先 (既定: 標準出力)")
+    parser.add_argument("--max-differences", type=int, default=DEFAULT_MAX_DIFFERENCES,
+                        help=f"記録する差異の上限 (既定: {DEFAULT_MAX_DIFFERENCES})")
+    parser.add_argument("--ignore", default="",
+                        help="比較から外す項目をカンマ区切りで指定する (レポートの ignored に記録する。"
+                             + ", ".join(f"{name}: {description}" for name, description in IGNORABLE_FIELDS.items())
+                             + ")")
+    args = parser.parse_args(argv)
+    ignore = [name.strip() for name in args.ignore.split(",") if name.strip()]
+    unknown = [name for name in ignore if name not in IGNORABLE_FIELDS]
+    if unknown:
+        parser.error(f"--ignore に指定できない項目です: {', '.join(unknown)}")
+
+    try:
+        result = verify_roundtrip(args.original, args.converted, args.max_differences, ignore)
+    except (OSError, ValueError) as e:
+        print(f"エラー: {e}")
+        return 2
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        status = "OK" if result["valid"] else "NG"
+        print(f"{status} {result['original']}: 元 {result['original_testcases']}件, 変換後 "
+              f"{result['converted_testcases']}件, 変更 {result[STATUS_CHANGED]}件, 欠落 {result[STATUS_MISSING]}件, "
+              f"余分 {result[STATUS_EXTRA]}件, 重複 {result[STATUS_DUPLICATE]}件")
+    else:
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    return 0 if result["valid"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+
+import column_schema
+
+# 出力するデータベースの形式を変えたときに上げる番号 (meta テーブルに記録する)
+SCHEMA_VERSION = "3"
+
+# まとめて書き込むテストケース数 (1トランザクション)
+DEFAULT_BATCH_SIZE = 5000
+
+# testcase 要素からの値の取り出し方 (header はSQLの列名)。step の列はステップごとに steps テーブルへ書き込む
+EXPORT_COLUMNS = [
+    {"header": "internal_id", "attribute": "internalid"},
+    {"header": "external_id", "element": "externalid"},
+    {"header": "version", "element": "version"},
+    {"header": "name", "attribute": "name"},
+    {"header": "summary", "element": "summary", "html": True},
+    {"header": "importance", "element": "importance"},
+    {"header": "preconditions", "element": "preconditions", "html": True},
+    {"header": "execution_type", "element": "execution_type", "raw": True},
+    {"header": "estimated_exec_duration", "element": "estimated_exec_duration"},
+    {"header": "status", "element": "status"},
+    {"header": "active", "element": "active"},
+    {"header": "is_open", "element": "is_open"},
+    {"header": "step_number", "step": "step_number"},
+    {"header": "actions", "step": "actions", "html": True},
+    {"header": "expected_results", "step": "expectedresults", "html": True},
+    {"header": "step_execution_type", "step": "execution_type", "raw": True},
+]
+EXPORT_PLAN = column_schema.ExtractionPlan(EXPORT_COLUMNS)
+
+# ケース共通の列 (testcases テーブル) とステップの列 (steps テーブル) の名前
+TESTCASE_COLUMNS = [header for index, header in enumerate(EXPORT_PLAN.headers) if index not in EXPORT_PLAN.step_indices]
+STEP_COLUMNS = [EXPORT_PLAN.headers[index] for index in EXPORT_PLAN.step_indices]
+_TESTCASE_INDICES = [index for index in range(len(EXPORT_PLAN.headers)) if index not in EXPORT_PLAN.step_indices]
+
+# ステップの値 (EXPORT_PLAN.extract_steps のステップごとの値) のうちHTMLを含むものの位置
+STEP_HTML_POSITIONS = tuple(EXPORT_PLAN.step_indices.index(index) for index in EXPORT_PLAN.step_layout[3])
+
+_SCHEMA = [
+    "CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE suites (id INTEGER PRIMARY KEY, name TEXT NOT NULL, path TEXT NOT NULL, node_order TEXT NOT NULL)",
+    "CREATE TABLE testcases (id INTEGER PRIMARY KEY, suite_id INTEGER REFERENCES suites (id), "
+    + ", ".join(f"{column} TEXT" for column in TESTCASE_COLUMNS) + ")",
+    "CREATE TABLE steps (testcase_id INTEGER NOT NULL REFERENCES testcases (id), position INTEGER NOT NULL, "
+    + ", ".join(f"{column} TEXT" for column in STEP_COLUMNS) + ", PRIMARY KEY (testcase_id, position)) WITHOUT ROWID",
+    "CREATE TABLE custom_fields (testcase_id INTEGER NOT NULL REFERENCES testcases (id), name TEXT NOT NULL, "
+    "value TEXT, PRIMARY KEY (testcase_id, name)) WITHOUT ROWID",
+]
+
+# 書き込みが終わってから作るインデックス (挿入のたびに更新するより速い)
+_INDEXES = [
+    "CREATE INDEX testcases_internal_id ON testcases (internal_id)",
+    "CREATE INDEX testcases_external_id ON testcases (external_id)",
+    "CREATE INDEX testcases_suite_id ON testcases (suite_id)",
+    "CREATE INDEX suites_name ON suites (name)",
+    "CREATE INDEX suites_path ON suites (path)",
+    "CREATE INDEX custom_fields_name ON custom_fields (name, value)",
+]
+
+class SqliteExportWriter:
+    """テストケース・ステップ・カスタムフィールドを正規化したSQLiteデータベースに書き込む
+
+    batch_size 件ごとに1トランザクションでまとめて挿入し、インデックスは close() で最後に作る。
+    出力先は作り直すファイルなので、書き込み中はジャーナルと同期を無効にする
+    (with 文の中で例外が発生した場合は、書きかけのファイルを削除する)。
+    """
+
+    def __init__(self, output_file, batch_size=DEFAULT_BATCH_SIZE):
+        self.output_file = output_file
+        self.batch_size = batch_size
+        self.count = 0
+        self._suites = {}           # テストスイートの位置 (SuitePath.index) → id
+        self._new_suites = []
+        self._testcases = []
+        self._steps = []
+        self._custom_fields = []
+
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        self._conn = sqlite3.connect(output_file)
+        self._conn.execute("PRAGMA journal_mode = OFF")
+        self._conn.execute("PRAGMA synchronous = OFF")
+        self._conn.execute("PRAGMA cache_size = -65536")   # 64MB
+        with self._conn:
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+            self._conn.execute("INSERT INTO meta (name, value) VALUES (?, ?)", ("schema_version", SCHEMA_VERSION))
+
+        self._insert_testcase = (f"INSERT INTO testcases (id, suite_id, {', '.join(TESTCASE_COLUMNS)}) "
+                                 f"VALUES ({', '.join('?' * (len(TESTCASE_COLUMNS) + 2))})")
+        self._insert_step = (f"INSERT INTO steps (testcase_id, position, {', '.join(STEP_COLUMNS)}) "
+                             f"VALUES ({', '.join('?' * (len(STEP_COLUMNS) + 2))})")
+
+    def write(self, case_row, step_values, suite, custom_fields):
+        """1テストケースを書き込む
+
+        case_row と step_values は EXPORT_PLAN.extract_steps の戻り値 (HTML列は整形済み)、
+        suite は親テストスイート (column_schema.SuitePath)、custom_fields は {カスタムフィールド名: 値}。
+        """
+        suite_id = self._suites.get(suite.index)
+        if suite_id is None:
+            suite_id = self._suites[suite.index] = len(self._suites) + 1
+            self._new_suites.append((suite_id, suite.name, suite.path, suite.order))
+
+        self.count += 1
+        testcase_id = self.count
+        self._testcases.append([testcase_id, suite_id] + [case_row[index] for index in _TESTCASE_INDICES])
+        for position, values in enumerate(step_values, 1):
+            self._steps.append([testcase_id, position] + values)
+        for name, value in custom_fields.items():
+            self._custom_fields.append((testcase_id, name, value))
+
+        if len(self._testcases) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """溜まっている行を1トランザクションで書き込む"""
+        with self._conn:
+            if self._new_suites:
+                self._conn.executemany("INSERT INTO suites (id, name, path, node_order) VALUES (?, ?, ?, ?)", self._new_suites)
+            self._conn.executemany(self._insert_testcase, self._testcases)
+            self._conn.executemany(self._insert_step, self._steps)
+            self._conn.executemany("INSERT INTO custom_fields (testcase_id, name, value) VALUES (?, ?, ?)",
+                                   self._custom_fields)
+        self._new_suites = []
+        self._testcases = []
+        self._steps = []
+        self._custom_fields = []
+
+    def close(self):
+        """残りの行を書き込み、インデックスを作ってデータベースを閉じる"""
+        self.flush()
+        with self._conn:
+            for statement in _INDEXES:
+                self._conn.execute(statement)
+            self._conn.execute("INSERT INTO meta (name, value) VALUES (?, ?)", ("testcases", str(self.count)))
+        self._conn.execute("ANALYZE")
+        self._conn.close()
+
+    def abort(self):
+        """データベースを閉じて書きかけのファイルを削除する"""
+        self._conn.close()
+        if os.path.exists(self.output_file):
+            os.remove(self.output_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
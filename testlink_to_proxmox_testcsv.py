@@ -1,20 +1,33 @@
 import os
+import queue
 import sys
+import threading
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 import xml.etree.ElementTree as ET
 import traceback
 
 # 他の処理モジュールをインポート
 import xml_processor
 import csv_processor
+from progress import Progress, ConversionCancelled
+
+# ワーカースレッドからの通知を確認する間隔 (ミリ秒)
+POLL_INTERVAL_MS = 100
 
 class TestLinkConverter:
     def __init__(self, root):
         self.root = root
         self.root.title("TestLink XML-CSV Converter")
-        self.root.geometry("400x200")
+        self.root.geometry("400x320")
         self.root.resizable(False, False)
+        self.root.protocol("WM_DELETE_WINDOW", self.exit_app)
+
+        # 実行中の変換 (ワーカースレッドと進捗) と通知用のキュー
+        self.worker = None
+        self.progress = None
+        self.exit_requested = False
+        self.messages = queue.Queue()
 
         # GUI要素の作成
         self.create_widgets()
@@ -33,11 +46,20 @@ class TestLinkConverter:
                                         command=self.process_csv_to_xml) # 呼び出す関数名を変更
         self.btn_csv_to_xml.pack(pady=10)
 
+        # キャンセルボタン (変換中のみ有効)
+        self.btn_cancel = tk.Button(self.root, text="キャンセル", width=20,
+                                    command=self.cancel_conversion, state=tk.DISABLED)
+        self.btn_cancel.pack(pady=5)
+
         # 終了ボタン
         self.btn_exit = tk.Button(self.root, text="終了", width=20, height=2,
-                                  command=self.root.destroy)
+                                  command=self.exit_app)
         self.btn_exit.pack(pady=10)
 
+        # 進捗バー (読み込んだバイト数の割合)
+        self.progress_bar = ttk.Progressbar(self.root, mode="determinate", maximum=100)
+        self.progress_bar.pack(fill=tk.X, padx=10)
+
         # ステータス表示ラベル
         self.lbl_status = tk.Label(self.root, text="ステータス: ", anchor="w")
         self.lbl_status.pack(fill=tk.X, padx=10, pady=10)
@@ -45,7 +67,6 @@ class TestLinkConverter:
     def update_status(self, message):
         """ステータスメッセージを更新する"""
         self.lbl_status.config(text=f"ステータス: {message}")
-        self.root.update()
 
     def process_xml_to_csv(self):
         """XMLファイルをCSVに変換するプロセス"""
@@ -57,30 +78,12 @@ class TestLinkConverter:
             self.update_status("ファイルが選択されていません")
             return
 
-        try:
-            self.update_status("XMLファイルを解析中...")
-
-            # XML内容の読み込みと修正（二重CDATAなど）
-            with open(xml_file, 'r', encoding='utf-8') as f:
-                xml_content = f.read()
-            fixed_xml_content = xml_processor.fix_double_cdata(xml_content) # xml_processorの関数を使用
-
-            # XMLをパースしてルート要素とテストスイート名を取得
-            root_element, testsuite_name = xml_processor.parse_xml_root(fixed_xml_content)
-
-            # 出力CSVファイル名の生成
-            output_file = os.path.splitext(xml_file)[0] + ".csv"
-
-            # XMLからCSVへの変換処理を呼び出し
-            xml_processor.convert_xml_to_csv(root_element, testsuite_name, output_file) # xml_processorの関数を使用
-
-            self.update_status(f"変換完了: {output_file}")
-            messagebox.showinfo("変換完了", f"CSVファイルに変換しました:\n{output_file}")
+        # 出力CSVファイル名の生成
+        output_file = os.path.splitext(xml_file)[0] + ".csv"
 
-        except Exception as e:
-            error_details = traceback.format_exc()
-            self.update_status(f"エラー: {str(e)}")
-            messagebox.showerror("エラー", f"XML→CSV変換中にエラーが発生しました:\n{str(e)}\n\n詳細:\n{error_details}")
+        # 二重CDATAを修正しながらストリーミングでCSVに変換 (xml_processorの関数を使用)
+        self.start_conversion("XML→CSV", xml_processor.convert_xml_file_to_csv, xml_file, output_file,
+                              "CSVファイルに変換しました")
 
     def process_csv_to_xml(self):
         """CSVファイルをXMLに変換するプロセス"""
@@ -92,22 +95,121 @@ class TestLinkConverter:
             self.update_status("ファイルが選択されていません")
             return
 
+        # 出力XMLファイル名の生成
+        output_file = os.path.splitext(csv_file)[0] + "_converted.xml"
+
+        # 1行ずつ読み込んでテストケースごとに書き出す (csv_processorの関数を使用)
+        self.start_conversion("CSV→XML", csv_processor.stream_csv_to_xml, csv_file, output_file,
+                              "XMLファイルに変換しました")
+
+    def start_conversion(self, title, convert, input_file, output_file, done_message):
+        """変換をワーカースレッドで開始し、完了までキューの通知を監視する"""
+        self.progress = Progress(callback=lambda info: self.messages.put(("progress", info)))
+        self.set_running(True)
+        self.progress_bar["value"] = 0
+        self.update_status(f"{os.path.basename(input_file)} を変換中...")
+
+        self.worker = threading.Thread(
+            target=self.run_conversion,
+            args=(title, convert, input_file, output_file, done_message, self.progress),
+            daemon=True)
+        self.worker.start()
+        self.root.after(POLL_INTERVAL_MS, self.poll_messages)
+
+    def run_conversion(self, title, convert, input_file, output_file, done_message, progress):
+        """ワーカースレッドで変換を実行し、結果をキューで通知する (GUIには触れない)"""
         try:
-            self.update_status("CSVファイルを解析中...")
+            convert(input_file, output_file, progress=progress)
+            self.messages.put(("done", (title, done_message, output_file)))
+        except ConversionCancelled:
+            # 途中まで書き込まれた出力ファイルは残さない
+            remove_partial_output(output_file)
+            self.messages.put(("cancelled", output_file))
+        except Exception as e:
+            remove_partial_output(output_file)
+            self.messages.put(("error", (title, str(e), traceback.format_exc())))
 
-            # 出力XMLファイル名の生成
-            output_file = os.path.splitext(csv_file)[0] + "_converted.xml"
+    def poll_messages(self):
+        """ワーカースレッドからの通知を処理する (メインスレッドで定期的に実行)"""
+        finished = None
+        try:
+            while True:
+                kind, payload = self.messages.get_nowait()
+                if kind == "progress":
+                    self.show_progress(payload)
+                else:
+                    finished = (kind, payload)
+        except queue.Empty:
+            pass
+
+        if finished is None:
+            self.root.after(POLL_INTERVAL_MS, self.poll_messages)
+            return
 
-            # CSVからXMLへの変換処理を呼び出し
-            csv_processor.convert_csv_to_xml(csv_file, output_file) # csv_processorの関数を使用
+        self.worker = None
+        self.progress = None
+        self.set_running(False)
+        if self.exit_requested:
+            self.root.destroy()
+            return
 
+        kind, payload = finished
+        if kind == "done":
+            title, done_message, output_file = payload
+            self.progress_bar["value"] = 100
             self.update_status(f"変換完了: {output_file}")
-            messagebox.showinfo("変換完了", f"XMLファイルに変換しました:\n{output_file}")
-
-        except Exception as e:
-            error_details = traceback.format_exc()
-            self.update_status(f"エラー: {str(e)}")
-            messagebox.showerror("エラー", f"CSV→XML変換中にエラーが発生しました:\n{str(e)}\n\n詳細:\n{error_details}")
+            messagebox.showinfo("変換完了", f"{done_message}:\n{output_file}")
+        elif kind == "cancelled":
+            self.progress_bar["value"] = 0
+            self.update_status("キャンセルしました")
+        else:
+            title, message, error_details = payload
+            self.update_status(f"エラー: {message}")
+            messagebox.showerror("エラー", f"{title}変換中にエラーが発生しました:\n{message}\n\n詳細:\n{error_details}")
+
+    def show_progress(self, info):
+        """進捗 (テストケース数、読み込み量、残り時間) を表示する"""
+        total_mb = info["total_bytes"] / (1024 * 1024)
+        read_mb = info["bytes"] / (1024 * 1024)
+        if info["total_bytes"]:
+            self.progress_bar["value"] = min(100, info["bytes"] * 100 / info["total_bytes"])
+        message = f"{info['cases']}件処理 ({read_mb:.1f} / {total_mb:.1f} MB)"
+        if info["eta"] is not None:
+            minutes, seconds = divmod(int(info["eta"]), 60)
+            message += f" 残り約 {minutes}分{seconds:02d}秒"
+        self.update_status(message)
+
+    def set_running(self, running):
+        """変換中はボタンを無効にし、キャンセルボタンだけを有効にする"""
+        state = tk.DISABLED if running else tk.NORMAL
+        self.btn_xml_to_csv.config(state=state)
+        self.btn_csv_to_xml.config(state=state)
+        self.btn_cancel.config(state=tk.NORMAL if running else tk.DISABLED)
+
+    def cancel_conversion(self):
+        """実行中の変換にキャンセルを要求する"""
+        if self.progress is not None:
+            self.progress.cancel()
+            self.btn_cancel.config(state=tk.DISABLED)
+            self.update_status("キャンセルしています...")
+
+    def exit_app(self):
+        """アプリケーションを終了する (変換中ならキャンセルして終了を待つ)"""
+        if self.worker is None:
+            self.root.destroy()
+            return
+        if not messagebox.askyesno("確認", "変換中です。キャンセルして終了しますか？"):
+            return
+        self.exit_requested = True
+        self.cancel_conversion()
+
+def remove_partial_output(output_file):
+    """途中まで書き込まれた出力ファイルを削除する"""
+    try:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+    except OSError as e:
+        print(f"警告: 出力ファイルを削除できませんでした: {output_file}: {e}")
 
 def main():
     """アプリケーションを起動する"""
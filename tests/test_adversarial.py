@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+import conversion_cache
+import corpus_generator
+import xml_processor
+from text_utils import strip_cdata_markers
+
+SMALL = 20000
+LARGE = 200000
+# 入力を SMALL から LARGE に増やしたときの処理時間の倍率の上限 (2乗で増えれば 100 倍になる)
+MAX_GROWTH = LARGE / SMALL * 3
+# 短すぎて計測の誤差が大きい処理時間はこの値 (秒) とみなす
+MIN_SECONDS = 0.002
+
+STAGES = {
+    "fix_double_cdata": xml_processor.fix_double_cdata,
+    "clean_html": xml_processor.clean_html,
+    "strip_cdata_markers": strip_cdata_markers,
+}
+
+
+def _best_seconds(func, text, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@pytest.mark.parametrize("stage", list(STAGES))
+@pytest.mark.parametrize("kind", list(corpus_generator.ADVERSARIAL_KINDS))
+def test_adversarial_input_stays_linear(kind, stage):
+    func = STAGES[stage]
+    with conversion_cache.disabled():
+        small = _best_seconds(func, corpus_generator.adversarial_html(kind, SMALL))
+        large = _best_seconds(func, corpus_generator.adversarial_html(kind, LARGE))
+    assert large <= 0.5 + 3.0 * LARGE / 1e6
+    assert large <= max(small, MIN_SECONDS) * MAX_GROWTH, (small, large)
+
+
+def test_oversized_field_is_degraded(monkeypatch, capsys):
+    monkeypatch.setattr(xml_processor, "HTML_FIELD_MAX_CHARS", 10)
+    with conversion_cache.disabled():
+        text = xml_processor.clean_html("<ul><li>項目1</li><li>項目2</li></ul><p>a &amp; b</p>")
+    assert text == "項目1\n項目2\na & b"
+    assert "上限の 10 文字を超える" in capsys.readouterr().out
+
+
+def test_field_over_time_budget_is_degraded(monkeypatch, capsys):
+    monkeypatch.setattr(xml_processor, "HTML_FIELD_TIME_BUDGET", 0.0)
+    with conversion_cache.disabled():
+        # CDATAを含むため1パス実装ではなく、制限時間を確認する従来方式で処理される
+        text = xml_processor.clean_html("<![CDATA[<ul><li>項目1</li><li>項目2</li></ul>]]>")
+    assert text == "項目1\n項目2"
+    assert "処理に 0.0 秒以上かかる" in capsys.readouterr().out
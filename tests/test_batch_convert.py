@@ -0,0 +1,53 @@
+import json
+
+import batch_convert
+import corpus_generator
+
+
+def test_failed_xml_to_csv_removes_partial_output(tmp_path):
+    xml_file = tmp_path / "bad.xml"
+    xml_file.write_text('<?xml version="1.0"?>\n<testcases><testcase name="a"><summary>x</summary>'
+                        '</testcase><testcase name="b"><summary>', encoding="utf-8")
+    csv_file = tmp_path / "bad.csv"
+    csv_file.write_text("以前の出力", encoding="utf-8")
+    ok, _, _, _ = batch_convert.convert_file(str(xml_file), str(csv_file))
+    assert not ok
+    assert not csv_file.exists()
+
+
+def test_xml_to_csv_failing_before_writing_keeps_previous_output(tmp_path):
+    csv_file = tmp_path / "missing.csv"
+    csv_file.write_text("以前の出力", encoding="utf-8")
+    ok, _, _, _ = batch_convert.convert_file(str(tmp_path / "missing.xml"), str(csv_file))
+    assert not ok
+    assert csv_file.read_text(encoding="utf-8") == "以前の出力"
+
+
+def test_failed_csv_to_xml_keeps_previous_output(tmp_path):
+    csv_file = tmp_path / "x.csv"
+    csv_file.write_text("a,b\n1,2\n", encoding="utf-8")
+    xml_file = tmp_path / "x_converted.xml"
+    xml_file.write_text("<testcases/>", encoding="utf-8")
+    ok, _, _, _ = batch_convert.convert_file(str(csv_file), str(xml_file))
+    assert not ok
+    assert xml_file.read_text(encoding="utf-8") == "<testcases/>"
+
+
+def test_summary_and_report_include_conversion_cache_stats(tmp_path, capsys):
+    xml_file = tmp_path / "input.xml"
+    corpus_generator.write_xml(str(xml_file), cases=20)
+    report_dir = tmp_path / "reports"
+    assert batch_convert.main([str(xml_file), "-w", "1", "--report-dir", str(report_dir)]) == 0
+    assert "変換キャッシュ: ヒット " in capsys.readouterr().out
+    with open(report_dir / "input.xml.report.json", encoding="utf-8") as f:
+        stats = json.load(f)["conversion_cache"]
+    assert stats["enabled"]
+    assert stats["hits"] + stats["misses"] > 0
+
+    assert batch_convert.main([str(xml_file), "-w", "1", "--report-dir", str(report_dir),
+                               "--no-conversion-cache"]) == 0
+    assert "変換キャッシュ: 無効" in capsys.readouterr().out
+    with open(report_dir / "input.xml.report.json", encoding="utf-8") as f:
+        stats = json.load(f)["conversion_cache"]
+    assert not stats["enabled"]
+    assert stats["hits"] + stats["misses"] == 0
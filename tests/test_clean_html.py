@@ -0,0 +1,28 @@
+import random
+
+import pytest
+
+import benchmark
+import conversion_cache
+import xml_processor
+
+
+@pytest.mark.parametrize("text", benchmark.CLEAN_HTML_CORPUS)
+def test_clean_html_matches_baseline_implementation(text):
+    with conversion_cache.disabled():
+        assert xml_processor.clean_html(text) == benchmark._baseline_clean_html(text)
+
+
+def test_clean_html_matches_baseline_implementation_on_random_tags():
+    rng = random.Random(0)
+    pieces = ["<p>", "</p>", "<ul>", "</ul>", "<ol", "</ol>", "<li", "<li>", "</li>",
+              "<b>", "</b>", "<br />", ">", "<", "x", " ", "\n", "&amp;", "&lt;", "<![CDATA[", "]]>"]
+    with conversion_cache.disabled():
+        for _ in range(3000):
+            text = "".join(rng.choice(pieces) for _ in range(rng.randint(1, 12)))
+            assert xml_processor.clean_html(text) == benchmark._baseline_clean_html(text), text
+
+
+def test_malformed_list_opener_falls_back():
+    assert xml_processor._clean_html_tokens("<ol<b>x</b></ol>") is None
+    assert xml_processor._clean_html_tokens("<li<pre>y</li>") is None
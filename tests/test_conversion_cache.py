@@ -0,0 +1,29 @@
+import threading
+
+from conversion_cache import ConversionCache
+
+
+def test_disabled_only_affects_current_thread():
+    cache = ConversionCache()
+    entered = threading.Event()
+    release = threading.Event()
+    other_thread_results = []
+
+    def other_thread():
+        entered.wait()
+        other_thread_results.append(cache.get_or_compute("kind", "text", str.upper))
+        other_thread_results.append(cache.get_or_compute("kind", "text", str.upper))
+        release.set()
+
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    with cache.disabled():
+        assert not cache.active()
+        entered.set()
+        release.wait()
+        assert cache.get_or_compute("kind", "other", str.upper) == "OTHER"
+    thread.join()
+    assert cache.active()
+    assert other_thread_results == ["TEXT", "TEXT"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
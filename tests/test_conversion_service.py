@@ -0,0 +1,36 @@
+import os
+
+from conversion_service import ConversionService
+
+
+def _crash(input_file, output_file, **options):
+    os._exit(1)
+
+
+def _succeed(input_file, output_file, **options):
+    return True, 0.0, None
+
+
+def test_broken_pool_is_rebuilt_outside_the_lock():
+    service = ConversionService(workers=1)
+    try:
+        broken = service._executor
+        lock_held = []
+        start_executor = service._start_executor
+
+        def start_and_check():
+            lock_held.append(service._lock.locked())
+            return start_executor()
+
+        service._start_executor = start_and_check
+        service._convert_file = _crash
+        ok, _, message = service.convert("in.xml", "out.csv", "csv", {})
+        assert not ok and "異常終了" in message
+        assert lock_held == [False]
+        assert service._executor is not broken
+
+        service._convert_file = _succeed
+        assert service.convert("in.xml", "out.csv", "csv", {}) == (True, 0.0, None)
+        assert service.metrics()["in_flight"] == 0
+    finally:
+        service.close()
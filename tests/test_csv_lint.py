@@ -0,0 +1,60 @@
+import csv
+
+from csv_lint import lint_csv
+from xml_processor import CSV_HEADERS
+
+_CASE = {"バージョン": "1", "サマリ（概要）": "概要", "重要度": "2", "実行タイプ": "1"}
+
+
+def _step(number):
+    return {"ステップ番号": str(number), "アクション（手順）": "操作", "期待結果": "結果", "実行タイプ": "1"}
+
+
+def _lint(tmp_path, rows):
+    csv_file = tmp_path / "input.csv"
+    with open(csv_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADERS)
+        for values in rows:
+            row = [""] * len(CSV_HEADERS)
+            for name, value in values.items():
+                row[CSV_HEADERS.index(name)] = value
+            writer.writerow(row)
+    return lint_csv(str(csv_file))
+
+
+def _codes(report):
+    return [problem["code"] for problem in report["problems"]]
+
+
+def test_non_contiguous_rows_continue_the_testcase(tmp_path):
+    report = _lint(tmp_path, [
+        dict(_CASE, ID="1", テストケース名="A", **_step(1)),
+        dict(_CASE, ID="2", テストケース名="B"),
+        dict(ID="1", **_step(2)),
+    ])
+    assert _codes(report) == ["non_contiguous"]
+    assert report["valid"]
+    assert report["testcases"] == 2
+
+
+def test_step_numbers_are_checked_across_segments(tmp_path):
+    report = _lint(tmp_path, [
+        dict(_CASE, ID="1", テストケース名="A", **_step(1)),
+        dict(ID="1", **_step(3)),
+        dict(_CASE, ID="2", テストケース名="B"),
+        dict(ID="1", **_step(3)),
+        dict(_CASE, ID="3", テストケース名="C"),
+        dict(ID="1", **_step(2)),
+    ])
+    assert _codes(report) == ["non_contiguous", "duplicate_step_number", "non_contiguous", "step_order"]
+    assert not report["valid"]
+
+
+def test_contiguous_testcase_is_checked_once(tmp_path):
+    report = _lint(tmp_path, [
+        dict(_CASE, ID="1", テストケース名="A", 重要度="9", **_step(1)),
+        dict(ID="1", **_step(2)),
+    ])
+    assert _codes(report) == ["invalid_importance"]
+    assert report["testcases"] == 1
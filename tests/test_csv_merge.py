@@ -0,0 +1,78 @@
+import csv
+
+import pytest
+
+from csv_merge import POLICY_FAIL, MergeConflictError, merge_csv_to_xml, merge_testcases, DiskMergeIndex
+from xml_processor import CSV_HEADERS
+
+_CASE = {"バージョン": "1", "サマリ（概要）": "概要", "重要度": "2", "実行タイプ": "1"}
+
+
+def _step(number, action="操作"):
+    return {"ステップ番号": str(number), "アクション（手順）": action, "期待結果": "結果", "実行タイプ": "1"}
+
+
+def _write_csv(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADERS)
+        for values in rows:
+            row = [""] * len(CSV_HEADERS)
+            for name, value in values.items():
+                row[CSV_HEADERS.index(name)] = value
+            writer.writerow(row)
+    return str(path)
+
+
+def test_contiguous_and_split_copies_of_a_testcase_do_not_conflict(tmp_path):
+    first = _write_csv(tmp_path / "first.csv", [
+        dict(_CASE, ID="1", テストケース名="A", **_step(1)),
+        dict(ID="1", **_step(2)),
+    ])
+    second = _write_csv(tmp_path / "second.csv", [
+        dict(_CASE, ID="1", テストケース名="A", **_step(1)),
+        dict(_CASE, ID="2", テストケース名="B"),
+        dict(ID="1", **_step(2)),
+    ])
+    index, stats = merge_testcases([first, second], POLICY_FAIL)
+    assert stats["testcases"] == 3
+    assert stats["duplicates"] == 1
+    assert stats["merged"] == 2
+    assert [len(record.steps) for _, record in index.items()] == [2, 0]
+
+
+def test_conflict_in_a_later_block_is_detected(tmp_path):
+    first = _write_csv(tmp_path / "first.csv", [
+        dict(_CASE, ID="1", テストケース名="A", **_step(1)),
+    ])
+    second = _write_csv(tmp_path / "second.csv", [
+        dict(_CASE, ID="1", テストケース名="A", **_step(1)),
+        dict(_CASE, ID="2", テストケース名="B"),
+        dict(ID="1", **_step(2)),
+    ])
+    with pytest.raises(MergeConflictError):
+        merge_testcases([first, second], POLICY_FAIL)
+
+
+def test_key_matches_conversion_grouping(tmp_path):
+    only = _write_csv(tmp_path / "only.csv", [
+        dict(_CASE, 外部ID="E1", テストケース名="A", **_step(1)),
+        dict(_CASE, テストケース名="B"),
+        dict(外部ID="E2", テストケース名="A", **_step(2)),
+    ])
+    index, stats = merge_testcases([only], index=DiskMergeIndex(str(tmp_path)))
+    try:
+        assert [key for key, _ in index.items()] == ["NAME_A", "NAME_B"]
+        assert stats["testcases"] == 2
+    finally:
+        index.close()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["only.csv"]
+
+
+def test_merge_csv_to_xml_writes_each_testcase_once(tmp_path):
+    first = _write_csv(tmp_path / "first.csv", [dict(_CASE, ID="1", テストケース名="A", **_step(1))])
+    second = _write_csv(tmp_path / "second.csv", [dict(_CASE, ID="1", テストケース名="A", バージョン="2", **_step(1))])
+    output = tmp_path / "merged.xml"
+    stats = merge_csv_to_xml([first, second], str(output), index_type="disk", spill_dir=str(tmp_path))
+    assert stats["merged"] == 1
+    assert output.read_text(encoding='utf-8').count("<testcase ") == 1
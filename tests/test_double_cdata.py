@@ -0,0 +1,50 @@
+import io
+import random
+
+import pytest
+
+import benchmark
+from xml_processor import DoubleCdataFixReader, fix_double_cdata
+
+
+def _read_all(text, chunk_size, max_hold=64 * 1024 * 1024):
+    reader = DoubleCdataFixReader(io.StringIO(text), chunk_size=chunk_size, max_hold=max_hold)
+    parts = []
+    while True:
+        part = reader.read(7)
+        if not part:
+            break
+        parts.append(part)
+    return "".join(parts)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 8, 64])
+def test_reader_matches_fix_double_cdata(chunk_size):
+    rng = random.Random(chunk_size)
+    pieces = ["<![CDATA[", "]]>", " ", "\n", "x", "<", "]", "!", "[CDATA["]
+    for _ in range(500):
+        text = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 30)))
+        assert _read_all(text, chunk_size) == fix_double_cdata(text)
+
+
+def test_fix_double_cdata_matches_baseline_implementation():
+    rng = random.Random(0)
+    pieces = ["<![CDATA[", "]]>", " ", "\n", "x", "<", "]", "!", "[CDATA["]
+    for _ in range(3000):
+        text = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 30)))
+        assert fix_double_cdata(text) == benchmark._baseline_fix_double_cdata(text), text
+
+
+def test_unclosed_opener_is_kept_as_is():
+    text = "<a><![CDATA[ <![CDATA[本文</a>"
+    assert _read_all(text, 4) == text
+
+
+def test_opener_is_held_until_closer():
+    text = "<a><![CDATA[<![CDATA[" + "x" * 100 + "]]>]]></a>"
+    assert _read_all(text, 3) == "<a><![CDATA[" + "x" * 100 + "]]></a>"
+
+
+def test_overflow_flushes_opener_as_is():
+    text = "<a><![CDATA[<![CDATA[" + "x" * 100 + "]]>]]></a>"
+    assert _read_all(text, 3, max_hold=20) == text
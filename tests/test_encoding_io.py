@@ -0,0 +1,33 @@
+import encoding_io
+from csv_reader import iter_csv_rows
+
+
+def _write_rows(path, rows, bad_byte=False):
+    with open(path, 'wb') as f:
+        f.write(b"a,b\n")
+        for number in range(rows):
+            f.write(f"{number},{'x' * 100}".encode("utf-8") + (b"\xff" if bad_byte else b"") + b"\n")
+
+
+def test_interleaved_readers_count_into_their_own_stats(tmp_path):
+    lossy = tmp_path / "lossy.csv"
+    clean = tmp_path / "clean.csv"
+    _write_rows(lossy, 1000, bad_byte=True)
+    _write_rows(clean, 1000)
+    lossy_warnings = []
+    clean_warnings = []
+
+    lossy_rows = iter_csv_rows(str(lossy), encoding="utf-8", warn=lossy_warnings.append)
+    clean_rows = iter_csv_rows(str(clean), encoding="utf-8", warn=clean_warnings.append)
+    next(lossy_rows)
+    next(clean_rows)
+    # 書き込みのストリームも同じスレッドで交互に使う
+    stats = encoding_io.EncodingStats()
+    with encoding_io.open_text_writer(str(tmp_path / "out.csv"), "shift_jis", stats) as f:
+        for _ in lossy_rows:
+            f.write("\U0001F600\n")
+    list(clean_rows)
+
+    assert lossy_warnings == [f"警告: {lossy} の 1000 箇所を文字コード utf-8 として読めなかったため置き換えました"]
+    assert clean_warnings == []
+    assert (stats.replaced, stats.lost) == (0, 1000)
@@ -0,0 +1,37 @@
+import result_cache
+from result_cache import ResultCache, content_key
+
+
+def _total_bytes(cache):
+    return cache._conn.execute("SELECT COALESCE(SUM(size), 0) FROM usage").fetchone()[0]
+
+
+def test_size_cap_is_enforced_on_every_flush(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "_FLUSH_SIZE", 10)
+    cache = ResultCache(str(tmp_path), max_bytes=2000)
+    try:
+        for number in range(200):
+            cache.put(content_key([number], b"test\x00"), "x" * 100)
+            assert _total_bytes(cache) <= 2000
+        assert cache.evicted > 0
+    finally:
+        cache.close()
+
+
+def test_two_caches_share_the_cap(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "_FLUSH_SIZE", 10)
+    first = ResultCache(str(tmp_path), max_bytes=3000)
+    second = ResultCache(str(tmp_path), max_bytes=3000)
+    try:
+        for number in range(100):
+            first.put(content_key([number], b"first\x00"), "x" * 100)
+            second.put(content_key([number], b"second\x00"), "y" * 100)
+        first.close()
+        second.close()
+        check = ResultCache(str(tmp_path), max_bytes=3000)
+        assert _total_bytes(check) <= 3000
+        check.close()
+    finally:
+        first.close()
+        second.close()
+
@@ -0,0 +1,71 @@
+import pytest
+
+from csv_to_xml import stream_csv_to_xml
+from roundtrip_verify import canonical_text, verify_roundtrip
+from xml_processor import stream_xml_to_csv
+
+XML = """<?xml version="1.0" encoding="UTF-8"?>
+<testsuite name="ルート">
+  <testcase internalid="1" name="リストを含む">
+    <externalid><![CDATA[1]]></externalid>
+    <version><![CDATA[1]]></version>
+    <summary><![CDATA[<p>前文</p>
+<p>・項目A</p>
+<p>・ 項目B &amp; C</p>]]></summary>
+    <preconditions><![CDATA[<p>準備</p>]]></preconditions>
+    <importance><![CDATA[2]]></importance>
+    <execution_type><![CDATA[1]]></execution_type>
+    <steps>
+      <step>
+        <step_number><![CDATA[1]]></step_number>
+        <actions><![CDATA[<p>・手順1</p><p>・手順2</p>]]></actions>
+        <expectedresults><![CDATA[<p>結果</p>]]></expectedresults>
+        <execution_type><![CDATA[1]]></execution_type>
+      </step>
+    </steps>
+    <custom_fields>
+      <custom_field><name><![CDATA[担当]]></name><value><![CDATA[山田]]></value></custom_field>
+    </custom_fields>
+  </testcase>
+</testsuite>
+"""
+
+
+def _round_trip(tmp_path):
+    original = tmp_path / "original.xml"
+    original.write_text(XML, encoding="utf-8")
+    csv_file = tmp_path / "converted.csv"
+    converted = tmp_path / "converted.xml"
+    stream_xml_to_csv(str(original), str(csv_file))
+    stream_csv_to_xml(str(csv_file), str(converted))
+    return original, converted
+
+
+def test_bullet_lines_survive_the_round_trip(tmp_path):
+    original, converted = _round_trip(tmp_path)
+    assert "<li>" in converted.read_text(encoding="utf-8")
+
+    report = verify_roundtrip(str(original), str(converted), ignore=["custom_fields", "suites"])
+    assert report["differences"] == []
+    assert report["valid"]
+    assert report["matched"] == 1
+    assert report["ignored"] == ["custom_fields", "suites"]
+
+
+def test_lost_custom_fields_and_suites_are_reported(tmp_path):
+    original, converted = _round_trip(tmp_path)
+
+    report = verify_roundtrip(str(original), str(converted))
+    assert not report["valid"]
+    assert report["ignored"] == []
+    assert report["differences"] == [
+        {"key": "ID_1", "status": "changed", "fields": ["testsuite_path", "custom_fields[担当]"]}]
+
+    with pytest.raises(ValueError):
+        verify_roundtrip(str(original), str(converted), ignore=["summary"])
+
+
+def test_list_items_compare_as_bullet_lines():
+    assert canonical_text("<ol>\n<li><p>A</p></li>\n<li><p>B</p></li>\n</ol>", True) == "・A ・B"
+    assert canonical_text("<p>・A</p><p>・ B</p>", True) == "・A ・B"
+    assert canonical_text("<ul><li>A</li></ul>", True) != canonical_text("", True)
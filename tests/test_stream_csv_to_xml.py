@@ -0,0 +1,102 @@
+import csv
+import os
+
+import pytest
+
+from csv_to_xml import stream_csv_to_xml, write_testcase_groups
+from xml_processor import CSV_HEADERS
+
+
+_CASE = {"バージョン": "1", "サマリ（概要）": "概要", "重要度": "2", "実行タイプ": "1"}
+
+
+def _write_csv(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADERS)
+        for values in rows:
+            row = [""] * len(CSV_HEADERS)
+            for name, value in values.items():
+                row[CSV_HEADERS.index(name)] = value
+            writer.writerow(row)
+
+
+def test_auto_fallback_prints_warnings_once(tmp_path, capsys):
+    csv_file = tmp_path / "input.csv"
+    _write_csv(csv_file, [
+        dict(_CASE, ID="1", テストケース名="A"),
+        {},
+        dict(_CASE, ID="2", テストケース名="B"),
+        dict(_CASE, ID="1", テストケース名="A"),
+    ])
+    output = tmp_path / "output.xml"
+    stream_csv_to_xml(str(csv_file), str(output))
+
+    out = capsys.readouterr().out
+    assert out.count("行 3 にはテストケースIDも名前もありません") == 1
+    assert "グループ化し直します" in out
+    assert output.read_text(encoding='utf-8').count("<testcase ") == 2
+    assert sorted(os.listdir(tmp_path)) == ["input.csv", "output.xml"]
+
+
+def test_failed_conversion_leaves_no_output(tmp_path):
+    output = tmp_path / "output.xml"
+
+    def failing_groups():
+        yield from ()
+        raise RuntimeError("中断")
+
+    with pytest.raises(RuntimeError):
+        write_testcase_groups(failing_groups(), str(output))
+    assert os.listdir(tmp_path) == []
+
+
+def test_first_pass_does_not_capture_other_output(tmp_path, capsys, monkeypatch):
+    import csv_to_xml
+
+    csv_file = tmp_path / "input.csv"
+    _write_csv(csv_file, [
+        dict(_CASE, ID="1", テストケース名="A"),
+        {},
+        dict(_CASE, ID="2", テストケース名="B"),
+        dict(_CASE, ID="1", テストケース名="A"),
+    ])
+    iter_csv_rows = csv_to_xml.iter_csv_rows
+
+    def printing_iter_csv_rows(*args):
+        # 変換と同時に動く別の処理の出力 (標準出力を差し替えていれば溜められてしまう)
+        print("他の出力")
+        return iter_csv_rows(*args)
+
+    monkeypatch.setattr(csv_to_xml, "iter_csv_rows", printing_iter_csv_rows)
+    stream_csv_to_xml(str(csv_file), str(tmp_path / "output.xml"))
+
+    out = capsys.readouterr().out
+    assert out.count("他の出力") == 2
+    assert out.count("行 3 にはテストケースIDも名前もありません") == 1
+
+
+def test_failed_sharded_run_keeps_previous_shards(tmp_path):
+    csv_file = tmp_path / "input.csv"
+    _write_csv(csv_file, [dict(_CASE, ID=str(n), テストケース名=f"T{n}") for n in range(1, 4)])
+    output = tmp_path / "output.xml"
+    stream_csv_to_xml(str(csv_file), str(output), shard_cases=1)
+    previous = {name: (tmp_path / name).read_bytes() for name in os.listdir(tmp_path) if name != "input.csv"}
+    assert sorted(previous) == ["output_001.xml", "output_002.xml", "output_003.xml", "output_manifest.json"]
+
+    def failing_groups():
+        yield from ()
+        raise RuntimeError("中断")
+
+    with pytest.raises(RuntimeError):
+        write_testcase_groups(failing_groups(), str(output), shard_cases=1)
+    assert {name: (tmp_path / name).read_bytes() for name in os.listdir(tmp_path) if name != "input.csv"} == previous
+
+
+def test_sharded_run_replaces_previous_shards(tmp_path):
+    csv_file = tmp_path / "input.csv"
+    _write_csv(csv_file, [dict(_CASE, ID=str(n), テストケース名=f"T{n}") for n in range(1, 4)])
+    output = tmp_path / "output.xml"
+    stream_csv_to_xml(str(csv_file), str(output), shard_cases=1)
+    stream_csv_to_xml(str(csv_file), str(output), shard_cases=2)
+    assert sorted(os.listdir(tmp_path)) == ["input.csv", "output_001.xml", "output_002.xml", "output_manifest.json"]
@@ -0,0 +1,65 @@
+import io
+import sqlite3
+import xml.etree.ElementTree as ET
+
+import xml_processor
+
+XML = """<?xml version="1.0" encoding="UTF-8"?>
+<testsuite name="ルート">
+  <node_order><![CDATA[5]]></node_order>
+  <testsuite name="A">
+    <node_order><![CDATA[20]]></node_order>
+    <testcase name="a1"><node_order><![CDATA[9]]></node_order></testcase>
+    <testsuite name="A1">
+      <testcase name="a11"/>
+    </testsuite>
+  </testsuite>
+  <testsuite name="B">
+    <node_order><![CDATA[10]]></node_order>
+    <testcase name="b1"/>
+  </testsuite>
+  <testsuite name="B">
+    <node_order><![CDATA[10]]></node_order>
+    <testcase name="b2"/>
+  </testsuite>
+</testsuite>
+"""
+
+EXPECTED = [
+    ("a1", "A", "ルート/A", "5/20"),
+    ("a11", "A1", "ルート/A/A1", "5/20/1"),
+    ("b1", "B", "ルート/B", "5/10"),
+    ("b2", "B", "ルート/B", "5/10"),
+]
+
+
+def _suites(pairs):
+    return [(testcase.get("name"), suite.name, suite.path, suite.order) for testcase, suite in pairs]
+
+
+def test_streaming_reads_node_order():
+    assert _suites(xml_processor.iter_testcases(io.BytesIO(XML.encode("utf-8")))) == EXPECTED
+
+
+def test_element_tree_reads_node_order():
+    root = ET.fromstring(XML.encode("utf-8"))
+    assert _suites(xml_processor.iter_element_testcases(root, root.get("name"))) == EXPECTED
+
+
+def test_suite_columns_follow_custom_fields():
+    headers = xml_processor.DEFAULT_PLAN.headers
+    assert headers[-2:] == ["テストスイートパス", "テストスイート順序"]
+    assert headers.index(xml_processor.CUSTOM_FIELD_NAMES[0]) == headers.index("親テストスイート名") + 1
+    plan = xml_processor.DEFAULT_PLAN.with_custom_fields(["追加フィールド"])
+    assert plan.headers[-3:] == ["追加フィールド", "テストスイートパス", "テストスイート順序"]
+
+
+def test_sqlite_keeps_suites_with_the_same_node_order_apart(tmp_path):
+    xml_file = tmp_path / "input.xml"
+    xml_file.write_text(XML, encoding="utf-8")
+    db_file = tmp_path / "output.sqlite"
+    xml_processor.convert_xml_file_to_sqlite(str(xml_file), str(db_file))
+    with sqlite3.connect(db_file) as conn:
+        rows = conn.execute("SELECT name, path, node_order FROM suites ORDER BY id").fetchall()
+    assert rows == [("A", "ルート/A", "5/20"), ("A1", "ルート/A/A1", "5/20/1"),
+                    ("B", "ルート/B", "5/10"), ("B", "ルート/B", "5/10")]
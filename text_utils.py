@@ -1,9 +1,43 @@
 import xml.sax.saxutils as saxutils
 
+import conversion_cache
+from instrumentation import instrumented
+
+_CDATA_OPEN = "<![CDATA["
+_CDATA_CLOSE = "]]>"
+
+def strip_cdata_markers(text):
+    """<![CDATA[...]]> の表記を取り除いて中身だけを残す
+
+    re.sub(r'<!\[CDATA\[(.*?)\]\]>', r'\1', text, flags=re.DOTALL) と同じ結果を返すが、
+    閉じていない開始表記が多数あっても入力の長さに比例する時間で終わる
+    (ある開始表記の後に ]]> がなければ、それ以降の開始表記にも対応する ]]> はない)。
+    """
+    start = text.find(_CDATA_OPEN)
+    if start == -1:
+        return text
+    parts = []
+    pos = 0
+    while start != -1:
+        end = text.find(_CDATA_CLOSE, start + len(_CDATA_OPEN))
+        if end == -1:
+            break
+        parts.append(text[pos:start])
+        parts.append(text[start + len(_CDATA_OPEN):end])
+        pos = end + len(_CDATA_CLOSE)
+        start = text.find(_CDATA_OPEN, pos)
+    parts.append(text[pos:])
+    return "".join(parts)
+
+@instrumented("text_to_html")
 def text_to_html(text):
     """プレーンテキストをTestLinkが期待するHTML形式（主に<p>, <ol>, <li>）に変換する"""
     if not text:
         return "<p></p>"
+    return conversion_cache.shared_cache.get_or_compute("text_to_html", text, _text_to_html)
+
+def _text_to_html(text):
+    """text_to_html の本体 (キャッシュなし)"""
     # HTMLエスケープ
     text = saxutils.escape(text)
     lines = text.split('\n')
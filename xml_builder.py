@@ -1,16 +1,34 @@
+import json
+import os
+import sqlite3
+import tempfile
 import xml.etree.ElementTree as ET
 from text_utils import text_to_html
+from records import CsvLayout
+from instrumentation import instrumented
 
-def group_testcases(rows, header_indices):
-    """テストケースをIDまたは名前でグループ化する"""
+# 一時ファイルへの退避時にまとめて書き込む行数
+SPILL_BATCH_SIZE = 10000
+
+# テストケースの最初の行で値が必須の列 (実行タイプはステップがあれば不要)
+REQUIRED_TESTCASE_FIELDS = ["テストケース名", "バージョン", "サマリ（概要）", "重要度", "実行タイプ"]
+# 必須の列に対応する TestCase の属性
+_REQUIRED_FIELD_ATTRIBUTES = {
+    "テストケース名": "name", "バージョン": "version", "サマリ（概要）": "summary", "重要度": "importance",
+    "実行タイプ": "execution_type",
+}
+
+class NonContiguousGroupError(ValueError):
+    """同じテストケースの行が連続していない場合のエラー"""
+
+def iter_keyed_rows(rows, header_indices, warn=print):
+    """データ行ごとにグループキー (IDまたは名前) を求め、(キー, 行) を返す (warn は警告の出力先)"""
     # インデックスを変数に展開
     id_idx = header_indices.get("ID", -1)
     testcase_name_idx = header_indices["テストケース名"]
 
-    # テストケースをグループ化 (IDまたは名前で)
-    testcase_groups = {}
     line_num = 1 # ヘッダーが1行目
-    for row in rows[1:]: # データ行のみ処理
+    for row in rows: # データ行のみ処理
         line_num += 1
         # IDと名前を取得 (存在しない場合は空文字)
         tc_id = row[id_idx].strip() if id_idx != -1 and id_idx < len(row) else ""
@@ -22,155 +40,191 @@ def group_testcases(rows, header_indices):
         elif tc_name: # IDがなく名前がある場合、名前をキーにする
             group_key = f"NAME_{tc_name}"
         else:
-            print(f"警告: 行 {line_num} にはテストケースIDも名前もありません。スキップします。")
+            warn(f"警告: 行 {line_num} にはテストケースIDも名前もありません。スキップします。")
             continue
 
+        yield group_key, row
+
+def group_testcases(rows, header_indices):
+    """テストケースをIDまたは名前でグループ化する"""
+    # テストケースをグループ化 (IDまたは名前で)
+    testcase_groups = {}
+    for group_key, row in iter_keyed_rows(rows[1:], header_indices):
         if group_key not in testcase_groups:
             testcase_groups[group_key] = []
         testcase_groups[group_key].append(row)
         
     return testcase_groups
 
+def group_testcase_records(rows, header_indices):
+    """データ行をIDまたは名前でグループ化し、{グループキー: TestCase} を返す
+
+    group_testcases と同じ順序・内容だが、元の行は保持せずテストケースごとに必要な値だけを残す。
+    rows はヘッダー行を除いたデータ行 (イテレータでよい)。
+    """
+    layout = CsvLayout(header_indices)
+    records = {}
+    next_lines = {}     # グループ内の次の行番号
+    for group_key, row in iter_keyed_rows(rows, header_indices):
+        record = records.get(group_key)
+        if record is None:
+            record = records[group_key] = layout.new_testcase(row)
+            next_lines[group_key] = 2
+        layout.add_row(record, row, next_lines[group_key])
+        next_lines[group_key] += 1
+    return records
+
+def iter_contiguous_groups(rows, header_indices, warn=print):
+    """同じテストケースの行が連続しているデータ行を、キーが変わるたびに (キー, 行リスト) として返す
+
+    一度閉じたキーが再び現れた場合は NonContiguousGroupError を送出する。warn は警告の出力先。
+    """
+    closed_keys = set()
+    current_key = None
+    current_rows = []
+    for group_key, row in iter_keyed_rows(rows, header_indices, warn):
+        if group_key != current_key:
+            if current_rows:
+                yield current_key, current_rows
+                closed_keys.add(current_key)
+            if group_key in closed_keys:
+                raise NonContiguousGroupError(f"テストケース {group_key} の行が連続していません")
+            current_key = group_key
+            current_rows = []
+        current_rows.append(row)
+    if current_rows:
+        yield current_key, current_rows
+
+def iter_spilled_groups(rows, header_indices, spill_dir=None):
+    """データ行を一時ファイル (SQLite) に退避し、group_testcases と同じ順序でグループを返す
+
+    行が連続していないCSV用。メモリに保持するのはグループキーの一覧だけ。
+    """
+    fd, spill_file = tempfile.mkstemp(suffix=".sqlite", dir=spill_dir)
+    os.close(fd)
+    conn = sqlite3.connect(spill_file)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("CREATE TABLE rows (group_order INTEGER, seq INTEGER, row TEXT)")
+        group_orders = {}
+        batch = []
+        for seq, (group_key, row) in enumerate(iter_keyed_rows(rows, header_indices)):
+            group_order = group_orders.setdefault(group_key, len(group_orders))
+            batch.append((group_order, seq, json.dumps(row, ensure_ascii=False)))
+            if len(batch) >= SPILL_BATCH_SIZE:
+                conn.executemany("INSERT INTO rows VALUES (?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT INTO rows VALUES (?, ?, ?)", batch)
+        conn.commit()
+
+        group_keys = list(group_orders)
+        group_orders = None
+        current_order = None
+        current_rows = []
+        for group_order, row_json in conn.execute("SELECT group_order, row FROM rows ORDER BY group_order, seq"):
+            if group_order != current_order:
+                if current_rows:
+                    yield group_keys[current_order], current_rows
+                current_order = group_order
+                current_rows = []
+            current_rows.append(json.loads(row_json))
+        if current_rows:
+            yield group_keys[current_order], current_rows
+    finally:
+        conn.close()
+        os.remove(spill_file)
+
+@instrumented("build_testcase_element")
 def build_testcase_element(root, testcase_rows, header_indices):
-    """テストケース行からXML要素を構築する"""
+    """テストケース行からXML要素を構築する
+
+    複数のテストケースを変換する場合は CsvLayout をファイルごとに1回作り、build_record_element を使うこと。
+    """
     if not testcase_rows:
         return
-        
-    # インデックスを変数に展開
-    id_idx = header_indices.get("ID", -1)
-    external_id_idx = header_indices.get("外部ID", -1)
-    version_idx = header_indices["バージョン"]
-    testcase_name_idx = header_indices["テストケース名"]
-    summary_idx = header_indices["サマリ（概要）"]
-    importance_idx = header_indices["重要度"]
-    preconditions_idx = header_indices.get("事前条件", -1)
-    step_number_idx = header_indices["ステップ番号"]
-    actions_idx = header_indices["アクション（手順）"]
-    expected_idx = header_indices["期待結果"]
-    exec_type_idx = header_indices["実行タイプ"]
-    exec_duration_idx = header_indices.get("推定実行時間", -1)
-    status_idx = header_indices.get("ステータス", -1)
-    is_active_idx = header_indices.get("有効/無効", -1)
-    is_open_idx = header_indices.get("開いているか", -1)
-    
-    first_row = testcase_rows[0]
+    return build_record_element(root, CsvLayout(header_indices).testcase(testcase_rows))
 
+@instrumented("build_record_element")
+def build_record_element(root, record, warn=print):
+    """TestCase (records.TestCase) からXML要素を構築する (warn は警告の出力先)"""
     # 必須データの存在チェック
-    missing_data = False
-    for header in ["テストケース名", "バージョン", "サマリ（概要）", "重要度", "実行タイプ"]:
-        idx = header_indices[header]
-        # ステップ関連以外は first_row でチェック
-        if idx >= len(first_row) or not first_row[idx].strip():
-             # ステップ実行タイプはステップ行でチェックする or デフォルト値を使う
-             if header == "実行タイプ" and step_number_idx != -1 and first_row[step_number_idx].strip(): # ステップがあれば無視
-                  continue
-             print(f"警告: 必須データ「{header}」が不足または空です。スキップします。")
-             missing_data = True
-             break
-    if missing_data:
-        return
+    for header in REQUIRED_TESTCASE_FIELDS:
+        if not getattr(record, _REQUIRED_FIELD_ATTRIBUTES[header]):
+            # ステップ実行タイプはステップ行でチェックする or デフォルト値を使う
+            if header == "実行タイプ" and record.first_row_is_step: # ステップがあれば無視
+                continue
+            warn(f"警告: 必須データ「{header}」が不足または空です。スキップします。")
+            return
 
     # <testcase> 要素の属性を設定
-    tc_attributes = {"name": first_row[testcase_name_idx].strip()}
-    current_internal_id = first_row[id_idx].strip() if id_idx != -1 and id_idx < len(first_row) else ""
-    if current_internal_id:
-        tc_attributes["internalid"] = current_internal_id
+    tc_attributes = {"name": record.name}
+    if record.internal_id:
+        tc_attributes["internalid"] = record.internal_id
 
     testcase = ET.SubElement(root, "testcase", attrib=tc_attributes)
 
     # <externalid> (値があれば追加)
-    external_id_text = first_row[external_id_idx].strip() if external_id_idx != -1 and external_id_idx < len(first_row) else ""
-    if external_id_text:
+    if record.external_id:
         external_id_elem = ET.SubElement(testcase, "externalid")
-        external_id_elem.text = external_id_text
+        external_id_elem.text = record.external_id
 
     # <version>
-    version_text = first_row[version_idx].strip() if version_idx < len(first_row) else "1"
     version_elem = ET.SubElement(testcase, "version")
-    version_elem.text = version_text
+    version_elem.text = record.version
 
     # <summary>
-    summary_text = first_row[summary_idx].strip() if summary_idx < len(first_row) else ""
     summary = ET.SubElement(testcase, "summary")
-    summary.text = text_to_html(summary_text)
+    summary.text = text_to_html(record.summary)
 
     # <preconditions>
-    preconditions_text = first_row[preconditions_idx].strip() if preconditions_idx != -1 and preconditions_idx < len(first_row) else ""
     preconditions = ET.SubElement(testcase, "preconditions")
-    preconditions.text = text_to_html(preconditions_text)
+    preconditions.text = text_to_html(record.preconditions)
 
     # <execution_type> (Testcaseレベル)
-    tc_exec_type_text = first_row[exec_type_idx].strip() if exec_type_idx < len(first_row) else "1" # デフォルト Manual
-    # ステップが存在するかの確認
-    has_steps = any(row[step_number_idx].strip() for row in testcase_rows if step_number_idx != -1 and step_number_idx < len(row))
-    if not has_steps: # ステップがなければTestcaseレベルの実行タイプを設定
+    if not record.steps: # ステップがなければTestcaseレベルの実行タイプを設定
          exec_type_elem = ET.SubElement(testcase, "execution_type")
-         exec_type_elem.text = tc_exec_type_text
+         exec_type_elem.text = record.execution_type
 
     # <importance>
-    importance_text = first_row[importance_idx].strip() if importance_idx < len(first_row) else "2" # デフォルト Medium
     importance = ET.SubElement(testcase, "importance")
-    importance.text = importance_text
+    importance.text = record.importance
 
     # オプショナル要素 (値があれば追加)
-    add_optional_elements(testcase, first_row, header_indices)
+    add_optional_elements(testcase, record)
 
     # <steps> 要素
-    build_steps_elements(testcase, testcase_rows, header_indices)
-    
+    build_steps_elements(testcase, record, warn)
+
     return testcase
 
-def add_optional_elements(testcase, row, header_indices):
+def add_optional_elements(testcase, record):
     """オプショナル要素を追加する"""
-    exec_duration_idx = header_indices.get("推定実行時間", -1)
-    status_idx = header_indices.get("ステータス", -1)
-    is_open_idx = header_indices.get("開いているか", -1)
-    is_active_idx = header_indices.get("有効/無効", -1)
-    
-    if exec_duration_idx != -1 and exec_duration_idx < len(row) and row[exec_duration_idx].strip():
-        exec_duration = ET.SubElement(testcase, "estimated_exec_duration")
-        exec_duration.text = row[exec_duration_idx].strip()
-    if status_idx != -1 and status_idx < len(row) and row[status_idx].strip():
-        status = ET.SubElement(testcase, "status")
-        status.text = row[status_idx].strip()
-    if is_open_idx != -1 and is_open_idx < len(row) and row[is_open_idx].strip():
-        is_open = ET.SubElement(testcase, "is_open")
-        is_open.text = row[is_open_idx].strip()
-    if is_active_idx != -1 and is_active_idx < len(row) and row[is_active_idx].strip():
-        active = ET.SubElement(testcase, "active")
-        active.text = row[is_active_idx].strip()
-
-def build_steps_elements(testcase, testcase_rows, header_indices):
+    for tag, value in (("estimated_exec_duration", record.estimated_exec_duration), ("status", record.status),
+                       ("is_open", record.is_open), ("active", record.active)):
+        if value:
+            elem = ET.SubElement(testcase, tag)
+            elem.text = value
+
+def build_steps_elements(testcase, record, warn=print):
     """ステップ要素を構築する"""
-    step_number_idx = header_indices["ステップ番号"]
-    actions_idx = header_indices["アクション（手順）"]
-    expected_idx = header_indices["期待結果"]
-    exec_type_idx = header_indices["実行タイプ"]
-    
     # <steps> 要素
     steps_container = ET.SubElement(testcase, "steps")
-    step_line_num = 1 # グループ内の行番号 (デバッグ用)
-    for row in testcase_rows:
-        step_line_num += 1
-        # ステップ番号がある行のみステップとして処理
-        step_number = row[step_number_idx].strip() if step_number_idx != -1 and step_number_idx < len(row) else ""
-        if step_number:
-            # ステップに必要なデータのチェック
-            actions_text = row[actions_idx].strip() if actions_idx < len(row) else ""
-            expected_text = row[expected_idx].strip() if expected_idx < len(row) else ""
-            step_exec_type_text = row[exec_type_idx].strip() if exec_type_idx < len(row) else "1" # ステップ実行タイプ
-            if not actions_text or not expected_text:
-                 print(f"警告: ステップ番号 {step_number} (CSV行: {step_line_num}) でアクションまたは期待結果が空です。")
-
-            step = ET.SubElement(steps_container, "step")
-            step_num_elem = ET.SubElement(step, "step_number")
-            step_num_elem.text = step_number
-            actions = ET.SubElement(step, "actions")
-            actions.text = text_to_html(actions_text)
-            expected = ET.SubElement(step, "expectedresults")
-            expected.text = text_to_html(expected_text)
-            step_exec_type = ET.SubElement(step, "execution_type")
-            step_exec_type.text = step_exec_type_text
+    for record_step in record.steps:
+        # ステップに必要なデータのチェック
+        if not record_step.actions or not record_step.expected:
+             warn(f"警告: ステップ番号 {record_step.number} (CSV行: {record_step.line}) でアクションまたは期待結果が空です。")
+
+        step = ET.SubElement(steps_container, "step")
+        step_num_elem = ET.SubElement(step, "step_number")
+        step_num_elem.text = record_step.number
+        actions = ET.SubElement(step, "actions")
+        actions.text = text_to_html(record_step.actions)
+        expected = ET.SubElement(step, "expectedresults")
+        expected.text = text_to_html(record_step.expected)
+        step_exec_type = ET.SubElement(step, "execution_type")
+        step_exec_type.text = record_step.execution_type
 
 def create_root_element():
     """ルートのXML要素を作成する"""
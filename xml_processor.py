@@ -1,15 +1,170 @@
 import xml.etree.ElementTree as ET
 import csv
 import re
-import codecs
+import json
+import os
+import time
 import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
+import column_schema
+import conversion_cache
+import encoding_io
+import result_cache
+import sqlite_export
+from instrumentation import instrumented, stage
+from progress import ConversionCancelled
+from text_utils import strip_cdata_markers
+
+# 二重CDATAの開始・終了部分
+_CDATA_OPEN = "<![CDATA["
+_CDATA_CLOSE = "]]>"
+_DOUBLE_CDATA_OPEN = re.compile(r'<!\[CDATA\[\s*<!\[CDATA\[')
+_DOUBLE_CDATA_CLOSE = re.compile(r'\]\]>\s*\]\]>')
+
+@instrumented("fix_double_cdata")
 def fix_double_cdata(xml_content):
-    """二重CDATAタグの問題を修正する"""
-    pattern = r'<!\[CDATA\[\s*<!\[CDATA\[(.*?)]]>\s*]]>'
-    fixed_content = re.sub(pattern, r'<![CDATA[\1]]>', xml_content, flags=re.DOTALL)
-    return fixed_content
+    """二重CDATAタグの問題を修正する
+
+    re.sub(r'<!\[CDATA\[\s*<!\[CDATA\[(.*?)]]>\s*]]>', r'<![CDATA[\1]]>', ...) と同じ結果を返す。
+    開始部分と終了部分を別々に探すため、閉じていない二重CDATAが多数あっても入力の長さに比例する時間で終わる。
+    """
+    parts = []
+    pos = 0
+    while True:
+        opening = _DOUBLE_CDATA_OPEN.search(xml_content, pos)
+        if opening is None:
+            break
+        closing = _DOUBLE_CDATA_CLOSE.search(xml_content, opening.end())
+        if closing is None:
+            # 以降の開始部分にも対応する終了部分はない
+            break
+        parts.append(xml_content[pos:opening.start()])
+        parts.append(_CDATA_OPEN)
+        parts.append(xml_content[opening.end():closing.start()])
+        parts.append(_CDATA_CLOSE)
+        pos = closing.end()
+    parts.append(xml_content[pos:])
+    return "".join(parts)
+
+def _partial_marker_start(buffer, pos, marker):
+    """バッファ末尾で「marker + 空白 + markerの途中」になっている位置を返す (なければ len(buffer))"""
+    # 完全な marker の後に空白と marker の先頭部分だけが続いている場合
+    last = buffer.rfind(marker, pos)
+    if last != -1 and marker.startswith(buffer[last + len(marker):].lstrip()):
+        return last
+    # marker 自体がチャンク境界で途切れている場合
+    for length in range(min(len(marker) - 1, len(buffer) - pos), 0, -1):
+        if buffer.endswith(marker[:length]):
+            return len(buffer) - length
+    return len(buffer)
+
+class DoubleCdataFixReader:
+    """二重CDATAをチャンク単位で修正しながら読み込むファイルライクオブジェクト
+
+    fix_double_cdata と同じ置換 (<![CDATA[<![CDATA[...]]>]]> → <![CDATA[...]]>) を
+    ドキュメント全体を文字列に読み込まずに行う。開始部分は対応する終了部分が見つかるまで
+    置き換えずに保留し、チャンク境界で分断された開始・終了部分も次のチャンクを読むまで保留する。
+    保留が max_hold 文字を超えた場合は開始部分をそのまま出力する (この場合だけ、max_hold より
+    後ろで閉じる二重CDATAが fix_double_cdata と異なり修正されない)。
+    iterparse などのパーサーに直接渡して使う。
+    """
 
+    def __init__(self, source, chunk_size=1024 * 1024, max_hold=64 * 1024 * 1024):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.max_hold = max_hold
+        self._held = []         # 未処理 (保留中) の入力をつなぐ前の断片
+        self._held_len = 0
+        self._output = ""       # 修正済みで未返却の出力
+        self._open_end = None   # 保留中の入力の先頭にある二重CDATAの開始部分の終わり (保留中でなければ None)
+        self._scanned = 0       # 保留中の入力のこの位置より前からは終了部分が始まらない
+        self._tail = ""         # 保留中の入力の _scanned 以降 (二重CDATAの保留中のみ)
+        self._eof = False
+
+    @instrumented("read_fix_cdata")
+    def read(self, size=-1):
+        """修正済みのテキストを最大 size 文字返す"""
+        while not self._eof and (size is None or size < 0 or len(self._output) < size):
+            chunk = self.source.read(self.chunk_size)
+            if not chunk:
+                self._eof = True
+            self._process(chunk, final=self._eof)
+
+        if size is None or size < 0 or size >= len(self._output):
+            data, self._output = self._output, ""
+        else:
+            data, self._output = self._output[:size], self._output[size:]
+        return data
+
+    def _process(self, chunk, final):
+        """バッファにチャンクを追加し、確定した部分を出力に移す"""
+        if self._open_end is not None and not final:
+            # 二重CDATAの保留中は、保留中の入力をつながずに新しい部分だけで終了部分を探す
+            tail = self._tail + chunk
+            if (_DOUBLE_CDATA_CLOSE.search(tail) is None
+                    and self._held_len + len(chunk) - self._open_end <= self.max_hold):
+                self._held.append(chunk)
+                self._held_len += len(chunk)
+                partial = _partial_marker_start(tail, 0, _CDATA_CLOSE)
+                self._scanned += partial
+                self._tail = tail[partial:]
+                return
+        buffer = "".join(self._held) + chunk
+        parts = [self._output]
+        pos = 0
+        open_end = self._open_end
+        scanned = self._scanned
+        tail_checked = False    # このバッファの末尾の終了部分の途中を確認したか
+        limit = self.max_hold
+        while True:
+            if open_end is None:
+                opening = _DOUBLE_CDATA_OPEN.search(buffer, pos)
+                if opening is None:
+                    hold = len(buffer) if final else _partial_marker_start(buffer, pos, _CDATA_OPEN)
+                    parts.append(buffer[pos:hold])
+                    pos = hold
+                    break
+                parts.append(buffer[pos:opening.start()])
+                pos = opening.start()
+                open_end = opening.end()
+            closing = _DOUBLE_CDATA_CLOSE.search(buffer, max(open_end, scanned))
+            if closing is not None:
+                parts.append(_CDATA_OPEN)
+                parts.append(buffer[open_end:closing.start()])
+                parts.append(_CDATA_CLOSE)
+                pos = closing.end()
+                open_end = None
+                continue
+            if final:
+                # 対応する終了部分がない (以降の開始部分にもない) ためそのまま出力する
+                parts.append(buffer[pos:])
+                pos = len(buffer)
+                open_end = None
+                break
+            # 終了部分は少なくとも途中で切れている可能性のある末尾までは現れない
+            # (バッファは変わらないため、開始部分が末尾の確認位置より後ろでなければ確認し直さない)
+            if not tail_checked or open_end > scanned:
+                scanned = _partial_marker_start(buffer, max(open_end, scanned), _CDATA_CLOSE)
+                tail_checked = True
+            if len(buffer) - open_end > limit:
+                # 保留の上限を超えたため開始部分を修正せずに出力し、その後ろから探し直す
+                # (保留し直すたびに全体をつなぎ直さないよう、上限の半分になるまで続けて出力する)
+                limit = self.max_hold // 2
+                parts.append(buffer[pos:open_end])
+                pos = open_end
+                open_end = None
+                continue
+            break
+        self._held = [buffer[pos:]]
+        self._held_len = len(buffer) - pos
+        self._open_end = None if open_end is None else open_end - pos
+        self._scanned = max(0, scanned - pos)
+        self._tail = buffer[scanned:] if open_end is not None else ""
+        self._output = "".join(parts)
+
+@instrumented("parse_xml_root")
 def parse_xml_root(xml_content):
     """XML文字列をパースし、適切なルート要素とテストスイート名を取得する"""
     try:
@@ -46,35 +201,298 @@ def get_element_text(element, tag_name):
     if tag is not None:
         text = tag.text
         if text:
-             text = re.sub(r'<!\[CDATA\[(.*?)\]\]>', r'\1', text, flags=re.DOTALL)
+             text = strip_cdata_markers(text)
              return text.strip()
     return ""
 
+# clean_html で構造として扱うタグ (従来実装の各正規表現がマッチするもの)
+_HTML_TOKEN = re.compile(
+    r'<(?:(?P<p_open>p>)|/(?:(?P<p_close>p>)|(?P<li_close>li>))'
+    r'|(?P<list_open>(?P<list>ul|ol)[^<>]*>)|(?P<li_open>li[^<>]*>))',
+    re.IGNORECASE)
+# ルート階層では閉じタグは対応する開始タグがなくそのまま残るため開始タグだけを探す
+_HTML_OPEN_TOKEN = re.compile(
+    r'<(?:(?P<p_open>p>)|(?P<list_open>(?P<list>ul|ol)[^<>]*>)|(?P<li_open>li[^<>]*>))',
+    re.IGNORECASE)
+_P_TAG = re.compile(r'</?p>', re.IGNORECASE)
+_CLOSE_TAGS = {name: re.compile(f'</{name}>', re.IGNORECASE) for name in ('p', 'li', 'ul', 'ol')}
+# 従来実装の <p>(.*?)</p>, <(ul|ol).*?>(.*?)</\1>, <li.*?>(.*?)</li> の開始タグ部分
+_P_OPEN = re.compile(r'<(p)>', re.IGNORECASE)
+_LIST_OPEN = re.compile(r'<(ul|ol)', re.IGNORECASE)
+_LI_OPEN = re.compile(r'<(li)', re.IGNORECASE)
+_BR_TAG = re.compile(r'<br\s*/?>', re.IGNORECASE)
+_OTHER_TAG = re.compile(r'<(?!\/?(p|br|ul|ol|li)\b)[^>]+>', re.IGNORECASE)
+_STRUCTURE_TAG_NAME = re.compile(r'/?(p|br|ul|ol|li)\b', re.IGNORECASE)
+# 次の '>' より前に別の '<' がある '<' (_OTHER_TAG の走査が '<' ごとにやり直しになる入力)
+_UNCLOSED_LT = re.compile(r'<[^<>]*<')
+# '>' より前に次の '<' が来るリスト・<li> の開始タグ (従来実装は次のタグの '>' までを開始タグとみなす)
+_MALFORMED_LIST_OPEN = re.compile(r'<(?:ul|ol|li)[^<>]*<', re.IGNORECASE)
+_ANY_TAG = re.compile(r'<[^<>]*>')
+_BLOCK_END_TAG = re.compile(r'</(?:p|li|ul|ol)>', re.IGNORECASE)
+_HTML_ENTITY = re.compile(r'&(?:amp;quot;|amp;#39;|nbsp;|lt;|gt;|amp;|quot;|#39;)')
+# 従来実装は &amp; を戻した後に &quot; と &#39; を戻すため、&amp;quot; などは二重に戻る
+_HTML_ENTITIES = {
+    "&nbsp;": " ", "&lt;": "<", "&gt;": ">", "&amp;": "&", "&quot;": "\"", "&#39;": "'",
+    "&amp;quot;": "\"", "&amp;#39;": "'",
+}
+_SPACES = re.compile(r'[ \t]+')
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+
+# clean_html で1項目に使う上限。超えた項目は構造を解釈せずにタグを取り除くだけにする (警告を表示する)
+HTML_FIELD_MAX_CHARS = 8 * 1024 * 1024
+HTML_FIELD_TIME_BUDGET = 5.0    # 秒 (従来実装へのフォールバックの各段階の間で確認する)
+
+class _HtmlBudgetExceeded(Exception):
+    """clean_html の処理時間が HTML_FIELD_TIME_BUDGET を超えた"""
+
+def _strip_other_tags(text):
+    """<p>, <br>, <ul>, <ol>, <li> 以外のタグを取り除く (_OTHER_TAG.sub('', text) と同じ結果)
+
+    '>' で閉じていない '<' が続く入力では正規表現が '<' ごとに次の '>' まで走査し直すため、
+    その場合は次の '>' の位置を覚えながら '<' を1つずつ調べる。
+    """
+    if _UNCLOSED_LT.search(text) is None:
+        return _OTHER_TAG.sub('', text)
+    parts = []
+    pos = 0
+    gt = -1     # 直前に調べた '<' より後で最初の '>' の位置
+    start = text.find('<')
+    while start != -1:
+        if gt <= start:
+            gt = text.find('>', start + 1)
+            if gt == -1:
+                break
+        if gt > start + 1 and not _STRUCTURE_TAG_NAME.match(text, start + 1):
+            parts.append(text[pos:start])
+            pos = gt + 1
+            start = text.find('<', pos)
+        else:
+            start = text.find('<', start + 1)
+    parts.append(text[pos:])
+    return "".join(parts)
+
+def _iter_tag_spans(text, opening, names, attributes):
+    """従来実装の <tag.*?>(.*?)</tag> (DOTALL) のマッチを (開始位置, 終了位置, 中身) で順に返す
+
+    opening は開始タグの先頭部分の正規表現 (グループ1がタグ名)、names はそのタグ名の一覧、
+    attributes は開始タグの後に属性 (.*?>) が続くか。正規表現の後戻りを使わず、最初の '>' と最初の閉じタグだけを探す。
+    閉じタグが見つからなかったタグ名は以降も見つからないため探し直さず、入力の長さに比例する時間で終わる。
+    """
+    search = 0
+    gt = -1             # search 以降で最初の '>' の位置
+    exhausted = set()   # 以降に閉じタグがないタグ名
+    while True:
+        match = opening.search(text, search)
+        if match is None:
+            return
+        name = match.group(1).lower()
+        content_start = match.end()
+        if attributes:
+            if gt < content_start:
+                gt = text.find('>', content_start)
+                if gt == -1:
+                    return
+            content_start = gt + 1
+        close = None if name in exhausted else _CLOSE_TAGS[name].search(text, content_start)
+        if close is None:
+            exhausted.add(name)
+            if len(exhausted) == len(names):
+                return
+            search = match.start() + 1
+            continue
+        yield match.start(), close.end(), text[content_start:close.start()]
+        search = close.end()
+
+def _sub_tag_spans(text, opening, names, attributes, replace):
+    """_iter_tag_spans のマッチを replace(中身) の戻り値で置き換える"""
+    parts = []
+    pos = 0
+    for start, end, content in _iter_tag_spans(text, opening, names, attributes):
+        parts.append(text[pos:start])
+        parts.append(replace(content))
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts)
+
+def _finish_text(text):
+    """<br> の改行化・タグ除去・エンティティ変換・空白整理をまとめて行う"""
+    if '<' in text:
+        text = _strip_other_tags(_BR_TAG.sub('\n', text))
+    if '&' in text:
+        text = _HTML_ENTITY.sub(lambda m: _HTML_ENTITIES[m.group()], text)
+    return _BLANK_LINES.sub('\n', _SPACES.sub(' ', text)).strip()
+
+def _strip_pieces(pieces):
+    """出力片を前後の生テキスト部分だけ strip して連結する (<p> の中身用)"""
+    texts = [text for text, _ in pieces]
+    i = 0
+    while i < len(pieces) and pieces[i][1]:
+        texts[i] = texts[i].lstrip()
+        if texts[i]:
+            break
+        i += 1
+    j = len(pieces) - 1
+    while j >= 0 and pieces[j][1]:
+        texts[j] = texts[j].rstrip()
+        if texts[j]:
+            break
+        j -= 1
+    return "".join(texts)
+
+def _skip_list(text, pos, list_tag, p_open_outside):
+    """リストの閉じタグの直後の位置を返す (従来実装と一致しない場合は -1)
+
+    従来実装ではリストは最初の同名の閉じタグまで丸ごと改行1つに置き換わる。
+    ただし <p> の対応付けはリスト置換より先に行われるため、
+    リストの内外にまたがる <p> がある場合は一致を保証できない。
+    """
+    close = _CLOSE_TAGS[list_tag].search(text, pos)
+    if close is None:
+        return -1
+    # リストの外で開いた <p> が中で閉じられる、または中で開いた <p> が外で閉じられる場合
+    p_open = p_open_outside
+    for tag in _P_TAG.findall(text, pos, close.start()):
+        if tag[1] != '/':
+            p_open = True
+        elif p_open_outside:
+            return -1
+        else:
+            p_open = False
+    if p_open and not p_open_outside:
+        return -1
+    return close.end()
+
+def _clean_html_tokens(text):
+    """clean_html の1パス実装
+
+    構造タグ (<p>, リスト, <li>) を先頭から1回だけ走査し、入れ子をスタックで追う。
+    <br> の改行化、その他のタグの除去とエンティティ変換は最後に1回だけ行う。
+    従来実装と結果が一致することを保証できない入力 (閉じていない <p>/<li>/リスト、
+    '>' のないリスト・<li> の開始タグ、<li> 内で二重に変換されるエンティティなど) では
+    None を返す。
+    """
+    if _MALFORMED_LIST_OPEN.search(text):
+        return None
+    frames = [[]]   # 各階層の出力片 (テキスト, strip対象の生テキストか)
+    kinds = [None]  # 各階層のタグ名 (None: ルート, "p", "li")
+    pos = 0
+    while True:
+        search = _HTML_TOKEN.search if len(kinds) > 1 else _HTML_OPEN_TOKEN.search
+        match = search(text, pos)
+        if match is None:
+            break
+        start = match.start()
+        if start > pos:
+            frames[-1].append((text[pos:start], True))
+        pos = match.end()
+        token = match.lastgroup
+
+        if token == 'p_open':
+            if 'p' in kinds:
+                # 従来実装では入れ子の <p> はそのまま残る
+                frames[-1].append((match.group(), False))
+                continue
+            following = _HTML_TOKEN.search(text, pos)
+            if following is not None and following.lastgroup == 'p_close':
+                # 中に構造タグのない <p> はその場で処理する
+                frames[-1].append((text[pos:following.start()].strip() + '\n', False))
+                pos = following.end()
+            else:
+                frames.append([])
+                kinds.append('p')
+        elif token == 'li_open':
+            if 'li' in kinds:
+                return None
+            frames.append([])
+            kinds.append('li')
+        elif token == 'list_open':
+            pos = _skip_list(text, pos, match.group('list').lower(), 'p' in kinds)
+            if pos == -1:
+                return None
+            frames[-1].append(("\n", False))
+        else:
+            kind = 'p' if token == 'p_close' else 'li'
+            if kinds[-1] == kind:
+                pieces = frames.pop()
+                kinds.pop()
+                if kind == 'p':
+                    frames[-1].append((_strip_pieces(pieces) + '\n', False))
+                else:
+                    item = _finish_text("".join(t for t, _ in pieces))
+                    if '<' in item or ('&' in item and _HTML_ENTITY.search(item)):
+                        return None
+                    frames[-1].append(('・' + item + '\n', False))
+            elif kind in kinds:
+                return None
+            else:
+                # 対応する開始タグのない閉じタグはそのまま残る
+                frames[-1].append((match.group(), False))
+
+    if len(kinds) > 1:
+        return None
+    if pos < len(text):
+        frames[0].append((text[pos:], True))
+    return _finish_text("".join(t for t, _ in frames[0]))
+
+@instrumented("clean_html")
 def clean_html(text):
-    """HTMLタグを適切に処理してプレーンテキストに変換する"""
+    """HTMLタグを適切に処理してプレーンテキストに変換する (結果は共有キャッシュで再利用)"""
+    if not text:
+        return ""
+    return conversion_cache.shared_cache.get_or_compute("clean_html", text, _html_to_text)
+
+def _html_to_text(text):
+    """clean_html の本体 (キャッシュなし)"""
+    if len(text) > HTML_FIELD_MAX_CHARS:
+        return _degraded_text(text, f"上限の {HTML_FIELD_MAX_CHARS} 文字を超える")
+    if '<![CDATA[' not in text:
+        result = _clean_html_tokens(text)
+        if result is not None:
+            return result
+    try:
+        return _clean_html_regex(text, time.perf_counter() + HTML_FIELD_TIME_BUDGET)
+    except _HtmlBudgetExceeded:
+        return _degraded_text(text, f"処理に {HTML_FIELD_TIME_BUDGET} 秒以上かかる")
+
+def _degraded_text(text, reason):
+    """HTMLの構造を解釈せず、タグを取り除いただけのテキストを返す (予算を超えた項目用)"""
+    print(f"警告: HTMLの項目 ({len(text)} 文字) が{reason}ため、リストなどの構造を解釈せずにタグだけを取り除きます")
+    text = _BLOCK_END_TAG.sub('\n', _BR_TAG.sub('\n', strip_cdata_markers(text)))
+    text = _ANY_TAG.sub('', text)
+    if '&' in text:
+        text = _HTML_ENTITY.sub(lambda m: _HTML_ENTITIES[m.group()], text)
+    return _BLANK_LINES.sub('\n', _SPACES.sub(' ', text)).strip()
+
+def _check_deadline(deadline):
+    """deadline を過ぎていれば _HtmlBudgetExceeded を送出する"""
+    if deadline is not None and time.perf_counter() > deadline:
+        raise _HtmlBudgetExceeded()
+
+def _clean_html_regex(text, deadline=None):
+    """置換を重ねる従来の clean_html 実装 (1パス実装で扱えない入力用)
+
+    タグの対応付けは従来の正規表現 (<p>(.*?)</p> など) と同じ結果になる線形時間の走査で行う。
+    deadline (time.perf_counter() の値) を過ぎると段階の間で _HtmlBudgetExceeded を送出する。
+    """
     if not text:
         return ""
     # CDATA除去
-    text = re.sub(r'<!\[CDATA\[(.*?)\]\]>', r'\1', text, flags=re.DOTALL)
+    text = strip_cdata_markers(text)
     # <p> -> 改行
-    text = re.sub(r'<p>(.*?)</p>', lambda m: m.group(1).strip() + '\n', text, flags=re.DOTALL | re.IGNORECASE)
+    text = _sub_tag_spans(text, _P_OPEN, ('p',), False, lambda content: content.strip() + '\n')
     # <br> -> 改行
-    text = re.sub(r'<br\s*/?>', '\n', text, flags=re.IGNORECASE)
-    # リスト処理
-    def replace_list(match):
-        list_content = match.group(1)
-        items = re.findall(r'<li.*?>(.*?)</li>', list_content, flags=re.DOTALL | re.IGNORECASE)
-        plain_items = []
-        for item in items:
-            cleaned_item = clean_html(item).strip() # 再帰呼び出しでネストに対応
-            lines = [f"・{line.strip()}" for line in cleaned_item.split('\n') if line.strip()]
-            plain_items.extend(lines)
-        return '\n'.join(plain_items) + '\n' if plain_items else '\n'
-    text = re.sub(r'<(ul|ol).*?>(.*?)</\1>', replace_list, text, flags=re.DOTALL | re.IGNORECASE)
+    text = _BR_TAG.sub('\n', text)
+    _check_deadline(deadline)
+    # リスト処理 (従来の正規表現版は <li> をタグ名 (group(1)) から探していたため、
+    # リストは最初の同名の閉じタグまで丸ごと改行1つになる。1パス実装もこの結果に合わせている)
+    text = _sub_tag_spans(text, _LIST_OPEN, ('ul', 'ol'), True, lambda content: '\n')
+    _check_deadline(deadline)
     # 残った<li>処理
-    text = re.sub(r'<li.*?>(.*?)</li>', lambda m: '・' + clean_html(m.group(1)).strip() + '\n', text, flags=re.DOTALL | re.IGNORECASE)
+    text = _sub_tag_spans(text, _LI_OPEN, ('li',), True,
+                          lambda content: '・' + _clean_html_regex(content, deadline).strip() + '\n')
+    _check_deadline(deadline)
     # その他タグ除去
-    text = re.sub(r'<(?!\/?(p|br|ul|ol|li)\b)[^>]+>', '', text, flags=re.IGNORECASE)
+    text = _strip_other_tags(text)
     # HTMLエンティティデコード
     text = text.replace("&nbsp;", " ").replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&").replace("&quot;", "\"").replace("&#39;", "'")
     # 空白・改行整理
@@ -82,93 +500,383 @@ def clean_html(text):
     text = re.sub(r'\n\s*\n+', '\n', text)
     return text.strip()
 
-def convert_xml_to_csv(testcases_root, testsuite_name, output_csv_file):
-    """XML要素ツリーからデータを抽出し、CSVファイルに書き込む"""
+# 既定の列定義 (column_schema.json) から作った testcase 要素→CSV行の取り出し手順
+DEFAULT_PLAN = column_schema.load_plan()
+
+# CSVのヘッダー行（カスタムフィールド列を除く）
+CSV_HEADERS = [header for header in DEFAULT_PLAN.headers if header not in DEFAULT_PLAN.custom_field_names]
+
+# カスタムフィールドの一覧（column_schema.json の custom_fields で定義）
+CUSTOM_FIELD_NAMES = DEFAULT_PLAN.custom_field_names
+
+# HTMLを含む列 (サマリ、事前条件、アクション、期待結果) の位置
+HTML_COLUMN_INDICES = DEFAULT_PLAN.html_indices
+
+# 並列変換で1つのワーカーにまとめて渡すテストケース数
+DEFAULT_BATCH_SIZE = 500
+
+@instrumented("build_csv_row")
+def build_csv_row(testcase, suite, plan=None):
+    """testcase要素と親テストスイート (column_schema.SuitePath) から1行分のCSVデータを生成する"""
+    plan = plan or DEFAULT_PLAN
+    return clean_raw_row(plan.extract(testcase, suite), plan.html_indices)
+
+def clean_raw_row(row, html_indices=HTML_COLUMN_INDICES):
+    """extract_raw_row で取り出した行のHTML列をプレーンテキストに変換する"""
+    for index in html_indices:
+        row[index] = clean_html(row[index])
+    return row
+
+def clean_raw_rows(rows, html_indices=HTML_COLUMN_INDICES):
+    """複数行のHTML列をまとめて変換する (並列変換のワーカーで実行)"""
+    return [clean_raw_row(row, html_indices) for row in rows]
+
+def extract_raw_row(testcase, suite, plan=None):
+    """testcase要素から1行分のCSVデータを取り出す (HTML列は未変換のまま)"""
+    return (plan or DEFAULT_PLAN).extract(testcase, suite)
+
+@instrumented("build_step_rows")
+def build_step_rows(testcase, suite, plan=None):
+    """testcase要素からステップごとに1行ずつCSVデータを生成する (ステップがなければ1行)"""
+    plan = plan or DEFAULT_PLAN
+    case_row, step_values = plan.extract_steps(testcase, suite)
+    return expand_step_rows(case_row, step_values, plan.step_layout)
+
+def expand_step_rows(case_row, step_values, step_layout):
+    """ケース共通の行とステップごとの値から、HTML列を変換したステップごとの行を作る
+
+    ケース共通のHTML列 (サマリ、事前条件など) はステップ数に関係なく1回だけ変換する。
+    step_layout は ExtractionPlan.step_layout。
+    """
+    html_indices, case_html_indices, step_indices, step_html_indices = step_layout
+    if not step_values:
+        return [clean_raw_row(case_row, html_indices)]
+    clean_raw_row(case_row, case_html_indices)
+    rows = []
+    for values in step_values:
+        row = case_row.copy()
+        for index, value in zip(step_indices, values):
+            row[index] = value
+        rows.append(clean_raw_row(row, step_html_indices))
+    return rows
+
+def expand_step_cases(cases, step_layout):
+    """複数テストケース分の (ケース共通の行, ステップごとの値) をステップごとの行にする (並列変換のワーカーで実行)"""
+    rows = []
+    for case_row, step_values in cases:
+        rows.extend(expand_step_rows(case_row, step_values, step_layout))
+    return rows
+
+@instrumented("convert_xml_to_csv")
+def convert_xml_to_csv(testcases_root, testsuite_name, output_csv_file, plan=None, step_rows=None, encoding=None):
+    """XML要素ツリーからデータを抽出し、CSVファイルに書き込む
+
+    testsuite_name は testcases_root が testsuite の場合のその名前 (parse_xml_root の戻り値)。
+    plan (column_schema.ExtractionPlan) を省略すると既定の列定義を使う。
+    step_rows が真の場合 (None なら列定義の設定に従う) はステップごとに1行を出力する。
+    encoding はCSVの文字コード (encoding_io.OUTPUT_ENCODINGS。既定は shift_jis)。
+    """
+    encoding = encoding or encoding_io.DEFAULT_OUTPUT_ENCODING
+    plan = plan or DEFAULT_PLAN
+    if step_rows is None:
+        step_rows = plan.step_rows
     try:
         rows = []
-        
-        # カスタムフィールドの一覧（必要なフィールドをここで定義）
-        custom_field_names = [
-            "AutomationAction", "AutomationParameters", "AutomationEnabled", 
-            "AutomationTargetNode", "AutomationValidation"
-        ]
-        
-        # ヘッダー行にカスタムフィールド名を追加
-        headers = [
-            "ID", "外部ID", "バージョン", "テストケース名", "サマリ（概要）",
-            "重要度", "事前条件", "ステップ番号", "アクション（手順）", "期待結果",
-            "実行タイプ", "推定実行時間", "ステータス", "有効/無効", "開いているか",
-            "親テストスイート名"
-        ]
-        # カスタムフィールドをヘッダーに追加
-        headers.extend(custom_field_names)
-        rows.append(headers)
-
-        # testcases_root (testsuite または testcases 要素) から testcase を検索
-        for testcase in testcases_root.findall(".//testcase"):
-            testcase_id = testcase.get("internalid", "")
-            external_id = get_element_text(testcase, "externalid")
-            version = get_element_text(testcase, "version")
-            testcase_name = testcase.get("name", "")
-            summary = clean_html(get_element_text(testcase, "summary"))
-            importance = get_element_text(testcase, "importance")
-            preconditions = clean_html(get_element_text(testcase, "preconditions"))
-            # execution_type は Testcase直下とStep内にある。ここではTestcase直下のものを取得
-            tc_exec_type_elem = testcase.find("execution_type")
-            tc_exec_type = tc_exec_type_elem.text.strip() if tc_exec_type_elem is not None and tc_exec_type_elem.text else ""
-
-            exec_duration = get_element_text(testcase, "estimated_exec_duration")
-            status = get_element_text(testcase, "status")
-            is_active = get_element_text(testcase, "active")
-            is_open = get_element_text(testcase, "is_open")
-
-            # カスタムフィールドの値を取得
-            custom_field_values = {}
-            custom_fields_elem = testcase.find("custom_fields")
-            if custom_fields_elem is not None:
-                for cf in custom_fields_elem.findall("custom_field"):
-                    cf_name = get_element_text(cf, "name")
-                    cf_value = get_element_text(cf, "value")
-                    if cf_name:
-                        custom_field_values[cf_name] = cf_value
-
-            # デフォルト値（ステップがない場合や最初のステップを使用）
-            step_number = ""
-            actions = ""
-            expected = ""
-            step_exec_type = tc_exec_type  # デフォルトはテストケースのexecution_type
-
-            # ステップがあれば最初のステップ（ステップ1）を取得
-            steps = testcase.find("steps")
-            if steps is not None and len(steps) > 0:
-                first_step = steps.find("step")  # 最初のステップを取得
-                if first_step is not None:
-                    step_number = get_element_text(first_step, "step_number")
-                    actions = clean_html(get_element_text(first_step, "actions"))
-                    expected = clean_html(get_element_text(first_step, "expectedresults"))
-                    step_exec_type_elem = first_step.find("execution_type")
-                    if step_exec_type_elem is not None and step_exec_type_elem.text:
-                        step_exec_type = step_exec_type_elem.text.strip()
-
-            # 1テストケースにつき1行のみを出力
-            row = [
-                testcase_id, external_id, version, testcase_name, summary,
-                importance, preconditions, step_number, actions, expected,
-                step_exec_type, exec_duration, status, is_active, is_open,
-                testsuite_name
-            ]
-            
-            # カスタムフィールド値を追加
-            for cf_name in custom_field_names:
-                row.append(custom_field_values.get(cf_name, ""))
-            
-            rows.append(row)
+
+        # ヘッダー行 (カスタムフィールド列を含む)
+        rows.append(plan.headers)
+
+        # testcases_root (testsuite または testcases 要素) の testcase を親テストスイートとともに取り出す
+        for testcase, suite in iter_element_testcases(testcases_root, testsuite_name):
+            if step_rows:
+                rows.extend(build_step_rows(testcase, suite, plan))
+            else:
+                rows.append(build_csv_row(testcase, suite, plan))
 
         # CSVファイル書き込み
-        with codecs.open(output_csv_file, 'w', 'shift_jis', errors='ignore') as f:
+        stats = encoding_io.EncodingStats()
+        with stage("write_csv"), encoding_io.open_text_writer(output_csv_file, encoding, stats) as f:
             writer = csv.writer(f, quoting=csv.QUOTE_ALL)
             writer.writerows(rows)
+        encoding_io.warn_if_lossy(stats, output_csv_file, encoding)
 
     except Exception as e:
         # ここで発生したエラーは呼び出し元 (main_app) に伝播させる
-        raise Exception(f"XMLからCSVへの変換処理中にエラーが発生しました: {str(e)}\n{traceback.format_exc()}")
\ No newline at end of file
+        raise Exception(f"XMLからCSVへの変換処理中にエラーが発生しました: {str(e)}\n{traceback.format_exc()}")
+
+def iter_element_testcases(testcases_root, testsuite_name=""):
+    """要素ツリーを1回走査し、(testcase要素, 親テストスイート) を文書の順に返す
+
+    親テストスイートは column_schema.SuitePath で、テストスイートに入るたびに1回だけ作る。
+    testsuite_name は testcases_root が testsuite の場合のその名前。
+    """
+    root_suite = column_schema.SuitePath.root(testsuite_name, column_schema.suite_node_order(testcases_root)) \
+        if testcases_root.tag == "testsuite" else column_schema.NO_SUITE
+    # 開いているテストスイートごとの [SuitePath, 子テストスイート数]
+    suites = [[root_suite, 0]]
+    # 走査中の要素の子要素のイテレーターと、その要素がテストスイートかどうか
+    stack = [(iter(testcases_root), False)]
+    while stack:
+        for elem in stack[-1][0]:
+            tag = elem.tag
+            if tag == "testcase":
+                yield elem, suites[-1][0]
+                continue
+            if tag == "testsuite":
+                parent = suites[-1]
+                parent[1] += 1
+                suites.append([parent[0].child(elem.get("name", ""), parent[1],
+                                               column_schema.suite_node_order(elem)), 0])
+                stack.append((iter(elem), True))
+                break
+            if len(elem):
+                stack.append((iter(elem), False))
+                break
+        else:
+            if stack.pop()[1]:
+                suites.pop()
+
+def iter_testcases(xml_source):
+    """XMLをインクリメンタルにパースし、(testcase要素, 親テストスイート) を1件ずつ返す
+
+    xml_source はファイルパスまたは read() を持つファイルライクオブジェクト。
+    親テストスイート (column_schema.SuitePath) は1回の走査の中でテストスイートのスタックから求めるため、
+    テストスイートがいくつあっても testcase ごとの処理は増えない。
+    返した testcase 要素は次の要素を取得した時点で破棄されるため、
+    呼び出し側はその場で必要なデータを取り出すこと。
+    """
+    stack = []
+    # 開いているテストスイートごとの [SuitePath, 子テストスイート数]
+    suites = [[column_schema.NO_SUITE, 0]]
+    for event, elem in ET.iterparse(xml_source, events=("start", "end")):
+        if event == "start":
+            if elem.tag == "testsuite":
+                if not stack:
+                    # ルートのテストスイート
+                    suites[-1][0] = column_schema.SuitePath.root(elem.get("name", ""))
+                else:
+                    parent = suites[-1]
+                    parent[1] += 1
+                    suites.append([parent[0].child(elem.get("name", ""), parent[1]), 0])
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        if elem.tag == "testcase":
+            yield elem, suites[-1][0]
+        elif elem.tag == "testsuite" and stack:
+            suites.pop()
+        elif elem.tag == "node_order" and stack and stack[-1].tag == "testsuite":
+            # テストスイートの <node_order> (最初の子要素の場合だけ使う) を順番に反映する
+            suites[-1][0].set_node_order(column_schema.suite_node_order(stack[-1]))
+        if stack and elem.tag in ("testcase", "testsuite"):
+            # 処理済みの要素を親から切り離してメモリを解放する
+            elem.clear()
+            stack[-1].remove(elem)
+
+@instrumented("stream_xml_to_csv")
+def stream_xml_to_csv(xml_source, output_csv_file, progress=None, plan=None, step_rows=None, cache=None,
+                      encoding=None):
+    """XMLをストリーミングで読み込み、testcase 1件ごとにCSV行を書き込む
+
+    convert_xml_to_csv と同じ内容のCSVを出力するが、XML全体や全行を
+    メモリに保持しないため巨大なエクスポートでもメモリ使用量が一定になる。
+    progress (progress.Progress) を渡すとテストケースごとに進捗を記録し、
+    キャンセルされていれば ConversionCancelled を送出する。
+    step_rows が真の場合 (None なら列定義の設定に従う) はステップごとに1行を出力する。
+    cache (result_cache.ResultCache) を渡すと、取り出した値が前回と同じ testcase は保存済みの行を使う。
+    encoding はCSVの文字コード (既定は shift_jis)。
+    """
+    encoding = encoding or encoding_io.DEFAULT_OUTPUT_ENCODING
+    plan = plan or DEFAULT_PLAN
+    if step_rows is None:
+        step_rows = plan.step_rows
+    context = result_cache.xml_to_csv_context(plan, step_rows) if cache is not None else None
+    try:
+        stats = encoding_io.EncodingStats()
+        with encoding_io.open_text_writer(output_csv_file, encoding, stats) as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow(plan.headers)
+            for testcase, suite in iter_testcases(xml_source):
+                if cache is not None:
+                    # HTML整形前の値をキーにして、整形済みの行を保存・再利用する
+                    if step_rows:
+                        case_row, step_values = plan.extract_steps(testcase, suite)
+                        key = result_cache.content_key([case_row, step_values], context)
+                    else:
+                        row = plan.extract(testcase, suite)
+                        key = result_cache.content_key(row, context)
+                    cached = cache.get(key)
+                    if cached is None:
+                        rows = (expand_step_rows(case_row, step_values, plan.step_layout) if step_rows
+                                else [clean_raw_row(row, plan.html_indices)])
+                        cache.put(key, json.dumps(rows, ensure_ascii=False))
+                    else:
+                        rows = json.loads(cached)
+                    with stage("write_csv"):
+                        writer.writerows(rows)
+                elif step_rows:
+                    rows = build_step_rows(testcase, suite, plan)
+                    with stage("write_csv"):
+                        writer.writerows(rows)
+                else:
+                    row = build_csv_row(testcase, suite, plan)
+                    with stage("write_csv"):
+                        writer.writerow(row)
+                if progress is not None:
+                    progress.advance()
+        encoding_io.warn_if_lossy(stats, output_csv_file, encoding)
+
+    except ConversionCancelled:
+        raise
+    except ET.ParseError as pe:
+        raise ValueError(f"XMLの解析に失敗しました: {pe}")
+    except Exception as e:
+        raise Exception(f"XMLからCSVへの変換処理中にエラーが発生しました: {str(e)}\n{traceback.format_exc()}")
+
+@instrumented("parallel_xml_to_csv")
+def parallel_xml_to_csv(xml_source, output_csv_file, workers=None, batch_size=DEFAULT_BATCH_SIZE, progress=None,
+                        plan=None, step_rows=None, encoding=None):
+    """XMLをストリーミングで読み込み、HTMLの整形をワーカープロセスに分散してCSVに書き込む
+
+    パースとデータの取り出しはこのプロセスで行い、batch_size 件ずつのHTML整形を
+    workers 個のワーカープロセスに渡す。結果は入力順に書き込むため、
+    出力は stream_xml_to_csv と同じになる。
+    """
+    workers = workers or os.cpu_count() or 1
+    encoding = encoding or encoding_io.DEFAULT_OUTPUT_ENCODING
+    plan = plan or DEFAULT_PLAN
+    if step_rows is None:
+        step_rows = plan.step_rows
+    if step_rows:
+        extract, clean, layout = plan.extract_steps, expand_step_cases, plan.step_layout
+    else:
+        extract, clean, layout = plan.extract, clean_raw_rows, plan.html_indices
+    try:
+        stats = encoding_io.EncodingStats()
+        with ProcessPoolExecutor(max_workers=workers) as executor, \
+                encoding_io.open_text_writer(output_csv_file, encoding, stats) as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow(plan.headers)
+
+            # 投入済みのバッチ (入力順)。溜まりすぎないよう上限を超えたら先頭から書き込む
+            pending = deque()
+            max_pending = workers * 2
+            batch = []
+            try:
+                for testcase, suite in iter_testcases(xml_source):
+                    batch.append(extract(testcase, suite))
+                    if progress is not None:
+                        progress.advance()
+                    if len(batch) >= batch_size:
+                        pending.append(executor.submit(clean, batch, layout))
+                        batch = []
+                        while len(pending) >= max_pending:
+                            writer.writerows(pending.popleft().result())
+                if batch:
+                    pending.append(executor.submit(clean, batch, layout))
+                while pending:
+                    writer.writerows(pending.popleft().result())
+            except BaseException:
+                # 中断した場合はまだ始まっていないバッチを取り消す
+                for future in pending:
+                    future.cancel()
+                raise
+        encoding_io.warn_if_lossy(stats, output_csv_file, encoding)
+
+    except ConversionCancelled:
+        raise
+    except ET.ParseError as pe:
+        raise ValueError(f"XMLの解析に失敗しました: {pe}")
+    except Exception as e:
+        raise Exception(f"XMLからCSVへの変換処理中にエラーが発生しました: {str(e)}\n{traceback.format_exc()}")
+
+@instrumented("stream_xml_to_sqlite")
+def stream_xml_to_sqlite(xml_source, output_db_file, progress=None, batch_size=sqlite_export.DEFAULT_BATCH_SIZE):
+    """XMLをストリーミングで読み込み、テストケース・ステップ・カスタムフィールドをSQLiteデータベースに書き込む
+
+    列定義に関係なく、すべての値とカスタムフィールドを正規化したテーブル (sqlite_export) に書き込む。
+    HTML列は stream_xml_to_csv と同じ規則でプレーンテキストにする。
+    batch_size 件ごとにまとめて挿入し、インデックスは最後に作る。
+    """
+    plan = sqlite_export.EXPORT_PLAN
+    case_html_indices = plan.step_layout[1]
+    step_html_positions = sqlite_export.STEP_HTML_POSITIONS
+    try:
+        with sqlite_export.SqliteExportWriter(output_db_file, batch_size) as writer:
+            for testcase, suite in iter_testcases(xml_source):
+                case_row, step_values = plan.extract_steps(testcase, suite)
+                clean_raw_row(case_row, case_html_indices)
+                for values in step_values:
+                    clean_raw_row(values, step_html_positions)
+                custom_fields = column_schema.custom_fields_of(testcase)
+                with stage("write_sqlite"):
+                    writer.write(case_row, step_values, suite, custom_fields)
+                if progress is not None:
+                    progress.advance()
+
+    except ConversionCancelled:
+        raise
+    except ET.ParseError as pe:
+        raise ValueError(f"XMLの解析に失敗しました: {pe}")
+    except Exception as e:
+        raise Exception(f"XMLからSQLiteへの変換処理中にエラーが発生しました: {str(e)}\n{traceback.format_exc()}")
+
+def discover_custom_field_names(xml_source, progress=None):
+    """XMLをストリーミングで1回走査し、カスタムフィールド名を出現順に重複なく返す
+
+    保持するのは名前の一覧だけなので、巨大なエクスポートでもメモリ使用量は一定。
+    """
+    names = {}
+    try:
+        for testcase, _ in iter_testcases(xml_source):
+            for name in column_schema.custom_field_names_of(testcase):
+                names.setdefault(name)
+            if progress is not None:
+                progress.advance()
+    except ET.ParseError as pe:
+        raise ValueError(f"XMLの解析に失敗しました: {pe}")
+    return list(names)
+
+@instrumented("convert_xml_file_to_csv")
+def convert_xml_file_to_csv(xml_file, output_csv_file, workers=1, batch_size=DEFAULT_BATCH_SIZE, progress=None,
+                            plan=None, discover_custom_fields=None, step_rows=None, cache=None, encoding=None):
+    """XMLファイルを二重CDATAを修正しながらストリーミングでCSVに変換する
+
+    workers が1より大きい (または None で CPU コア数) 場合はHTMLの整形を並列化する。
+    progress には読み込んだバイト数も記録する。
+    discover_custom_fields が真の場合 (None なら列定義の設定に従う)、先にXML全体を走査して
+    列定義にないカスタムフィールドも列に加える。
+    step_rows が真の場合 (None なら列定義の設定に従う) はステップごとに1行を出力する。
+    cache (result_cache.ResultCache) を渡すと変更のない testcase の変換を省略する。
+    変換するのは変更のあった testcase だけなので、この場合は workers に関係なく並列化しない。
+    encoding はCSVの文字コード (encoding_io.OUTPUT_ENCODINGS。既定は shift_jis)。
+    """
+    plan = plan or DEFAULT_PLAN
+    if discover_custom_fields is None:
+        discover_custom_fields = plan.discover_custom_fields
+    if discover_custom_fields:
+        with open(xml_file, 'r', encoding='utf-8') as f:
+            if progress is not None:
+                progress.track(f.buffer.tell, os.path.getsize(xml_file))
+            with stage("discover_custom_fields"):
+                plan = plan.with_custom_fields(discover_custom_field_names(DoubleCdataFixReader(f), progress))
+        if progress is not None:
+            progress.restart()
+
+    with open(xml_file, 'r', encoding='utf-8') as f:
+        if progress is not None:
+            progress.track(f.buffer.tell, os.path.getsize(xml_file))
+        source = DoubleCdataFixReader(f)
+        if workers == 1 or cache is not None:
+            stream_xml_to_csv(source, output_csv_file, progress, plan, step_rows, cache, encoding)
+        else:
+            parallel_xml_to_csv(source, output_csv_file, workers, batch_size, progress, plan, step_rows, encoding)
+
+@instrumented("convert_xml_file_to_sqlite")
+def convert_xml_file_to_sqlite(xml_file, output_db_file, progress=None, batch_size=sqlite_export.DEFAULT_BATCH_SIZE):
+    """XMLファイルを二重CDATAを修正しながらストリーミングでSQLiteデータベースに変換する (stream_xml_to_sqlite)"""
+    with open(xml_file, 'r', encoding='utf-8') as f:
+        if progress is not None:
+            progress.track(f.buffer.tell, os.path.getsize(xml_file))
+        stream_xml_to_sqlite(DoubleCdataFixReader(f), output_db_file, progress, batch_size)
@@ -1,44 +1,277 @@
+import hashlib
+import io
+import json
+import os
 import xml.sax.saxutils as saxutils
 
-def element_to_string(element, indent=""):
-    """ElementTreeの要素を整形された文字列に変換（特定のタグのみCDATA）"""
+from instrumentation import instrumented
+
+# CDATAで囲むべきタグ
+CDATA_TAGS = ('summary', 'preconditions', 'actions', 'expectedresults', 'details')
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+# str.splitlines() が行の区切りとして扱う文字
+_LINE_BREAKS = frozenset('\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029')
+
+def write_element(out, element, indent=""):
+    """ElementTreeの要素を整形してファイルライクオブジェクトに直接書き込む（特定のタグのみCDATA）"""
     tag = element.tag
     attrib_str = ""
     if element.attrib:
         attrib_str = " " + " ".join(f'{k}="{saxutils.escape(str(v))}"' for k, v in element.attrib.items())
 
-    result = f"{indent}<{tag}{attrib_str}"
     text_content = element.text
     has_children = len(element) > 0
 
-    if has_children or (text_content is not None and text_content.strip()):
-        result += ">"
-    else:
-         result += "></" + tag + ">" # 空要素 <tag></tag>
-         return result
-
-    # CDATAで囲むべきタグ
-    cdata_tags = ['summary', 'preconditions', 'actions', 'expectedresults', 'details']
-
-    if text_content is not None:
-        # テキストをエスケープするかCDATAで囲む
-        stripped_text = text_content # strip() しないで元のテキストを保持
-        if stripped_text:
-            if tag in cdata_tags:
-                # CDATA終了区切り文字のエスケープ
-                escaped_text = stripped_text.replace(']]>', ']]]]><![CDATA[>')
-                result += f"<![CDATA[{escaped_text}]]>"
-            else:
-                # 通常のテキストはXMLエスケープ
-                result += saxutils.escape(stripped_text)
+    if not has_children and not (text_content is not None and text_content.strip()):
+        out.write(f"{indent}<{tag}{attrib_str}></{tag}>") # 空要素 <tag></tag>
+        return
+
+    out.write(f"{indent}<{tag}{attrib_str}>")
+
+    if text_content:
+        # テキストをエスケープするかCDATAで囲む (strip() しないで元のテキストを保持)
+        if tag in CDATA_TAGS:
+            # CDATA終了区切り文字のエスケープ
+            escaped_text = text_content.replace(']]>', ']]]]><![CDATA[>')
+            out.write(f"<![CDATA[{escaped_text}]]>")
+        else:
+            # 通常のテキストはXMLエスケープ
+            out.write(saxutils.escape(text_content))
 
     if has_children:
-        result += "\n"
+        out.write("\n")
+        child_indent = indent + "\t"
         for child in element:
-            result += element_to_string(child, indent + "\t") + "\n"
-        result += f"{indent}</{tag}>"
-    elif text_content is not None and text_content.strip(): # テキストのみの場合
-        result += f"</{tag}>"
-    # 子要素もテキストもない場合は上で処理済み (<tag></tag>)
+            write_element(out, child, child_indent)
+            out.write("\n")
+        out.write(f"{indent}</{tag}>")
+    else: # テキストのみの場合
+        out.write(f"</{tag}>")
+
+@instrumented("element_to_string")
+def element_to_string(element, indent=""):
+    """ElementTreeの要素を整形された文字列に変換（特定のタグのみCDATA）"""
+    buffer = io.StringIO()
+    write_element(buffer, element, indent)
+    return buffer.getvalue()
+
+class BlankLineFilter:
+    """空白だけの行を取り除きながら書き込むラッパー
+
+    "\\n".join(line for line in text.splitlines() if line.strip()) と同じ結果を
+    テキスト全体を保持せずに出力する。最後に close() を呼ぶこと。
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self._pending = ""   # 改行がまだ来ていない行
+        self._started = False
+
+    def write(self, text):
+        data = self._pending + text
+        if not data:
+            return
+        lines = data.splitlines()
+        if data[-1] in _LINE_BREAKS:
+            self._pending = ""
+        else:
+            self._pending = lines.pop()
+        self._write_lines(lines)
+
+    def close(self):
+        """保留中の最後の行を書き出す"""
+        if self._pending:
+            self._write_lines([self._pending])
+            self._pending = ""
+
+    def _write_lines(self, lines):
+        kept = [line for line in lines if line.strip()]
+        if not kept:
+            return
+        if self._started:
+            self.out.write("\n")
+        self.out.write("\n".join(kept))
+        self._started = True
+
+class XmlDocumentWriter:
+    """ルート要素の子要素を1つずつファイルへ書き出す
+
+    ルート要素全体を element_to_string で文字列化し、空行を除いて書き込むのと
+    同じ内容を、子要素1つ分のメモリで出力する。
+    """
+
+    def __init__(self, out, root_tag="testcases"):
+        self.out = BlankLineFilter(out)
+        self.root_tag = root_tag
+        self.count = 0
+        self.out.write(XML_DECLARATION)
+
+    @instrumented("write_xml_element")
+    def write(self, element):
+        """ルート直下の子要素を1つ書き込む"""
+        self.write_rendered(self.render(element))
+
+    @staticmethod
+    def render(element):
+        """ルート直下の子要素を write と同じ形式の文字列にする (空行は書き込み時に取り除く)"""
+        buffer = io.StringIO()
+        write_element(buffer, element, "\t")
+        buffer.write("\n")
+        return buffer.getvalue()
+
+    def write_rendered(self, text, case_id=None):
+        """render で文字列にした子要素を書き込む (case_id は ShardedXmlWriter と呼び出し方を揃えるためのもの)"""
+        if self.count == 0:
+            self.out.write(f"<{self.root_tag}>\n")
+        self.out.write(text)
+        self.count += 1
+
+    def close(self):
+        """ルート要素を閉じて残りを書き出す"""
+        if self.count == 0:
+            self.out.write(f"<{self.root_tag}></{self.root_tag}>")
+        else:
+            self.out.write(f"</{self.root_tag}>")
+        self.out.close()
+
+class ShardedXmlWriter:
+    """ルート直下の子要素を、上限サイズ・上限件数ごとに別々のXMLファイルへ書き出す
+
+    各ファイル (<出力名>_001.xml, _002.xml, ...) は XmlDocumentWriter で書いた完全な文書で、
+    子要素が2つのファイルに分かれることはない。1つで上限サイズを超える子要素は単独のファイルにする。
+    各ファイルはまず一時ファイル (<ファイル名>.tmp) に書き、close() でマニフェストとともに本来の名前に置き換える。
+    マニフェスト <出力名>_manifest.json には各ファイルの子要素ID・バイト数・SHA-256 を書き込む。
+    with 文の中で例外が発生した場合は、この writer が作った一時ファイルだけを削除する (以前の出力は残る)。
+    """
+
+    def __init__(self, output_file, max_bytes=None, max_count=None, root_tag="testcases", buffering=-1, warn=print):
+        self.base, ext = os.path.splitext(output_file)
+        self.ext = ext or ".xml"
+        self.manifest_file = self.base + "_manifest.json"
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        self.root_tag = root_tag
+        self.buffering = buffering
+        self.warn = warn        # 警告の出力先
+        self.shards = []        # 書き終えたファイルのマニフェスト項目
+        self._file = None
+        self._writer = None
+        self._ids = []
+        self._size = 0          # 書き込み中のファイルの推定バイト数 (空行の除去前なので実際以上)
+        # 宣言・ルート要素の開始と終了タグの分のバイト数
+        self._overhead = len(f"{XML_DECLARATION}<{root_tag}>\n</{root_tag}>".encode("utf-8"))
+        self._newline_extra = len(os.linesep) - 1   # テキストモードでの改行の変換による増分
+
+    def shard_path(self, number):
+        """number 番目 (1から) のファイルのパス"""
+        return f"{self.base}_{number:03d}{self.ext}"
+
+    def _temp_path(self, number):
+        """number 番目のファイルを書き込む一時ファイルのパス"""
+        return self.shard_path(number) + ".tmp"
+
+    render = staticmethod(XmlDocumentWriter.render)
+
+    def write(self, element, case_id=None):
+        """ルート直下の子要素を1つ書き込む"""
+        self.write_rendered(self.render(element), case_id)
+
+    def write_rendered(self, text, case_id=None):
+        """render で文字列にした子要素を書き込む (case_id はマニフェストに記録するID)"""
+        size = len(text.encode("utf-8")) + self._newline_extra * text.count("\n")
+        if self._writer is not None and self._ids and (
+                (self.max_count and len(self._ids) >= self.max_count) or
+                (self.max_bytes and self._size + size > self.max_bytes)):
+            self._close_shard()
+        if self._writer is None:
+            self._open_shard()
+        if self.max_bytes and self._size + size > self.max_bytes:
+            self.warn(f"警告: {case_id or '子要素'} だけで上限サイズ ({self.max_bytes}バイト) を超えるため、"
+                      f"単独で {self.shard_path(len(self.shards) + 1)} に書き込みます")
+        self._writer.write_rendered(text)
+        self._size += size
+        self._ids.append(case_id)
+
+    def _open_shard(self):
+        self._file = open(self._temp_path(len(self.shards) + 1), 'w', encoding='utf-8', buffering=self.buffering)
+        self._writer = XmlDocumentWriter(self._file, self.root_tag)
+        self._ids = []
+        self._size = self._overhead
+
+    def _close_shard(self):
+        self._writer.close()
+        self._file.close()
+        number = len(self.shards) + 1
+        path = self._temp_path(number)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        self.shards.append({
+            "file": os.path.basename(self.shard_path(number)),
+            "count": len(self._ids),
+            "bytes": os.path.getsize(path),
+            "sha256": digest.hexdigest(),
+            "ids": self._ids,
+        })
+        self._file = None
+        self._writer = None
+
+    def close(self):
+        """最後のファイルを閉じ、一時ファイルとマニフェストを本来の名前に置き換えて、以前の実行で残った余分なファイルを削除する
+
+        子要素が1つもない場合も、空のルート要素だけのファイルを1つ作る。
+        すべてのファイルとマニフェストを書き終えるまで以前の実行の出力には触れず、マニフェストは最後に置き換える。
+        """
+        manifest_temp = self.manifest_file + ".tmp"
+        try:
+            if self._writer is None and not self.shards:
+                self._open_shard()
+            if self._writer is not None:
+                self._close_shard()
+            manifest = {
+                "max_bytes": self.max_bytes,
+                "max_count": self.max_count,
+                "total": sum(shard["count"] for shard in self.shards),
+                "shards": self.shards,
+            }
+            with open(manifest_temp, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+        except BaseException:
+            if os.path.exists(manifest_temp):
+                os.remove(manifest_temp)
+            self.abort()
+            raise
+        for number in range(1, len(self.shards) + 1):
+            os.replace(self._temp_path(number), self.shard_path(number))
+        number = len(self.shards) + 1
+        while os.path.exists(self.shard_path(number)):
+            os.remove(self.shard_path(number))
+            number += 1
+        os.replace(manifest_temp, self.manifest_file)
+        return manifest
+
+    def abort(self):
+        """書き込みを中止し、この writer が作った一時ファイルを削除する (以前の実行の出力には触れない)"""
+        written = len(self.shards)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+            written += 1    # 書きかけのファイル
+        for number in range(1, written + 1):
+            if os.path.exists(self._temp_path(number)):
+                os.remove(self._temp_path(number))
+        self.shards = []
+
+    def __enter__(self):
+        return self
 
-    return result
\ No newline at end of file
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False